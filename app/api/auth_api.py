@@ -1,18 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from uuid import UUID
 
-from app.db import get_db
+from app.db import get_async_db
 from app.schemas.auth_model import (
     UserCreate, UserUpdate, UserResponse, UserDetailResponse,
     LoginRequest, LoginResponse, RegisterResponse, 
     PasswordChangeRequest, MessageResponse
 )
 from app.services.auth_service import (
-    register_user, login_user, get_current_user as get_user_from_token,
-    update_user, change_password, get_user_by_id
+    register_user_async, login_user_async, get_current_user_async as get_user_from_token,
+    get_current_user_id_async, update_user_async, change_password_async, get_user_by_id_async
 )
 
 router = APIRouter(prefix="/auth", tags=["认证"])
@@ -22,11 +22,11 @@ security = HTTPBearer()
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取当前认证用户"""
     token = credentials.credentials
-    user = get_user_from_token(db, token)
+    user = await get_user_from_token(db, token)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -35,8 +35,21 @@ async def get_current_user(
         )
     return user
 
+async def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> UUID:
+    """获取当前认证用户的ID，只校验令牌、不查询数据库，供只需要 user_id 的端点使用"""
+    user_id = await get_current_user_id_async(credentials.credentials)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效的认证令牌",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
+
 @router.post("/register", response_model=RegisterResponse, summary="用户注册")
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     用户注册
     
@@ -45,12 +58,12 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     - **password**: 密码（6-100个字符）
     """
     try:
-        return register_user(db, user)
+        return await register_user_async(db, user)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/login", response_model=LoginResponse, summary="用户登录")
-async def login(login_request: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """
     用户登录
     
@@ -60,7 +73,7 @@ async def login(login_request: LoginRequest, db: Session = Depends(get_db)):
     返回用户信息和访问令牌
     """
     try:
-        return login_user(db, login_request)
+        return await login_user_async(db, login_request)
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
 
@@ -96,7 +109,7 @@ async def get_current_user_detail(current_user = Depends(get_current_user)):
 async def update_current_user(
     user_update: UserUpdate,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     更新当前用户信息
@@ -108,7 +121,7 @@ async def update_current_user(
     需要提供有效的Bearer token
     """
     try:
-        updated_user = update_user(db, current_user.user_id, user_update)
+        updated_user = await update_user_async(db, current_user.user_id, user_update)
         if not updated_user:
             raise HTTPException(status_code=404, detail="用户不存在")
         
@@ -124,7 +137,7 @@ async def update_current_user(
 async def change_password_endpoint(
     password_change: PasswordChangeRequest,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     修改当前用户密码
@@ -134,7 +147,7 @@ async def change_password_endpoint(
     
     需要提供有效的Bearer token
     """
-    success = change_password(db, current_user.user_id, password_change)
+    success = await change_password_async(db, current_user.user_id, password_change)
     if not success:
         raise HTTPException(status_code=400, detail="原密码错误")
     
@@ -143,7 +156,7 @@ async def change_password_endpoint(
 @router.get("/user/{user_id}", response_model=UserResponse, summary="根据ID获取用户信息")
 async def get_user_by_id_endpoint(
     user_id: UUID, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)  # 需要认证才能查看其他用户
 ):
     """
@@ -151,7 +164,7 @@ async def get_user_by_id_endpoint(
     
     需要提供有效的Bearer token
     """
-    user = get_user_by_id(db, user_id)
+    user = await get_user_by_id_async(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
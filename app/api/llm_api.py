@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
+from uuid import UUID
 
-from app.schemas.llm_model import LLMRequest, LLMResponse, LLMHealthResponse
-from app.services.llm_service import llm_service
-from app.api.auth_api import get_current_user
-from app.models import User
+from app.schemas.llm_model import LLMRequest, LLMResponse, LLMHealthResponse, LLMJobResponse
+from app.services.llm_service import chat_async, chat_stream_async, trace_payload, LLMChatCancelled, LLMChatTimeout
+from app.services.intent_service import try_fast_path
+from app.services import llm_job_service
+from app.core.concurrency import ConcurrencyLimitExceeded
+from app.db import get_async_db
+from app.api.auth_api import get_current_user_id
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/llm", tags=["LLM聊天"])
 
 @router.post("/chat", response_model=LLMResponse, summary="LLM聊天")
 async def chat_with_llm(
     request: LLMRequest,
-    current_user: User = Depends(get_current_user)
+    http_request: Request,
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     与LLM聊天，支持拍摄计划管理
@@ -25,31 +37,133 @@ async def chat_with_llm(
     - 查询天气信息
     - 获取当前时间
     
+    查看计划、询问时间的简单请求直接回复，不经过LLM；
+    其余对话在独立线程池中执行；并发超限时返回429/503（带 Retry-After），
+    超时返回 success=false，客户端断开后对话会被取消。
+    debug 为 true 时 trace 返回各轮LLM请求的耗时和token数、各次工具调用的耗时和结果大小
+    
     需要提供有效的Bearer token
     """
+    # 使用当前用户的ID而不是请求中的user_id，确保安全性
+    user_id = str(current_user_id)
+    trace = []
     try:
-        # 使用当前用户的ID而不是请求中的user_id，确保安全性
-        user_id = str(current_user.user_id)
-        
-        # 调用LLM服务
-        response = llm_service(user_id, request.query)
+        # 简单请求直接回复，否则调用LLM服务
+        response = await try_fast_path(db, current_user_id, request.query)
+        if response is None:
+            response = await chat_async(user_id, request.query, is_disconnected=http_request.is_disconnected, trace=trace)
         
         return LLMResponse(
             response=response,
             success=True,
-            message="请求处理成功"
+            message="请求处理成功",
+            trace=trace_payload(trace) if request.debug else None
         )
         
-    except Exception as e:
-        # 记录错误日志
-        print(f"LLM服务错误: {str(e)}")
-        
+    except ConcurrencyLimitExceeded:
+        # 交给全局异常处理器返回429/503
+        raise
+    except LLMChatTimeout as e:
+        logger.warning(f"LLM对话超时: 用户 {user_id}, {str(e)}")
+        return LLMResponse(
+            response="抱歉，处理您的请求超时了，请稍后重试。",
+            success=False,
+            message="请求超时",
+            # 超时前已完成的LLM请求和工具调用，用于查看时间花在了哪里
+            trace=trace_payload(trace) if request.debug else None
+        )
+    except LLMChatCancelled:
+        # 客户端已断开，响应不会被读取
+        logger.info(f"客户端断开，已取消用户 {user_id} 的LLM对话")
+        return LLMResponse(response="", success=False, message="请求已取消")
+    except Exception:
+        # 详细错误只写入日志，不返回给客户端
+        logger.exception(f"LLM服务错误: 用户 {user_id}")
         return LLMResponse(
             response="抱歉，处理您的请求时发生了错误，请稍后重试。",
             success=False,
-            message=f"服务错误: {str(e)}"
+            message="服务错误"
         )
 
+async def _reply_events(reply: str, debug: bool):
+    """快速路径的回复按流式接口的事件格式返回"""
+    yield "start", {}
+    yield "done", {"response": reply, "trace": trace_payload([])} if debug else {"response": reply}
+
+@router.post("/chat/stream", summary="LLM聊天（流式）")
+async def chat_with_llm_stream(
+    request: LLMRequest,
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    与LLM聊天，以 Server-Sent Events 流式返回
+
+    事件类型：
+    - **start**: 对话已开始
+    - **tool_start** / **tool_end**: 工具调用开始/结束，如"正在查询地点"
+    - **token**: 回复的文本片段
+    - **done**: 对话完成，response 为完整回复
+    - **error**: 对话失败或超时
+
+    并发超限时直接返回429/503（带 Retry-After）；断开连接会取消对话。
+    简单请求不经过LLM，只返回 start 和 done 两个事件。debug 为 true 时 done 事件附带 trace
+
+    需要提供有效的Bearer token
+    """
+    reply = await try_fast_path(db, current_user_id, request.query)
+    if reply is not None:
+        events = _reply_events(reply, request.debug)
+    else:
+        events = await chat_stream_async(str(current_user_id), request.query, debug=request.debug)
+
+    async def body():
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # 禁止缓存和反向代理缓冲，事件才能即时到达客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/jobs", response_model=LLMJobResponse, status_code=status.HTTP_202_ACCEPTED, summary="提交LLM对话任务")
+async def create_chat_job(
+    request: LLMRequest,
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    提交后台执行的LLM对话任务，立即返回任务ID（状态为 pending）
+
+    适合需要搜索、读取网页、修改多个计划的长对话，不受HTTP请求超时限制；
+    通过 GET /llm/jobs/{job_id} 查询结果。未完成的任务过多时返回429
+
+    需要提供有效的Bearer token
+    """
+    return await llm_job_service.create_job_async(db, current_user_id, request.query)
+
+@router.get("/jobs/{job_id}", response_model=LLMJobResponse, summary="查询LLM对话任务")
+async def get_chat_job(
+    job_id: UUID,
+    wait: float = Query(0, ge=0, le=30, description="任务未完成时最多等待的秒数（长轮询），0 表示立即返回"),
+    current_user_id: UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    查询LLM对话任务的状态和结果
+
+    - **status**: pending（排队中）、running（执行中）、succeeded（成功，response 为回复）、failed（失败，error 为原因）
+    - **trace**: 对话追踪记录：各轮LLM请求的耗时和token数，各次工具调用的耗时、结果大小和错误
+
+    只能查询自己提交的任务，需要提供有效的Bearer token
+    """
+    job = await llm_job_service.wait_job_async(db, job_id, current_user_id, wait)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在")
+    return job
+
 @router.get("/health", response_model=LLMHealthResponse, summary="检查LLM服务状态")
 async def check_llm_health():
     """
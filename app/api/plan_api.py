@@ -1,52 +1,243 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
-from app.schemas.plan_model import Plan, PlanCreate, PlanUpdate
+from pydantic import TypeAdapter
+from app.schemas.plan_model import (
+    Plan, PlanCreate, PlanUpdate, PlanSummary, PlanWithStatus, PlanNearby, PlanClusters,
+    PlanBulkCreate, PlanBulkUpdate, PlanBulkDelete, PlanBulkResult,
+)
 from app.services import plan_service
-from app.db import get_db
-from app.api.auth_api import get_current_user
+from app.core.etag import etag_matches
+from app.db import get_async_db
+from app.api.auth_api import get_current_user, get_current_user_id
 from app.models import User
 
 router = APIRouter(prefix="/plans", tags=["拍摄计划"])
 
+PlanView = Literal["full", "summary"]
+
+_plan_summaries = TypeAdapter(List[PlanSummary])
+_plan_nearby = TypeAdapter(List[PlanNearby])
+
+def _parse_bbox(bbox: str) -> plan_service.BBox:
+    """解析 "最小经度,最小纬度,最大经度,最大纬度"，格式或范围不正确时返回400"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bbox 格式应为 最小经度,最小纬度,最大经度,最大纬度"
+        )
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox 超出经纬度范围")
+    return min_lon, min_lat, max_lon, max_lat
+
+async def _list_plans_response(
+    response: Response,
+    db: AsyncSession,
+    user_id: Optional[UUID],
+    skip: int,
+    limit: int,
+    cursor: Optional[str],
+    view: PlanView,
+    expired: Optional[bool] = None,
+    if_none_match: Optional[str] = None,
+):
+    """
+    按游标取一页计划，游标无效时返回400
+
+    先取列表版本计算ETag（按用户缓存，计划变化或过期后才重新聚合），If-None-Match 命中时直接返回304，不再查询这一页；
+    摘要视图直接序列化为JSON响应，跳过 response_model 的逐条校验
+    """
+    version = await plan_service.get_plans_version_async(db, user_id)
+    etag = plan_service.plans_list_etag(
+        version, user_id=user_id, skip=skip, limit=limit, cursor=cursor, view=view, expired=expired
+    )
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    try:
+        plans, next_cursor = await plan_service.get_plans_page_async(
+            db, user_id=user_id, skip=skip, limit=limit, cursor=cursor, summary=(view == "summary"), expired=expired
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if view == "summary":
+        response = Response(content=_plan_summaries.dump_json(plans), media_type="application/json")
+
+    response.headers["ETag"] = etag
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response if view == "summary" else plans
+
+@router.get("/upcoming", response_model=List[PlanWithStatus], summary="获取时间窗口内的拍摄计划")
+async def get_upcoming_plans(
+    response: Response,
+    start_from: Optional[datetime] = Query(None, alias="from", description="窗口开始时间，默认为当前时间"),
+    start_to: Optional[datetime] = Query(None, alias="to", description="窗口结束时间（不含），默认为开始时间之后48小时"),
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    expired: Optional[bool] = Query(None, description="true 只返回已过期的计划，false 只返回未过期的计划"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    获取当前用户开始时间在 [from, to) 内的拍摄计划
+    
+    按开始时间排序，每条附带数据库计算的 is_expired；分页方式同 GET /plans/
+    """
+    try:
+        plans, next_cursor = await plan_service.get_upcoming_plans_async(
+            db, current_user_id, start_from, start_to, limit, cursor, expired
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return plans
+
+@router.get("/nearby", response_model=List[PlanNearby], summary="获取附近的拍摄计划")
+async def get_nearby_plans(
+    lon: float = Query(..., ge=-180, le=180, description="经度"),
+    lat: float = Query(..., ge=-90, le=90, description="纬度"),
+    radius: float = Query(1000, gt=0, le=1_000_000, description="半径（米）"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    获取当前用户在指定点半径范围内的拍摄计划
+    
+    按距离由近到远排序，返回摘要字段和距离（米）
+    """
+    plans = await plan_service.get_nearby_plans_async(db, current_user_id, lon, lat, radius, limit)
+    return Response(content=_plan_nearby.dump_json(plans), media_type="application/json")
+
+@router.get("/within", response_model=List[PlanSummary], summary="获取矩形范围内的拍摄计划")
+async def get_plans_within(
+    bbox: str = Query(..., description="最小经度,最小纬度,最大经度,最大纬度；最小经度大于最大经度表示跨越180度经线"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    获取当前用户在经纬度矩形范围内的拍摄计划，用于地图视图
+    
+    按开始时间排序，返回摘要字段
+    """
+    plans = await plan_service.get_plans_in_bbox_async(db, current_user_id, _parse_bbox(bbox), limit)
+    return Response(content=_plan_summaries.dump_json(plans), media_type="application/json")
+
+@router.get("/clusters", response_model=PlanClusters, summary="获取地图聚合的拍摄计划")
+async def get_plan_clusters(
+    bbox: str = Query(..., description="最小经度,最小纬度,最大经度,最大纬度"),
+    zoom: int = Query(..., ge=0, le=22, description="地图缩放级别"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    按地图缩放级别把当前用户在 bbox 内的计划聚合为网格簇
+    
+    每个簇返回计划数量、平均位置和最早开始的几个计划ID；
+    网格大小随缩放级别变化，并随 bbox 放大，返回的簇数量有上限，与计划总数无关
+    """
+    return await plan_service.get_plan_clusters_async(db, current_user_id, _parse_bbox(bbox), zoom)
+
+@router.post("/bulk", response_model=PlanBulkResult, summary="批量创建拍摄计划")
+async def create_plans_bulk(
+    body: PlanBulkCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    批量创建拍摄计划
+    
+    所有计划关联到当前用户，通过校验的条目在同一事务内一次写入；
+    开始时间为过去时间的条目不会写入，错误信息按请求中的位置在 results 中返回
+    """
+    return await plan_service.create_plans_bulk_async(db, body.items, current_user_id)
+
+@router.patch("/bulk", response_model=PlanBulkResult, summary="批量更新拍摄计划")
+async def update_plans_bulk(
+    body: PlanBulkUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    批量更新拍摄计划
+    
+    每条需包含计划 id 和要修改的字段，只能更新当前用户创建的计划；
+    不存在、无权访问或校验失败的条目在 results 中单独报错，其余在同一事务内更新
+    """
+    return await plan_service.update_plans_bulk_async(db, body.items, current_user_id)
+
+@router.delete("/bulk", response_model=PlanBulkResult, summary="批量删除拍摄计划")
+async def delete_plans_bulk(
+    body: PlanBulkDelete,
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
+):
+    """
+    批量删除拍摄计划
+    
+    只删除当前用户创建的计划，不存在或无权访问的ID在 results 中单独报错
+    """
+    return await plan_service.delete_plans_bulk_async(db, body.ids, current_user_id)
+
 @router.get("/{plan_id}", response_model=Plan, summary="获取指定拍摄计划")
-def get_plan(
+async def get_plan(
     plan_id: UUID, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
 ):
     """
     获取指定ID的拍摄计划
     
-    只能获取当前用户创建的计划
+    只能获取当前用户创建的计划。响应带 ETag，请求头 If-None-Match 与当前 ETag 一致时返回304
     """
-    plan = plan_service.get_plan(db, plan_id, current_user.user_id)
-    if plan is None:
+    plan, etag = await plan_service.get_plan_if_modified_async(db, plan_id, current_user_id, if_none_match)
+    if etag is None:
         raise HTTPException(status_code=404, detail="计划未找到或无权访问")
+    if plan is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return plan
 
 @router.get("/", response_model=List[Plan], summary="获取拍摄计划列表")
-def get_plans(
+async def get_plans(
+    response: Response,
     skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    limit: int = Query(100, ge=1), 
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    view: PlanView = Query("full", description="summary 只返回 id、name、start_time、position"),
+    expired: Optional[bool] = Query(None, description="true 只返回已过期的计划，false 只返回未过期的计划"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
 ):
     """
     获取当前用户的拍摄计划列表
     
-    支持分页，只返回当前用户创建的计划
+    按开始时间排序，只返回当前用户创建的计划。
+    推荐使用游标分页：下一页的游标在响应头 X-Next-Cursor 中，作为 cursor 参数传回即可；
+    没有该响应头表示已经是最后一页。skip 仅为兼容保留。
+    地图/列表页面可使用 view=summary，只查询和返回摘要字段；expired 按是否过期筛选。
+    响应带 ETag，请求头 If-None-Match 与当前 ETag 一致时返回304。
     """
-    plans = plan_service.get_plans(db, user_id=current_user.user_id, skip=skip, limit=limit)
-    return plans
+    return await _list_plans_response(response, db, current_user_id, skip, limit, cursor, view, expired, if_none_match)
 
 @router.post("/", response_model=Plan, status_code=status.HTTP_201_CREATED, summary="创建拍摄计划")
-def create_plan(
+async def create_plan(
     plan: PlanCreate, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
 ):
     """
     创建新的拍摄计划
@@ -54,10 +245,10 @@ def create_plan(
     计划将自动关联到当前用户，开始时间不能是过去的时间
     """
     # 确保计划关联到当前用户
-    plan.user_id = current_user.user_id
+    plan.user_id = current_user_id
     
     try:
-        return plan_service.create_plan(db=db, plan=plan)
+        return await plan_service.create_plan_async(db=db, plan=plan)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
@@ -65,48 +256,61 @@ def create_plan(
         )
 
 @router.patch("/{plan_id}", response_model=Plan, summary="更新拍摄计划")
-def update_plan(
+async def update_plan(
     plan_id: UUID, 
     plan: PlanUpdate, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
 ):
     """
     更新指定ID的拍摄计划
     
-    只能更新当前用户创建的计划，如果更新开始时间，不能设置为过去的时间
+    只能更新当前用户创建的计划，如果更新开始时间，不能设置为过去的时间。
+    请求头 If-Match 带上之前获取的 ETag 时，只有计划未被他人修改才会更新，否则返回412
     """
+    versions = None
+    if if_match and if_match.strip() != "*":
+        versions = plan_service.plan_etag_versions(if_match)
+        if not versions:
+            raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="If-Match 不是有效的计划ETag")
+    
     try:
-        updated_plan = plan_service.update_plan(
+        updated_plan = await plan_service.update_plan_async(
             db=db, 
             plan_id=plan_id, 
             plan=plan, 
-            user_id=current_user.user_id
+            user_id=current_user_id,
+            versions=versions
         )
-        if updated_plan is None:
-            raise HTTPException(status_code=404, detail="计划未找到或无权访问")
-        return updated_plan
+    except plan_service.PlanVersionMismatch as e:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(e))
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=str(e)
         )
+    if updated_plan is None:
+        raise HTTPException(status_code=404, detail="计划未找到或无权访问")
+    response.headers["ETag"] = plan_service.plan_etag(updated_plan.updated_at)
+    return updated_plan
 
 @router.delete("/{plan_id}", status_code=status.HTTP_204_NO_CONTENT, summary="删除拍摄计划")
-def delete_plan(
+async def delete_plan(
     plan_id: UUID, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: UUID = Depends(get_current_user_id)
 ):
     """
     删除指定ID的拍摄计划
     
     只能删除当前用户创建的计划
     """
-    deleted = plan_service.delete_plan(
+    deleted = await plan_service.delete_plan_async(
         db=db, 
         plan_id=plan_id, 
-        user_id=current_user.user_id
+        user_id=current_user_id
     )
     if not deleted:
         raise HTTPException(status_code=404, detail="计划未找到或无权访问")
@@ -114,22 +318,26 @@ def delete_plan(
 
 # 管理员专用端点：获取所有用户的计划（可选实现）
 @router.get("/admin/all", response_model=List[Plan], summary="管理员获取所有计划")
-def get_all_plans(
+async def get_all_plans(
+    response: Response,
     user_id: Optional[UUID] = None,
     skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
+    limit: int = Query(100, ge=1), 
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    view: PlanView = Query("full", description="summary 只返回 id、name、start_time、position"),
+    expired: Optional[bool] = Query(None, description="true 只返回已过期的计划，false 只返回未过期的计划"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     管理员专用：获取所有用户的计划列表
     
-    可以通过user_id筛选特定用户的计划
+    可以通过user_id筛选特定用户的计划，分页方式与 view 参数同 GET /plans/
     注意：此端点需要管理员权限（暂未实现权限检查）
     """
     # TODO: 添加管理员权限检查
     # if not current_user.is_admin:
     #     raise HTTPException(status_code=403, detail="需要管理员权限")
     
-    plans = plan_service.get_plans(db, user_id=user_id, skip=skip, limit=limit)
-    return plans 
\ No newline at end of file
+    return await _list_plans_response(response, db, user_id, skip, limit, cursor, view, expired, if_none_match) 
@@ -0,0 +1,328 @@
+"""
+缓存
+
+- LRUCache  : 进程内 LRU + TTL 缓存，线程安全，单个 worker 内有效
+- RedisCache: Redis 共享缓存（任何兼容 Redis 协议的服务均可），多个 uvicorn worker 共用，
+              写入时的失效对所有 worker 立即生效；需要额外安装 redis 包
+- SQLiteCache: 本地 SQLite 文件缓存，重启后仍然有效，值需可 JSON 序列化
+- TieredCache: 进程内 LRU + SQLite 两级缓存，先查内存，未命中再查磁盘并回填内存
+
+以上缓存接口相同（同步 get/set/delete 与异步 aget/aset/adelete），LRUCache 和 RedisCache 由 create_cache 按配置创建。
+命中、未命中和淘汰次数记录在指标注册表中，由 /metrics 导出。
+"""
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CACHE_HITS = registry.counter("cache_hits_total", "缓存命中次数", ["cache"])
+CACHE_MISSES = registry.counter("cache_misses_total", "缓存未命中次数", ["cache"])
+CACHE_EVICTIONS = registry.counter("cache_evictions_total", "缓存淘汰次数，reason 为 lru（容量）或 expired（过期）", ["cache", "reason"])
+CACHE_ENTRIES = registry.gauge("cache_entries", "进程内缓存当前的条目数", ["cache"])
+
+
+class LRUCache:
+    """线程安全的进程内 LRU + TTL 缓存"""
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        CACHE_ENTRIES.set_function(lambda: {(self.name,): len(self._data)})
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] <= now:
+                del self._data[key]
+                CACHE_EVICTIONS.inc(cache=self.name, reason="expired")
+                item = None
+            if item is None:
+                CACHE_MISSES.inc(cache=self.name)
+                return default
+            self._data.move_to_end(key)
+        CACHE_HITS.inc(cache=self.name)
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                CACHE_EVICTIONS.inc(cache=self.name, reason="lru")
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    # 进程内缓存没有IO，异步接口直接调用同步实现
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        return self.get(key, default)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(key, value, ttl)
+
+    async def adelete(self, key: Hashable) -> None:
+        self.delete(key)
+
+
+class RedisCache:
+    """
+    Redis 共享缓存
+
+    值经 dumps/loads 序列化，过期交给 Redis 的 EX 处理。Redis 不可用时读取按未命中处理、
+    写入和失效只记录日志，不影响请求本身；此时数据最多旧 ttl 秒。
+    """
+
+    def __init__(self, name: str, url: str, ttl: float = 300.0,
+                 dumps: Callable[[Any], str] = str, loads: Callable[[bytes], Any] = bytes.decode):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("使用 redis 缓存后端需要安装 redis 包: pip install redis")
+        self.name = name
+        self.ttl = ttl
+        self._dumps = dumps
+        self._loads = loads
+        self._errors = redis.RedisError
+        self._client = redis.Redis.from_url(url)
+        self._aclient = redis.asyncio.Redis.from_url(url)
+
+    def _key(self, key: Hashable) -> str:
+        parts = key if isinstance(key, tuple) else (key,)
+        return ":".join(("dreamcatcher", self.name, *map(str, parts)))
+
+    def _ex(self, ttl: Optional[float]) -> int:
+        return max(1, int(self.ttl if ttl is None else ttl))
+
+    def _decode(self, raw: Optional[bytes], default: Any) -> Any:
+        if raw is None:
+            CACHE_MISSES.inc(cache=self.name)
+            return default
+        CACHE_HITS.inc(cache=self.name)
+        return self._loads(raw)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            raw = self._client.get(self._key(key))
+        except self._errors as e:
+            logger.warning(f"读取缓存 {self.name} 失败: {str(e)}")
+            raw = None
+        return self._decode(raw, default)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        try:
+            self._client.set(self._key(key), self._dumps(value), ex=self._ex(ttl))
+        except self._errors as e:
+            logger.warning(f"写入缓存 {self.name} 失败: {str(e)}")
+
+    def delete(self, key: Hashable) -> None:
+        try:
+            self._client.delete(self._key(key))
+        except self._errors as e:
+            logger.error(f"缓存 {self.name} 失效失败，数据最多旧 {self.ttl} 秒: {str(e)}")
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            raw = await self._aclient.get(self._key(key))
+        except self._errors as e:
+            logger.warning(f"读取缓存 {self.name} 失败: {str(e)}")
+            raw = None
+        return self._decode(raw, default)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        try:
+            await self._aclient.set(self._key(key), self._dumps(value), ex=self._ex(ttl))
+        except self._errors as e:
+            logger.warning(f"写入缓存 {self.name} 失败: {str(e)}")
+
+    async def adelete(self, key: Hashable) -> None:
+        try:
+            await self._aclient.delete(self._key(key))
+        except self._errors as e:
+            logger.error(f"缓存 {self.name} 失效失败，数据最多旧 {self.ttl} 秒: {str(e)}")
+
+
+_MISSING = object()
+
+
+class SQLiteCache:
+    """
+    SQLite 文件缓存
+
+    过期时间按墙上时间保存，重启后仍然有效。写入时每隔一段时间清理过期条目，
+    超过 maxsize 时删除最早过期的条目。同一个文件可以被多个 worker 共用（WAL 模式）。
+    """
+
+    # 每写入多少次执行一次清理
+    _PRUNE_EVERY = 500
+
+    def __init__(self, name: str, path: Path, maxsize: int = 100000, ttl: float = 300.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (name, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)")
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return json.dumps(key, ensure_ascii=False, default=str)
+
+    def get_with_ttl(self, key: Hashable) -> Optional[tuple]:
+        """返回 (值, 剩余秒数)，未命中或出错时返回 None"""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM cache WHERE name = ? AND key = ?", (self.name, self._key(key))
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取磁盘缓存 {self.name} 失败: {str(e)}")
+            row = None
+        remaining = row[1] - time.time() if row else 0
+        if row is None or remaining <= 0:
+            CACHE_MISSES.inc(cache=self.name)
+            return None
+        CACHE_HITS.inc(cache=self.name)
+        return json.loads(row[0]), remaining
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self.get_with_ttl(key)
+        return default if item is None else item[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (name, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.name, self._key(key), json.dumps(value, ensure_ascii=False), expires_at),
+                )
+                self._writes += 1
+                if self._writes % self._PRUNE_EVERY == 0:
+                    self._prune()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"写入磁盘缓存 {self.name} 失败: {str(e)}")
+
+    def _prune(self) -> None:
+        expired = self._conn.execute(
+            "DELETE FROM cache WHERE name = ? AND expires_at <= ?", (self.name, time.time())
+        ).rowcount
+        over = self._conn.execute(
+            "DELETE FROM cache WHERE name = ? AND key IN ("
+            "SELECT key FROM cache WHERE name = ? ORDER BY expires_at "
+            "LIMIT max((SELECT count(*) FROM cache WHERE name = ?) - ?, 0))",
+            (self.name, self.name, self.name, self.maxsize),
+        ).rowcount
+        if expired:
+            CACHE_EVICTIONS.inc(expired, cache=self.name, reason="expired")
+        if over:
+            CACHE_EVICTIONS.inc(over, cache=self.name, reason="lru")
+
+    def delete(self, key: Hashable) -> None:
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, self._key(key)))
+        except sqlite3.Error as e:
+            logger.warning(f"删除磁盘缓存 {self.name} 失败: {str(e)}")
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    async def adelete(self, key: Hashable) -> None:
+        await asyncio.to_thread(self.delete, key)
+
+
+class TieredCache:
+    """进程内 LRU + SQLite 两级缓存；磁盘命中时按剩余有效期回填内存"""
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None):
+        self.name = memory.name
+        self.memory = memory
+        self.disk = disk
+
+    def _get_from_disk(self, key: Hashable, default: Any) -> Any:
+        item = self.disk.get_with_ttl(key) if self.disk else None
+        if item is None:
+            return default
+        self.memory.set(key, item[0], item[1])
+        return item[0]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        return self._get_from_disk(key, default)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.memory.set(key, value, ttl)
+        if self.disk:
+            self.disk.set(key, value, ttl)
+
+    def delete(self, key: Hashable) -> None:
+        self.memory.delete(key)
+        if self.disk:
+            self.disk.delete(key)
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if not self.disk:
+            return default
+        return await asyncio.to_thread(self._get_from_disk, key, default)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.memory.set(key, value, ttl)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, key, value, ttl)
+
+    async def adelete(self, key: Hashable) -> None:
+        self.memory.delete(key)
+        if self.disk:
+            await asyncio.to_thread(self.disk.delete, key)
+
+
+def create_cache(name: str, backend: str = "memory", maxsize: int = 1024, ttl: float = 300.0,
+                 redis_url: str = "", dumps: Callable[[Any], str] = str, loads: Callable[[bytes], Any] = bytes.decode):
+    """按配置创建缓存，backend 为 memory 或 redis；redis 模式下 dumps/loads 负责值的序列化"""
+    if backend == "redis":
+        logger.info(f"缓存 {name} 使用 Redis 后端")
+        return RedisCache(name, redis_url, ttl, dumps, loads)
+    if backend != "memory":
+        raise ValueError(f"未知的缓存后端: {backend}")
+    return LRUCache(name, maxsize, ttl)
@@ -0,0 +1,261 @@
+"""
+并发限制
+
+ConcurrencyLimiter 同时限制全局并发数和单个用户（key）的并发数，全局名额用完时请求进入有界的等待队列：
+
+- 单个用户的进行中 + 排队请求达到上限：立即拒绝（429）
+- 等待队列已满：立即拒绝（429），Retry-After 按队列长度和平均占用时间估算
+- 排队超时：拒绝（503）
+
+等待队列按用户公平调度：每个用户各有一个队列，名额空出时按轮转顺序从下一个用户的队列中放行，
+一个用户同时发出多个请求不会让其他用户排在它们后面。
+
+拒绝时抛出 ConcurrencyLimitExceeded，带 Retry-After 秒数，由 main.py 统一转换为HTTP响应。
+只在事件循环线程中使用；acquire 返回的释放函数可以在任务真正结束时（如线程池任务的回调中）再调用。
+
+RateLimiter 按每分钟请求数和token数限制对上游的调用，在工作线程中阻塞等待。
+"""
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Hashable, Optional
+
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LIMITER_ACTIVE = registry.gauge("concurrency_active", "正在执行的任务数", ["limiter"])
+LIMITER_WAITING = registry.gauge("concurrency_waiting", "排队等待的任务数", ["limiter"])
+LIMITER_REJECTED = registry.counter(
+    "concurrency_rejected_total", "被拒绝的任务数，reason 为 per_key、queue_full 或 timeout", ["limiter", "reason"]
+)
+LIMITER_QUEUE_SECONDS = registry.histogram(
+    "concurrency_queue_seconds", "任务获得执行名额前的排队耗时（秒），不排队时为0", ["limiter"],
+    buckets=(0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    "rate_limit_wait_seconds", "因每分钟请求数/token数限制等待的耗时（秒）", ["limiter"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+# 估算 Retry-After 时的上限（秒）
+_MAX_RETRY_AFTER = 60
+# 平均占用时间的指数滑动平均系数
+_HOLD_EWMA_ALPHA = 0.2
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """并发数超过限制"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """全局 + 按 key 的并发限制，带按 key 公平调度的有界等待队列"""
+
+    def __init__(self, name: str, limit: int, per_key_limit: int, max_waiting: int,
+                 wait_timeout: float, retry_after: int):
+        self.name = name
+        self.limit = limit
+        self.per_key_limit = per_key_limit
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self._active = 0
+        self._per_key: Dict[Hashable, int] = {}
+        # 每个 key 的等待队列，按轮转顺序排列
+        self._queues: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        self._waiting = 0
+        self._avg_hold: Optional[float] = None
+        LIMITER_ACTIVE.set_function(lambda: {(self.name,): self._active})
+        LIMITER_WAITING.set_function(lambda: {(self.name,): self._waiting})
+
+    def _reject(self, reason: str, status_code: int, detail: str, retry_after: Optional[int] = None) -> ConcurrencyLimitExceeded:
+        LIMITER_REJECTED.inc(limiter=self.name, reason=reason)
+        logger.warning(f"{self.name} 并发受限({reason}): {detail}")
+        return ConcurrencyLimitExceeded(status_code, detail, retry_after or self.retry_after)
+
+    def _estimate_retry_after(self) -> int:
+        """按排在前面的任务数和平均占用时间估算多久后可能有空位"""
+        if self._avg_hold is None:
+            return self.retry_after
+        estimate = math.ceil((self._waiting + 1) / self.limit * self._avg_hold)
+        return max(self.retry_after, min(estimate, _MAX_RETRY_AFTER))
+
+    async def acquire(self, key: Hashable) -> Callable[[], None]:
+        """
+        获取一个执行名额，返回释放函数（重复调用无副作用）
+
+        key 的计数包含排队中的请求，单个用户无法占满等待队列
+        """
+        if self._per_key.get(key, 0) >= self.per_key_limit:
+            raise self._reject("per_key", 429, "您有太多请求正在处理中，请稍后重试")
+        if self._active >= self.limit and self._waiting >= self.max_waiting:
+            raise self._reject("queue_full", 429, "服务繁忙，请稍后重试", self._estimate_retry_after())
+
+        self._per_key[key] = self._per_key.get(key, 0) + 1
+        start = time.perf_counter()
+        if self._active < self.limit and self._waiting == 0:
+            self._active += 1
+        else:
+            try:
+                await self._wait(key)
+            except BaseException:
+                self._release_key(key)
+                raise
+        LIMITER_QUEUE_SECONDS.observe(time.perf_counter() - start, limiter=self.name)
+
+        acquired_at = time.monotonic()
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            self._record_hold(time.monotonic() - acquired_at)
+            self._release_key(key)
+            self._release_slot()
+
+        return release
+
+    async def _wait(self, key: Hashable) -> None:
+        """在 key 的队列中等待被 _dispatch 放行；放行时名额已计入 _active"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(waiter)
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.wait_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 超时或取消的同时已被放行，把名额交还
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self._discard(key, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("timeout", 503, "服务繁忙，请稍后重试")
+            raise
+
+    def _discard(self, key: Hashable, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(key)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+            self._waiting -= 1
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[key]
+
+    def _dispatch(self) -> None:
+        """名额空出时按轮转顺序放行：取队首 key 的第一个请求，该 key 还有请求时移到队尾"""
+        while self._active < self.limit and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if waiter.done():
+                continue
+            self._active += 1
+            waiter.set_result(None)
+
+    def _release_slot(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    def _record_hold(self, seconds: float) -> None:
+        if self._avg_hold is None:
+            self._avg_hold = seconds
+        else:
+            self._avg_hold += _HOLD_EWMA_ALPHA * (seconds - self._avg_hold)
+
+    def _release_key(self, key: Hashable) -> None:
+        count = self._per_key.get(key, 0) - 1
+        if count > 0:
+            self._per_key[key] = count
+        else:
+            self._per_key.pop(key, None)
+
+
+class RateLimiter:
+    """
+    每分钟请求数（rpm）和token数（tpm）限制，两个令牌桶，容量为一分钟的额度
+
+    线程安全，acquire 在调用线程中阻塞等待；限额为0表示不限制。
+    请求前按估算token数扣减，拿到实际用量后用 charge 补扣差额（可以为负）
+    """
+
+    def __init__(self, name: str, rpm: int = 0, tpm: int = 0):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        """还需等待的秒数，0 表示可以立即执行"""
+        wait = 0.0
+        if self.rpm and self._requests < 1:
+            wait = (1 - self._requests) * 60 / self.rpm
+        if self.tpm and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+        return wait
+
+    def acquire(self, tokens: int = 0, check: Optional[Callable[[], None]] = None) -> None:
+        """
+        等待到额度足够后扣减一次请求和 tokens 个token
+
+        单次超过 tpm 的请求按 tpm 计，避免永远等不到；check 在每次等待前调用，可抛出异常放弃等待
+        """
+        if not self.rpm and not self.tpm:
+            return
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        start = time.perf_counter()
+        while True:
+            with self._lock:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    break
+            if check is not None:
+                check()
+            time.sleep(min(wait, 0.5))
+        waited = time.perf_counter() - start
+        if waited > 0.001:
+            RATE_LIMIT_WAIT_SECONDS.observe(waited, limiter=self.name)
+
+    def charge(self, tokens: int) -> None:
+        """按实际用量补扣（或退还）token额度"""
+        if not self.tpm or not tokens:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.tpm, self._tokens - tokens)
@@ -0,0 +1,36 @@
+"""
+HTTP 条件请求（ETag / If-None-Match / If-Match）的解析与比较
+"""
+import hashlib
+from typing import List, Optional, Tuple
+
+
+def parse_etags(header: Optional[str]) -> List[Tuple[bool, str]]:
+    """解析 If-None-Match / If-Match 头，返回 [(是否弱ETag, 去掉引号的值)]，* 不在结果中"""
+    if not header:
+        return []
+    tags = []
+    for part in header.split(","):
+        part = part.strip()
+        weak = part.startswith("W/")
+        if weak:
+            part = part[2:]
+        if len(part) >= 2 and part[0] == part[-1] == '"':
+            tags.append((weak, part[1:-1]))
+    return tags
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match 判断，按弱比较忽略 W/ 前缀；* 匹配任意已存在的资源"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    value = etag[2:] if etag.startswith("W/") else etag
+    return any(tag == value.strip('"') for _, tag in parse_etags(header))
+
+
+def hash_etag(*parts) -> str:
+    """由任意可 repr 的值生成强ETag"""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
@@ -0,0 +1,104 @@
+"""
+外部接口调用缓存
+
+高德、DuckDuckGo、OpenWeather 等外部接口按来源（source）各用一个两级缓存（进程内 LRU + SQLite 文件），
+LLM工具和 /util 接口共用：同一地点被反复查询时直接返回缓存结果，也不容易触发厂商的频率限制。
+
+- 各来源的有效期由 EXTERNAL_CACHE_TTLS 配置，未配置的来源默认 600 秒
+- 调用失败时把错误缓存 EXTERNAL_CACHE_ERROR_TTL 秒（负缓存），期间直接抛出 ExternalCallError，不再请求外部接口
+- 缓存的值需可 JSON 序列化；EXTERNAL_CACHE_PATH 为空时只使用进程内缓存
+- 命中率见 /metrics 中 cache="external_<来源>"（内存）和 cache="external_<来源>:disk"（磁盘）的 cache_* 指标
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from app.core.cache import LRUCache, SQLiteCache, TieredCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 600
+
+# 负缓存条目的标记字段
+_ERROR_FIELD = "__external_error__"
+_MISSING = object()
+
+_caches: Dict[str, TieredCache] = {}
+_caches_lock = threading.Lock()
+
+
+class ExternalCallError(Exception):
+    """外部接口调用失败，消息来自本次调用或负缓存"""
+
+
+def _disk_path() -> Optional[Path]:
+    if not settings.EXTERNAL_CACHE_PATH:
+        return None
+    path = Path(settings.EXTERNAL_CACHE_PATH)
+    return path if path.is_absolute() else settings.config_loader.project_root / path
+
+
+def get_external_cache(source: str) -> TieredCache:
+    """获取（首次使用时创建）某个来源的缓存"""
+    cache = _caches.get(source)
+    if cache is not None:
+        return cache
+    with _caches_lock:
+        if source not in _caches:
+            ttl = settings.EXTERNAL_CACHE_TTLS.get(source, DEFAULT_TTL)
+            memory = LRUCache(f"external_{source}", settings.EXTERNAL_CACHE_MAXSIZE, ttl)
+            disk = None
+            path = _disk_path()
+            if path is not None:
+                try:
+                    disk = SQLiteCache(f"external_{source}:disk", path, settings.EXTERNAL_CACHE_DISK_MAXSIZE, ttl)
+                except Exception as e:
+                    logger.warning(f"外部接口磁盘缓存不可用，{source} 只使用进程内缓存: {str(e)}")
+            _caches[source] = TieredCache(memory, disk)
+        return _caches[source]
+
+
+def _unwrap(value: Any) -> Any:
+    if isinstance(value, dict) and _ERROR_FIELD in value:
+        raise ExternalCallError(value[_ERROR_FIELD])
+    return value
+
+
+def cached_call(source: str, key: Hashable, fn: Callable[..., Any], *args,
+                cacheable: Optional[Callable[[Any], bool]] = None, **kwargs) -> Any:
+    """
+    带缓存地调用外部接口
+
+    cacheable 返回 False 的结果（如接口返回的业务错误）不缓存；fn 抛出异常时写入负缓存后原样抛出
+    """
+    cache = get_external_cache(source)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return _unwrap(value)
+    try:
+        value = fn(*args, **kwargs)
+    except Exception as e:
+        cache.set(key, {_ERROR_FIELD: str(e)}, settings.EXTERNAL_CACHE_ERROR_TTL)
+        raise
+    if cacheable is None or cacheable(value):
+        cache.set(key, value)
+    return value
+
+
+async def acached_call(source: str, key: Hashable, fn: Callable[..., Awaitable[Any]], *args,
+                       cacheable: Optional[Callable[[Any], bool]] = None, **kwargs) -> Any:
+    """cached_call 的异步版本，fn 为协程函数"""
+    cache = get_external_cache(source)
+    value = await cache.aget(key, _MISSING)
+    if value is not _MISSING:
+        return _unwrap(value)
+    try:
+        value = await fn(*args, **kwargs)
+    except Exception as e:
+        await cache.aset(key, {_ERROR_FIELD: str(e)}, settings.EXTERNAL_CACHE_ERROR_TTL)
+        raise
+    if cacheable is None or cacheable(value):
+        await cache.aset(key, value)
+    return value
@@ -0,0 +1,144 @@
+"""
+LLM读取网页
+
+fetch 工具的结果会整段放进提示词，这里限制每一步的开销：
+
+- 流式下载，响应体超过 FETCH_MAX_BYTES 后不再读取（按已下载的部分处理）
+- 根据 Content-Type 提前拒绝图片、压缩包等二进制内容，不下载响应体
+- HTML 提取标题和正文，去掉脚本、样式、导航、页眉页脚等；结果按 FETCH_MAX_TOKENS 截断
+- 提取后的文本按URL缓存（外部接口缓存的 fetch 来源）。FETCH_FRESH_TTL 内直接返回，之后带
+  If-None-Match / If-Modified-Since 重新验证，服务端返回304时沿用缓存的文本
+"""
+import re
+import time
+import logging
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+
+from app.core.config import settings
+from app.core.external_cache import ExternalCallError, get_external_cache
+from app.core.metrics import registry
+from app.core.text import html_to_text, plain_text, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+FETCH_TOTAL = registry.counter(
+    "fetch_total", "LLM读取网页的次数，result 为 cached、not_modified、ok、rejected 或 error", ["result"],
+)
+FETCH_BYTES = registry.histogram(
+    "fetch_bytes", "读取网页时下载的响应体字节数",
+    buckets=(4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; DreamCatcher/1.0)",
+    "Accept": "text/html,application/xhtml+xml,text/plain;q=0.9,application/json;q=0.8,*/*;q=0.1",
+}
+_TEXT_TYPES = {"application/json", "application/ld+json", "application/xml", "application/xhtml+xml", "application/rss+xml", "application/atom+xml"}
+_HTML_TYPES = {"text/html", "application/xhtml+xml"}
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+_CHUNK_SIZE = 16384
+
+
+class FetchRejected(ExternalCallError):
+    """URL或内容类型不支持读取"""
+
+
+def _is_text_type(content_type: str) -> bool:
+    return not content_type or content_type.startswith("text/") or content_type in _TEXT_TYPES
+
+
+def _read_capped(response: requests.Response) -> bytes:
+    """流式读取响应体，最多 FETCH_MAX_BYTES 字节"""
+    body = bytearray()
+    for chunk in response.iter_content(_CHUNK_SIZE):
+        body.extend(chunk)
+        if len(body) >= settings.FETCH_MAX_BYTES:
+            logger.info(f"网页超过 {settings.FETCH_MAX_BYTES} 字节，只处理前面的部分: {response.url}")
+            del body[settings.FETCH_MAX_BYTES:]
+            break
+    return bytes(body)
+
+
+def _decode(response: requests.Response, body: bytes) -> str:
+    """按 Content-Type 中的 charset、HTML 的 meta charset、UTF-8 的顺序解码"""
+    charset: Optional[str] = None
+    if "charset=" in response.headers.get("Content-Type", "").lower():
+        charset = response.encoding
+    if charset is None:
+        match = _META_CHARSET.search(body[:4096])
+        if match:
+            charset = match.group(1).decode("ascii")
+    try:
+        return body.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def _download(url: str, cached: Optional[dict]) -> dict:
+    """下载并提取正文，cached 为上次的结果时发送条件请求；返回新的缓存条目"""
+    headers = dict(_HEADERS)
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    with requests.get(url, headers=headers, timeout=settings.FETCH_TIMEOUT, stream=True) as response:
+        if response.status_code == 304 and cached:
+            FETCH_TOTAL.inc(result="not_modified")
+            return {**cached, "fetched_at": time.time()}
+        response.raise_for_status()
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not _is_text_type(content_type):
+            raise FetchRejected(f"不支持读取该类型的内容: {content_type}")
+        body = _read_capped(response)
+        FETCH_BYTES.observe(len(body))
+        # 未声明类型时，含空字节的内容视为二进制
+        if not content_type and b"\x00" in body[:1024]:
+            raise FetchRejected("不支持读取二进制内容")
+
+        text = _decode(response, body)
+        is_html = content_type in _HTML_TYPES or (not content_type and "<html" in text[:1024].lower())
+        text = html_to_text(text) if is_html else plain_text(text)
+        FETCH_TOTAL.inc(result="ok")
+        return {
+            "text": truncate_to_tokens(text, settings.FETCH_MAX_TOKENS),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+
+
+def fetch_text(url: str) -> str:
+    """
+    读取网页并返回提取后的正文文本
+
+    只支持 http/https；内容类型不支持时抛出 FetchRejected，其他失败抛出 requests 的异常或 ExternalCallError，
+    失败结果缓存 EXTERNAL_CACHE_ERROR_TTL 秒
+    """
+    if urlparse(url).scheme not in ("http", "https"):
+        FETCH_TOTAL.inc(result="rejected")
+        raise FetchRejected("只支持 http/https 链接")
+
+    cache = get_external_cache("fetch")
+    cached = cache.get(url)
+    if cached is not None:
+        if "error" in cached:
+            FETCH_TOTAL.inc(result="cached")
+            raise ExternalCallError(cached["error"])
+        if time.time() - cached["fetched_at"] < settings.FETCH_FRESH_TTL:
+            FETCH_TOTAL.inc(result="cached")
+            return cached["text"]
+
+    try:
+        entry = _download(url, cached)
+    except Exception as e:
+        FETCH_TOTAL.inc(result="rejected" if isinstance(e, FetchRejected) else "error")
+        cache.set(url, {"error": str(e)}, settings.EXTERNAL_CACHE_ERROR_TTL)
+        raise
+    cache.set(url, entry)
+    return entry["text"]
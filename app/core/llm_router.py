@@ -0,0 +1,400 @@
+"""
+多模型路由
+
+从 provider.json 加载全部提供商/模型（条目中 "enabled": false 的除外），每次请求LLM时：
+
+- 按各模型最近 LLM_ROUTER_WINDOW 次请求的 p50 耗时选择最快的健康模型；还没有统计数据的模型排在
+  有数据的模型之后（其中默认模型 LLM_DEFAULT_MODEL 在前），启动时使用默认模型，其余模型在
+  故障转移和对冲时积累数据
+- 错误率达到 LLM_ROUTER_ERROR_RATE 的模型暂停使用 LLM_ROUTER_COOLDOWN 秒，之后重新尝试
+- 请求失败时依次换下一个模型重试，最多尝试 _MAX_ATTEMPTS 个
+- 非流式请求超过首选模型的 p95 耗时（没有数据时为 LLM_HEDGE_DELAY）仍未返回，同时向下一个模型发出
+  相同的请求（对冲），先成功的结果生效；落后的请求无法中途取消，完成后只计入统计
+- 流式请求已经输出的内容无法撤回，只在收到第一个分块前失败时换模型，不做对冲
+- 每个模型按条目中的 rpm / tpm（未配置时为 LLM_RPM / LLM_TPM）限制每分钟请求数和token数，按 max_concurrency
+  限制同时进行的请求数；每次向上游发出请求（包括换模型重试和对冲）前都扣减额度，收到响应后按实际用量补扣
+- 每隔 LLM_ROUTER_RELOAD_INTERVAL 秒检查 provider.json 的修改时间，变化后重新加载，无需重启；
+  未变化的模型沿用原实例、额度和统计数据，条目变化的模型按新配置重建额度，文件格式错误时保留原配置
+
+各模型的请求数、耗时、健康状态和对冲次数见 /metrics 中的 llm_upstream_* 指标。
+"""
+import json
+import time
+import contextvars
+import itertools
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from SimpleLLMFunc import OpenAICompatible
+from SimpleLLMFunc.interface.key_pool import APIKeyPool
+
+from app.core.concurrency import RateLimiter
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_TOTAL = registry.counter(
+    "llm_upstream_requests_total", "发往各模型的请求数，result 为 ok 或 error", ["model", "result"],
+)
+UPSTREAM_SECONDS = registry.histogram(
+    "llm_upstream_seconds", "各模型成功请求的耗时（秒），流式请求为读完全部分块的耗时", ["model"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+UPSTREAM_HEDGED = registry.counter(
+    "llm_upstream_hedged_total", "对冲请求次数，result 为 won（对冲请求先成功）或 lost", ["result"],
+)
+UPSTREAM_FAILOVER = registry.counter("llm_upstream_failover_total", "请求失败后换模型重试的次数", ["model"])
+UPSTREAM_LATENCY = registry.gauge("llm_upstream_latency_seconds", "各模型最近请求耗时的分位数", ["model", "quantile"])
+UPSTREAM_HEALTHY = registry.gauge("llm_upstream_healthy", "模型是否可用（1 可用，0 暂停中）", ["model"])
+
+# 一次请求最多尝试的模型数
+_MAX_ATTEMPTS = 3
+# 计算分位数和错误率所需的最少样本数
+_MIN_SAMPLES = 3
+# 对冲等待时间的下限（秒）
+_MIN_HEDGE_DELAY = 1.0
+
+
+def _usage_tokens(usage) -> Optional[int]:
+    """响应或分块 usage 中的总token数，没有时返回 None"""
+    total = getattr(usage, "total_tokens", None)
+    return total if isinstance(total, int) else None
+
+
+def _pool_name(provider_id: str, entry: dict) -> str:
+    """
+    APIKeyPool 按名称单例，名称中带上密钥的摘要：密钥不变时沿用原密钥池（保留各密钥的任务计数），
+    密钥变化后得到新的密钥池
+    """
+    digest = hashlib.sha256("\n".join(entry["api_keys"]).encode()).hexdigest()[:12]
+    return f"{provider_id}-{entry['model_name']}-{digest}"
+
+
+class _ModelStats:
+    """单个模型最近若干次请求的耗时和成败（耗时为 None 表示失败）"""
+
+    def __init__(self, window: int):
+        self.samples: Deque[Optional[float]] = deque(maxlen=window)
+        self.unhealthy_until = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, latency: Optional[float]) -> None:
+        with self.lock:
+            self.samples.append(latency)
+            if latency is None and len(self.samples) >= _MIN_SAMPLES and self._error_rate() >= settings.LLM_ROUTER_ERROR_RATE:
+                self.unhealthy_until = time.monotonic() + settings.LLM_ROUTER_COOLDOWN
+
+    def _error_rate(self) -> float:
+        return sum(1 for s in self.samples if s is None) / len(self.samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self.lock:
+            latencies = sorted(s for s in self.samples if s is not None)
+        if len(latencies) < _MIN_SAMPLES:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+
+class _Model:
+    def __init__(self, key: str, entry: dict, interface: OpenAICompatible, stats: _ModelStats):
+        self.key = key
+        self.entry = entry
+        self.interface = interface
+        self.stats = stats
+        self.limiter = RateLimiter(
+            f"llm_upstream:{key}",
+            rpm=int(entry.get("rpm", settings.LLM_RPM)),
+            tpm=int(entry.get("tpm", settings.LLM_TPM)),
+        )
+        max_concurrency = entry.get("max_concurrency")
+        self.slots = threading.BoundedSemaphore(int(max_concurrency)) if max_concurrency else None
+
+    def describe(self) -> str:
+        return (
+            f"{self.key}（每分钟请求数 {self.limiter.rpm or '不限'}, 每分钟token数 {self.limiter.tpm or '不限'}, "
+            f"并发数 {self.entry.get('max_concurrency') or '不限'}）"
+        )
+
+
+class LLMRouter:
+    """
+    按耗时和健康状态在多个模型间路由的LLM接口，chat / chat_stream 与 OpenAICompatible 相同
+
+    model_name、base_url 为默认模型的值；chat / chat_stream 额外接受 tokens（估算的输入token数）和
+    check（等待额度或并发名额时调用，可抛出异常放弃等待），用于扣减所选模型的额度
+    """
+
+    def __init__(self, path: Path, default_model: str):
+        self.path = path
+        self.default_model = default_model
+        self._models: Dict[str, _Model] = {}
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._load()
+        UPSTREAM_LATENCY.set_function(self._latency_samples)
+        UPSTREAM_HEALTHY.set_function(lambda: {(m.key,): int(m.stats.healthy) for m in self._models.values()})
+
+    # ===== 加载与热更新 =====
+
+    def _load(self) -> None:
+        """读取 provider.json 并重建模型表；未变化的条目沿用原实例和统计数据"""
+        mtime = self.path.stat().st_mtime
+        with open(self.path, "r", encoding="utf-8") as f:
+            providers = json.load(f)
+        models: Dict[str, _Model] = {}
+        for provider_id, entries in providers.items():
+            for entry in entries:
+                if not entry.get("enabled", True):
+                    continue
+                key = f"{provider_id}/{entry['model_name']}"
+                old = self._models.get(key)
+                if old is not None and old.entry == entry:
+                    models[key] = old
+                    continue
+                interface = OpenAICompatible(
+                    api_key_pool=APIKeyPool(entry["api_keys"], _pool_name(provider_id, entry)),
+                    model_name=entry["model_name"],
+                    base_url=entry["base_url"],
+                    # 失败时由路由换模型重试，默认不在同一模型上重试
+                    max_retries=entry.get("max_retries", 0),
+                    retry_delay=entry.get("retry_delay", 1.0),
+                )
+                stats = old.stats if old is not None else _ModelStats(settings.LLM_ROUTER_WINDOW)
+                models[key] = _Model(key, entry, interface, stats)
+        if not models:
+            raise ValueError("没有启用的模型")
+        self._models = models
+        self._mtime = mtime
+        logger.info(f"LLM模型已加载: {', '.join(m.describe() for m in models.values())}；默认模型 {self._default().key}")
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < settings.LLM_ROUTER_RELOAD_INTERVAL:
+            return
+        with self._lock:
+            if now - self._checked_at < settings.LLM_ROUTER_RELOAD_INTERVAL:
+                return
+            self._checked_at = now
+            try:
+                if self.path.stat().st_mtime == self._mtime:
+                    return
+                self._load()
+            except Exception as e:
+                logger.error(f"重新加载 {self.path} 失败，继续使用原配置: {str(e)}")
+
+    def _default(self) -> _Model:
+        return self._models.get(self.default_model) or next(iter(self._models.values()))
+
+    @property
+    def model_name(self) -> str:
+        return self._default().interface.model_name
+
+    @property
+    def base_url(self) -> str:
+        return self._default().interface.base_url
+
+    def default_entry(self) -> dict:
+        """默认模型在 provider.json 中的条目"""
+        return self._default().entry
+
+    # ===== 选择模型 =====
+
+    def _candidates(self) -> List[_Model]:
+        """按优先级排列的模型：健康的在前，再按 p50 耗时排序，没有数据的在后"""
+        self._maybe_reload()
+        default_key = self._default().key
+
+        def rank(model: _Model) -> Tuple[int, float, int]:
+            p50 = model.stats.quantile(0.5)
+            return (
+                0 if model.stats.healthy else 1,
+                float("inf") if p50 is None else p50,
+                0 if model.key == default_key else 1,
+            )
+
+        return sorted(self._models.values(), key=rank)[:_MAX_ATTEMPTS]
+
+    def _latency_samples(self) -> Dict[Tuple[str, str], float]:
+        samples = {}
+        for model in self._models.values():
+            for q in (0.5, 0.95):
+                value = model.stats.quantile(q)
+                if value is not None:
+                    samples[(model.key, str(q))] = value
+        return samples
+
+    def _hedge_delay(self, model: _Model) -> float:
+        p95 = model.stats.quantile(0.95)
+        return max(p95, _MIN_HEDGE_DELAY) if p95 is not None else settings.LLM_HEDGE_DELAY
+
+    # ===== 请求 =====
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=settings.LLM_MAX_CONCURRENCY * 2, thread_name_prefix="llm-upstream"
+                    )
+        return self._executor
+
+    @staticmethod
+    def _acquire(model: _Model, tokens: int, check: Optional[Callable[[], None]]) -> None:
+        """等待模型的并发名额和额度，成功返回后须调用 _release 归还并发名额"""
+        if model.slots is not None:
+            while not model.slots.acquire(timeout=0.5):
+                if check is not None:
+                    check()
+        try:
+            model.limiter.acquire(tokens, check)
+        except BaseException:
+            LLMRouter._release(model)
+            raise
+
+    @staticmethod
+    def _release(model: _Model) -> None:
+        if model.slots is not None:
+            model.slots.release()
+
+    @staticmethod
+    def _charge(model: _Model, tokens: int, usage) -> None:
+        """按实际用量补扣额度；上游没有返回用量时保留请求前按估算值扣减的额度"""
+        total = _usage_tokens(usage)
+        if total is not None:
+            model.limiter.charge(total - tokens)
+
+    def _call(self, model: _Model, args: tuple, kwargs: dict, tokens: int = 0, check: Optional[Callable[[], None]] = None):
+        self._acquire(model, tokens, check)
+        start = time.perf_counter()
+        try:
+            response = model.interface.chat(*args, **kwargs)
+        except Exception as e:
+            model.stats.record(None)
+            UPSTREAM_TOTAL.inc(model=model.key, result="error")
+            logger.warning(f"LLM请求失败: {model.key}, 错误: {str(e)}")
+            raise
+        finally:
+            self._release(model)
+        elapsed = time.perf_counter() - start
+        model.stats.record(elapsed)
+        UPSTREAM_TOTAL.inc(model=model.key, result="ok")
+        UPSTREAM_SECONDS.observe(elapsed, model=model.key)
+        self._charge(model, tokens, getattr(response, "usage", None))
+        return response
+
+    def chat(self, *args, tokens: int = 0, check: Optional[Callable[[], None]] = None, **kwargs):
+        """非流式请求：失败时换模型，首选模型过慢时对冲到下一个模型"""
+        candidates = self._candidates()
+        if len(candidates) == 1:
+            return self._call(candidates[0], args, kwargs, tokens, check)
+
+        executor = self._get_executor()
+        pending: Dict[Future, Tuple[_Model, bool]] = {}
+
+        def submit(hedge: bool) -> _Model:
+            model = candidates.pop(0)
+            # 在调用线程的上下文中执行，check 等依赖上下文变量的回调在对冲线程中同样有效
+            context = contextvars.copy_context()
+            pending[executor.submit(context.run, self._call, model, args, kwargs, tokens, check)] = (model, hedge)
+            return model
+
+        def hedge_deadline(model: _Model) -> Optional[float]:
+            return time.monotonic() + self._hedge_delay(model) if settings.LLM_HEDGE_ENABLED else None
+
+        primary = submit(False)
+        hedge_at = hedge_deadline(primary)
+        last_error: Optional[Exception] = None
+        while pending:
+            timeout = None if hedge_at is None or not candidates else max(hedge_at - time.monotonic(), 0)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if check is not None:
+                    check()
+                hedge = submit(True)
+                hedge_at = None
+                logger.info(f"{primary.key} 超过 {self._hedge_delay(primary):.1f} 秒未返回，对冲到 {hedge.key}")
+                continue
+            for future in done:
+                model, hedged = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    if not pending and candidates:
+                        # 对话已取消或超时（check 抛出的异常也会走到这里）时不再请求下一个模型
+                        if check is not None:
+                            check()
+                        UPSTREAM_FAILOVER.inc(model=model.key)
+                        primary = submit(False)
+                        hedge_at = hedge_deadline(primary)
+                    continue
+                if hedged or any(h for _, h in pending.values()):
+                    UPSTREAM_HEDGED.inc(result="won" if hedged else "lost")
+                return response
+        raise last_error
+
+    def chat_stream(self, *args, tokens: int = 0, check: Optional[Callable[[], None]] = None, **kwargs) -> Iterator:
+        """
+        流式请求：在收到第一个分块前失败时换模型
+
+        生成器在开始迭代时才选择模型和占用并发名额，读完、出错或被关闭（如客户端断开）时归还；
+        中途被关闭时不计入统计
+        """
+        last_error: Optional[Exception] = None
+        for model in self._candidates():
+            self._acquire(model, tokens, check)
+            try:
+                start = time.perf_counter()
+                stream = model.interface.chat_stream(*args, **kwargs)
+                try:
+                    first = next(stream)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    model.stats.record(None)
+                    UPSTREAM_TOTAL.inc(model=model.key, result="error")
+                    logger.warning(f"LLM流式请求失败: {model.key}, 错误: {str(e)}")
+                    last_error = e
+                    if check is not None:
+                        check()
+                    UPSTREAM_FAILOVER.inc(model=model.key)
+                    continue
+                usage = None
+                try:
+                    for chunk in itertools.chain((first,), stream):
+                        # 用量通常在最后一个分块中
+                        usage = getattr(chunk, "usage", None) or usage
+                        yield chunk
+                except GeneratorExit:
+                    stream.close()
+                    raise
+                except Exception:
+                    model.stats.record(None)
+                    UPSTREAM_TOTAL.inc(model=model.key, result="error")
+                    raise
+                elapsed = time.perf_counter() - start
+                model.stats.record(elapsed)
+                UPSTREAM_TOTAL.inc(model=model.key, result="ok")
+                UPSTREAM_SECONDS.observe(elapsed, model=model.key)
+                self._charge(model, tokens, usage)
+                return
+            finally:
+                self._release(model)
+        raise last_error
+
+    def shutdown(self) -> None:
+        """关闭对冲请求的线程池，应用退出时调用"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
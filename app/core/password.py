@@ -0,0 +1,131 @@
+"""
+密码哈希
+
+bcrypt 是刻意设计得很慢的CPU密集型计算（cost=12 时单次约 100-300ms），直接在 async 路由中
+调用会卡住整个事件循环。这里把哈希和校验放到独立的进程池中执行：
+
+- 进程数固定（BCRYPT_WORKERS），登录高峰不会占满全部CPU
+- 排队 + 执行中的任务超过 BCRYPT_MAX_PENDING 时立即抛出 PasswordHasherBusy，由路由返回503，
+  避免请求在队列里无限堆积
+- 工作因子由 BCRYPT_ROUNDS 配置，needs_rehash 用于登录时把旧cost的哈希升级为当前配置
+
+本模块会在子进程中被导入，只能依赖配置和指标，不要引入数据库等模块。
+"""
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_PENDING = registry.gauge("password_hash_pending", "排队及执行中的密码哈希任务数")
+PASSWORD_REJECTED = registry.counter("password_hash_rejected_total", "密码哈希进程池已满而被拒绝的请求数")
+PASSWORD_SECONDS = registry.histogram(
+    "password_hash_seconds", "密码哈希任务从提交到完成的耗时（秒）", ["op"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+class PasswordHasherBusy(Exception):
+    """密码哈希进程池已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("服务繁忙，请稍后重试")
+        self.retry_after = retry_after
+
+
+# ===== 在子进程中执行的函数，需为模块级函数以便序列化 =====
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+# ===== 同步接口，供同步代码路径使用（在调用线程内直接计算） =====
+
+def hash_password(password: str) -> str:
+    """生成密码哈希，cost 取 BCRYPT_ROUNDS"""
+    return _hashpw(password.encode("utf-8"), settings.BCRYPT_ROUNDS).decode("utf-8")
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """验证密码"""
+    return _checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """哈希的 cost 与当前配置不一致时需要重新哈希（格式为 $2b$12$...）"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+# ===== 进程池 =====
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pending = 0
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """延迟创建进程池；使用 spawn，避免在带线程和数据库连接的进程中 fork"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.BCRYPT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"密码哈希进程池已启动，进程数 {settings.BCRYPT_WORKERS}")
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """关闭进程池，应用退出时调用"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def _submit(op: str, fn, *args):
+    global _pending
+    with _pool_lock:
+        if _pending >= settings.BCRYPT_MAX_PENDING:
+            PASSWORD_REJECTED.inc()
+            raise PasswordHasherBusy(settings.BCRYPT_RETRY_AFTER)
+        _pending += 1
+    PASSWORD_PENDING.inc()
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        with _pool_lock:
+            _pending -= 1
+        PASSWORD_PENDING.dec()
+        PASSWORD_SECONDS.observe(time.perf_counter() - start, op=op)
+
+
+async def hash_password_async(password: str) -> str:
+    """在进程池中生成密码哈希，进程池已满时抛出 PasswordHasherBusy"""
+    hashed = await _submit("hash", _hashpw, password.encode("utf-8"), settings.BCRYPT_ROUNDS)
+    return hashed.decode("utf-8")
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """在进程池中验证密码，进程池已满时抛出 PasswordHasherBusy"""
+    return await _submit("verify", _checkpw, password.encode("utf-8"), hashed_password.encode("utf-8"))
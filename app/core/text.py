@@ -0,0 +1,112 @@
+"""
+文本处理：token估算、按token预算截断、HTML提取正文
+
+token数只做粗略估算（不依赖具体模型的分词器），用于控制放进提示词的内容大小
+"""
+import re
+from html.parser import HTMLParser
+from typing import List
+
+_CJK_CHAR = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+TRUNCATED_NOTICE = "\n……（内容过长，已截断）"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文字符和全角标点各算1个，其余字符每4个算1个"""
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按估算token数截断文本，优先在行尾截断；截断时末尾附加说明"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens - estimate_tokens(TRUNCATED_NOTICE)
+    kept: List[str] = []
+    for line in text.split("\n"):
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            # 剩余预算足够时保留当前行的前半部分，按最坏情况（每个字符1个token）取字符数
+            if budget > 20:
+                kept.append(line[:budget])
+            break
+        kept.append(line)
+        budget -= cost
+    return "\n".join(kept) + TRUNCATED_NOTICE
+
+
+class _TextExtractor(HTMLParser):
+    """提取HTML中可读的正文，跳过脚本、样式、导航、页眉页脚等"""
+
+    SKIP_TAGS = {
+        "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+        "nav", "header", "footer", "aside", "form", "button", "select", "head",
+    }
+    BLOCK_TAGS = {
+        "p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article", "main",
+        "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "dd", "dt", "hr",
+    }
+    # 不会有结束标签的元素，不能计入跳过的层数
+    VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "source", "area", "base", "col", "embed", "wbr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.title: List[str] = []
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag == "body":
+            # </head> 可以省略，进入 body 时不再跳过
+            self._skip_depth = 0
+        elif tag in self.SKIP_TAGS and tag not in self.VOID_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in self.SKIP_TAGS and self._skip_depth > 0:
+            self._skip_depth -= 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title.append(data)
+        elif self._skip_depth == 0:
+            self.parts.append(data)
+
+
+def _collapse(text: str) -> str:
+    """合并空白，去掉空行和连续重复的行"""
+    lines = []
+    for line in text.split("\n"):
+        line = " ".join(line.split())
+        if line and (not lines or lines[-1] != line):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def html_to_text(html: str) -> str:
+    """从HTML中提取标题和正文文本"""
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception:
+        # 残缺的HTML（如下载时被截断）尽量保留已解析的部分
+        pass
+    body = _collapse("".join(extractor.parts))
+    title = " ".join("".join(extractor.title).split())
+    return f"标题: {title}\n{body}" if title else body
+
+
+def plain_text(text: str) -> str:
+    """非HTML文本只合并空白"""
+    return _collapse(text)
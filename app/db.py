@@ -1,8 +1,13 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import OperationalError, DisconnectionError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.exc import OperationalError, DisconnectionError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core.metrics import registry
 import logging
+import time
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 # 设置日志
@@ -10,6 +15,99 @@ logger = logging.getLogger(__name__)
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
+def _to_async_url(url: str) -> str:
+    """将同步的 postgresql:// 连接串转换为 asyncpg 驱动的连接串"""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+# 异步引擎使用 asyncpg 驱动，未单独配置时由同步连接串推导
+ASYNC_SQLALCHEMY_DATABASE_URL = settings.ASYNC_DATABASE_URL or _to_async_url(SQLALCHEMY_DATABASE_URL)
+
+# ===== 连接池与监控 =====
+
+POOL_CHECKOUTS = registry.counter("db_pool_checkouts_total", "从连接池取出连接的次数", ["engine"])
+POOL_WAITS = registry.counter("db_pool_waits_total", "连接池已满、需要排队等待空闲连接的次数", ["engine"])
+POOL_TIMEOUTS = registry.counter("db_pool_timeouts_total", "等待连接超时（pool_timeout）的次数", ["engine"])
+POOL_CONNECTS = registry.counter("db_pool_connects_total", "新建数据库连接的次数", ["engine"])
+POOL_INVALIDATIONS = registry.counter("db_pool_invalidations_total", "连接失效被丢弃的次数", ["engine"])
+POOL_CHECKOUT_SECONDS = registry.histogram(
+    "db_pool_checkout_seconds", "获取连接的耗时（含排队）", ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0),
+)
+POOL_CONNECTIONS = registry.gauge("db_pool_connections", "连接池当前状态", ["engine", "state"])
+
+class _InstrumentedPoolMixin:
+    """统计取连接耗时与排队次数，engine_label 由 _instrument_pool 设置"""
+    engine_label = "unknown"
+
+    def _do_get(self):
+        # 没有空闲连接且溢出连接已用尽时，本次获取必须排队等待
+        if self.checkedin() == 0 and 0 <= self._max_overflow <= self.overflow():
+            POOL_WAITS.inc(engine=self.engine_label)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc(engine=self.engine_label)
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start, engine=self.engine_label)
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def _pool_kwargs() -> dict:
+    """连接池参数，统一来自 settings（config.json / 环境变量）"""
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        # 连接存活依赖 pool_recycle 与断线自动失效；网络会静默断开空闲连接时再开启 pre_ping
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+def _instrument_pool(db_engine, label: str) -> None:
+    """为引擎的连接池挂载监控事件"""
+    pool = db_engine.pool
+    pool.engine_label = label
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        POOL_CHECKOUTS.inc(engine=label)
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        POOL_CONNECTS.inc(engine=label)
+
+    @event.listens_for(pool, "invalidate")
+    def _on_invalidate(dbapi_conn, conn_record, exception):
+        POOL_INVALIDATIONS.inc(engine=label)
+
+    def _collect():
+        return {
+            (label, "size"): pool.size(),
+            (label, "checked_out"): pool.checkedout(),
+            (label, "idle"): pool.checkedin(),
+            (label, "overflow"): max(pool.overflow(), 0),
+        }
+
+    POOL_CONNECTIONS.set_function(_collect)
+
+def pool_status() -> dict:
+    """两个引擎连接池的当前状态，供健康检查展示"""
+    return {
+        label: {
+            "size": e.pool.size(),
+            "checked_out": e.pool.checkedout(),
+            "idle": e.pool.checkedin(),
+            "overflow": max(e.pool.overflow(), 0),
+        }
+        for label, e in (("sync", engine), ("async", async_engine.sync_engine))
+    }
+
 # 添加重试装饰器的数据库引擎创建
 @retry(
     retry=retry_if_exception_type((OperationalError, DisconnectionError)),
@@ -20,18 +118,45 @@ SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 def create_db_engine():
     """创建数据库引擎，带重试机制"""
     logger.info("正在创建数据库引擎...")
-    return create_engine(SQLALCHEMY_DATABASE_URL)
+    connect_args = {}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={int(settings.DB_STATEMENT_TIMEOUT_MS)}"
+    db_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        connect_args=connect_args,
+        **_pool_kwargs(),
+    )
+    _instrument_pool(db_engine, "sync")
+    return db_engine
+
+def create_async_db_engine():
+    """创建异步数据库引擎（asyncpg），连接在首次使用时才建立"""
+    logger.info("正在创建异步数据库引擎...")
+    connect_args = {}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        connect_args["server_settings"] = {"statement_timeout": str(int(settings.DB_STATEMENT_TIMEOUT_MS))}
+    db_engine = create_async_engine(
+        ASYNC_SQLALCHEMY_DATABASE_URL,
+        poolclass=InstrumentedAsyncQueuePool,
+        connect_args=connect_args,
+        **_pool_kwargs(),
+    )
+    _instrument_pool(db_engine.sync_engine, "async")
+    return db_engine
 
 engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# 依赖项 - 添加重试机制的数据库会话获取
+async_engine = create_async_db_engine()
+# expire_on_commit=False: 提交后仍可直接读取对象属性，避免在异步上下文中触发隐式IO
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# 依赖项 - 数据库会话获取
 def get_db():
-    """获取数据库会话，带重试机制"""
+    """获取数据库会话，连接存活由连接池负责，不再逐请求探测"""
     db = SessionLocal()
     try:
-        # 测试连接是否正常
-        db.execute(text("SELECT 1"))
         yield db
     except Exception as e:
         db.rollback()
@@ -40,6 +165,17 @@ def get_db():
     finally:
         db.close()
 
+# 依赖项 - 异步数据库会话，供 async def 路由使用，数据库IO不会阻塞事件循环
+async def get_async_db():
+    """获取异步数据库会话"""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"异步数据库会话异常: {str(e)}")
+            raise
+
 # 创建表格 - 添加重试机制
 @retry(
     retry=retry_if_exception_type((OperationalError, DisconnectionError)),
@@ -53,6 +189,8 @@ def create_tables():
         # 延迟导入避免循环导入
         from app.models import Base
         logger.info("正在创建数据库表...")
+        # 只创建不存在的表；已存在的表新增列和索引由 Alembic 迁移完成（alembic upgrade head），
+        # 不在导入时执行 ALTER TABLE，避免每个 worker 启动时对大表加锁
         Base.metadata.create_all(bind=engine)
         logger.info("数据库表创建成功")
     except Exception as e:
@@ -6,7 +6,8 @@ from contextlib import asynccontextmanager
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.exc import OperationalError, DisconnectionError
 from sqlalchemy import text
@@ -14,7 +15,12 @@ from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_excep
 
 from app.core.config import settings
 from app.api import plan_api, auth_api, llm_api, util_api
-from app.db import engine
+from app.services.llm_service import shutdown_chat_executor
+from app.services.llm_job_service import start_job_workers, stop_job_workers
+from app.core.metrics import registry
+from app.core.password import PasswordHasherBusy, shutdown_pool as shutdown_password_pool
+from app.core.concurrency import ConcurrencyLimitExceeded
+from app.db import engine, async_engine, pool_status
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -47,6 +53,7 @@ async def lifespan(app: FastAPI):
     try:
         # 执行数据库连接检查
         check_database_connection()
+        start_job_workers()
         logger.info("应用启动完成，所有依赖服务连接正常")
     except Exception as e:
         logger.error(f"应用启动失败: {str(e)}")
@@ -57,8 +64,13 @@ async def lifespan(app: FastAPI):
     # 关闭时执行
     logger.info("正在关闭 FastAPI 应用...")
     try:
+        # 先停止后台任务，执行中的任务放回队列后再关闭数据库连接
+        await stop_job_workers()
         # 关闭数据库连接
         engine.dispose()
+        await async_engine.dispose()
+        shutdown_password_pool()
+        shutdown_chat_executor()
         logger.info("应用关闭完成")
     except Exception as e:
         logger.error(f"应用关闭时出现错误: {str(e)}")
@@ -76,8 +88,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# 密码哈希进程池已满（登录/注册/修改密码高峰），返回503并提示重试时间
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# 并发超过限制（如LLM对话），返回429/503并提示重试时间
+@app.exception_handler(ConcurrencyLimitExceeded)
+async def concurrency_limit_handler(request: Request, exc: ConcurrencyLimitExceeded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # 添加路由
 app.include_router(plan_api.router, prefix=f"{settings.API_V1_STR}")
 app.include_router(auth_api.router, prefix=f"{settings.API_V1_STR}")
@@ -104,7 +135,8 @@ def health_check():
         return {
             "status": "healthy",
             "message": "服务运行正常",
-            "database": "connected"
+            "database": "connected",
+            "pool": pool_status()
         }
     except Exception as e:
         logger.error(f"健康检查失败: {str(e)}")
@@ -113,3 +145,8 @@ def health_check():
             "message": f"服务异常: {str(e)}",
             "database": "disconnected"
         }
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    """Prometheus 文本格式的运行指标（连接池等）"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,81 @@
+"""基线：users、plans、llm_jobs 表
+
+Revision ID: 0000_baseline
+Revises:
+Create Date: 2026-10-18
+
+新数据库上 alembic upgrade head 在应用导入 app.db（create_all）之前执行，表由这里创建；
+在迁移引入前已由 create_all 建好的表直接跳过
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0000_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _timestamps():
+    return [
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    ]
+
+
+def upgrade() -> None:
+    # alembic upgrade head --sql 生成脚本时无法检查数据库，按空库输出
+    existing = set() if op.get_context().as_sql else set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("user_name", sa.String(), nullable=False),
+            sa.Column("user_id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("password", sa.String(), nullable=False),
+            *_timestamps(),
+        )
+        for column in ("user_name", "user_id", "email", "password"):
+            op.create_index(f"ix_users_{column}", "users", [column])
+
+    # 游标分页索引和 position 列由 0001、0002 添加
+    if "plans" not in existing:
+        op.create_table(
+            "plans",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("name", sa.String()),
+            sa.Column("description", sa.Text(), nullable=True),
+            sa.Column("start_time", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("camera", sa.JSON(), nullable=False),
+            sa.Column("tileset_url", sa.String(), nullable=True),
+            sa.Column("user_id", UUID(as_uuid=True), nullable=False),
+            *_timestamps(),
+        )
+        for column in ("id", "name", "user_id"):
+            op.create_index(f"ix_plans_{column}", "plans", [column])
+
+    if "llm_jobs" not in existing:
+        op.create_table(
+            "llm_jobs",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("user_id", UUID(as_uuid=True), nullable=False),
+            sa.Column("query", sa.Text(), nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("response", sa.Text(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("trace", sa.JSON(), nullable=True),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index("ix_llm_jobs_user_id", "llm_jobs", ["user_id"])
+        op.create_index("ix_llm_jobs_status_created", "llm_jobs", ["status", "created_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("llm_jobs")
+    op.drop_table("plans")
+    op.drop_table("users")
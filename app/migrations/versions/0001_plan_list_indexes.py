@@ -0,0 +1,23 @@
+"""计划列表的游标分页索引
+
+Revision ID: 0001_plan_list_indexes
+Revises: 0000_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0001_plan_list_indexes"
+down_revision = "0000_baseline"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 迁移引入前由 create_all 建好的表可能已有这些索引
+    op.execute("CREATE INDEX IF NOT EXISTS ix_plans_user_start_id ON plans (user_id, start_time, id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_plans_start_id ON plans (start_time, id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_plans_start_id")
+    op.execute("DROP INDEX IF EXISTS ix_plans_user_start_id")
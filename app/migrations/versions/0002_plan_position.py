@@ -0,0 +1,43 @@
+"""计划相机位置的 PostGIS 空间列和索引
+
+Revision ID: 0002_plan_position
+Revises: 0001_plan_list_indexes
+Create Date: 2026-10-18
+
+生成列需要重写整张 plans 表并持有排他锁，计划较多时请在维护窗口执行
+"""
+from alembic import op
+
+revision = "0002_plan_position"
+down_revision = "0001_plan_list_indexes"
+branch_labels = None
+depends_on = None
+
+# 与 app/models.py 中的 _CAMERA_POSITION_SQL 相同；迁移中保留一份，之后修改模型不影响已有迁移
+_CAMERA_POSITION_SQL = """
+CASE WHEN json_typeof(camera -> 'position') = 'array'
+      AND abs((camera -> 'position' ->> 0)::float8) <= 180
+      AND abs((camera -> 'position' ->> 1)::float8) <= 90
+THEN ST_SetSRID(ST_MakePoint(
+        (camera -> 'position' ->> 0)::float8,
+        (camera -> 'position' ->> 1)::float8,
+        COALESCE((camera -> 'position' ->> 2)::float8, 0)
+     ), 4326)::geography
+END
+"""
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+    op.execute(
+        "ALTER TABLE plans ADD COLUMN IF NOT EXISTS position geography(POINTZ, 4326) "
+        f"GENERATED ALWAYS AS ({_CAMERA_POSITION_SQL}) STORED"
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_plans_position ON plans USING gist (position)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_plans_position_geom ON plans USING gist (geometry(position))")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_plans_position_geom")
+    op.execute("DROP INDEX IF EXISTS ix_plans_position")
+    op.execute("ALTER TABLE plans DROP COLUMN IF EXISTS position")
@@ -1,11 +1,26 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Text, Index, Computed
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
+from geoalchemy2 import Geography
 import uuid
 
 Base = declarative_base()
 
+# 由 camera.position ([经度, 纬度, 高度]) 生成的地理坐标点，经纬度越界或缺失时为 NULL
+_CAMERA_POSITION_SQL = """
+CASE WHEN json_typeof(camera -> 'position') = 'array'
+      AND abs((camera -> 'position' ->> 0)::float8) <= 180
+      AND abs((camera -> 'position' ->> 1)::float8) <= 90
+THEN ST_SetSRID(ST_MakePoint(
+        (camera -> 'position' ->> 0)::float8,
+        (camera -> 'position' ->> 1)::float8,
+        COALESCE((camera -> 'position' ->> 2)::float8, 0)
+     ), 4326)::geography
+END
+"""
+
 class Plan(Base):
     __tablename__ = "plans"
 
@@ -18,6 +33,26 @@ class Plan(Base):
     user_id = Column(UUID(as_uuid=True), nullable=False, index=True)  # 添加用户ID字段
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # 相机位置的空间列（PostGIS生成列），只用于空间查询；延迟加载，普通查询不会读取
+    position = deferred(Column(
+        Geography(geometry_type="POINTZ", srid=4326, spatial_index=False),
+        Computed(_CAMERA_POSITION_SQL, persisted=True),
+        nullable=True,
+    ))
+
+    __table_args__ = (
+        # 列表按 (start_time, id) 稳定排序并做游标分页，组合索引让任意一页都是索引范围扫描
+        Index("ix_plans_user_start_id", "user_id", "start_time", "id"),
+        # 管理员跨用户遍历时使用
+        Index("ix_plans_start_id", "start_time", "id"),
+        # 半径查询 (ST_DWithin) 使用的地理索引
+        Index("ix_plans_position", "position", postgresql_using="gist"),
+    )
+    # 插入后不通过 RETURNING 回读服务端生成的列（包括 position），需要时由 refresh 读取非延迟列
+    __mapper_args__ = {"eager_defaults": False}
+
+# 经纬度矩形查询按平面坐标 (position::geometry) 过滤，单独建表达式索引
+Index("ix_plans_position_geom", func.geometry(Plan.__table__.c.position), postgresql_using="gist")
 
 class User(Base):
     __tablename__ = "users"
@@ -26,4 +61,25 @@ class User(Base):
     email = Column(String, nullable=False, index=True)
     password = Column(String, nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class LLMJob(Base):
+    """后台执行的LLM对话任务，状态依次为 pending、running，最后为 succeeded 或 failed"""
+    __tablename__ = "llm_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    query = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    response = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    trace = Column(JSON, nullable=True)  # 对话追踪记录
+    attempts = Column(Integer, nullable=False, default=0)  # 被工作协程领取的次数
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # 工作协程按创建时间领取待执行的任务
+        Index("ix_llm_jobs_status_created", "status", "created_at"),
+    )
@@ -1,17 +1,33 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
+from uuid import UUID
 
 class LLMRequest(BaseModel):
     query: str = Field(..., description="用户的问题或请求", min_length=1, max_length=2000)
+    debug: bool = Field(False, description="为 true 时在响应中附带本次对话的追踪信息（各轮LLM耗时和token数、各次工具调用耗时）")
 
 class LLMResponse(BaseModel):
     response: str = Field(..., description="LLM的回复内容")
     success: bool = Field(..., description="请求是否成功处理")
     message: str = Field(..., description="状态消息")
     timestamp: Optional[datetime] = Field(default_factory=datetime.now, description="响应时间戳")
+    trace: Optional[dict] = Field(None, description="对话追踪信息，请求中 debug 为 true 时返回")
 
 class LLMHealthResponse(BaseModel):
     status: str = Field(..., description="服务状态")
     service: str = Field(..., description="服务名称")
-    message: str = Field(..., description="健康状态消息")
\ No newline at end of file
+    message: str = Field(..., description="健康状态消息")
+
+class LLMJobResponse(BaseModel):
+    id: UUID = Field(..., description="任务ID")
+    status: str = Field(..., description="任务状态：pending、running、succeeded 或 failed")
+    query: str = Field(..., description="用户的问题或请求")
+    response: Optional[str] = Field(None, description="LLM的回复内容，任务成功后才有")
+    error: Optional[str] = Field(None, description="失败原因，任务失败后才有")
+    trace: Optional[List[dict]] = Field(None, description="对话追踪记录：各轮LLM请求的耗时和token数，各次工具调用的参数、耗时、结果大小和错误")
+    created_at: Optional[datetime] = Field(None, description="提交时间")
+    started_at: Optional[datetime] = Field(None, description="开始执行时间")
+    finished_at: Optional[datetime] = Field(None, description="完成时间")
+
+    model_config = {"from_attributes": True}
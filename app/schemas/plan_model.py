@@ -1,6 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel
-from typing import Tuple, Optional
+from pydantic import BaseModel, Field
+from typing import List, Tuple, Optional
 import uuid
 from uuid import UUID
 
@@ -10,6 +10,12 @@ class Camera(BaseModel):
     position: Tuple[float, float, float]
     rotation: Tuple[float, float, float, float]
 
+# 相机参数的部分更新，只提交需要修改的子字段，在数据库中与原有相机参数合并
+class CameraUpdate(BaseModel):
+    focal_length: Optional[float] = None
+    position: Optional[Tuple[float, float, float]] = None
+    rotation: Optional[Tuple[float, float, float, float]] = None
+
 # 拍摄计划基类
 class PlanBase(BaseModel):
     name: str
@@ -28,7 +34,7 @@ class PlanUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     start_time: Optional[datetime] = None
-    camera: Optional[Camera] = None
+    camera: Optional[CameraUpdate] = None
     tileset_url: Optional[str] = None
     # 注意：更新时不允许修改user_id
 
@@ -41,4 +47,62 @@ class Plan(PlanBase):
     model_config = {
         "from_attributes": True
     }
-    
\ No newline at end of file
+
+# 带过期状态的拍摄计划，is_expired 由数据库计算（开始时间不晚于当前时间）
+class PlanWithStatus(Plan):
+    is_expired: bool
+
+# 拍摄计划摘要（地图/列表视图），只包含必要字段，位置取自 camera.position
+class PlanSummary(BaseModel):
+    id: UUID
+    name: str
+    start_time: datetime
+    position: Optional[Tuple[float, float, float]] = None
+
+# 附近的拍摄计划，distance 为到查询点的球面距离（米）
+class PlanNearby(PlanSummary):
+    distance: float
+
+# 地图聚合中的一个网格簇，position 为簇内计划的平均经纬度
+class PlanCluster(BaseModel):
+    count: int
+    position: Tuple[float, float]
+    sample_ids: List[UUID]
+
+# 地图聚合结果，cell_size 为网格边长（度）
+class PlanClusters(BaseModel):
+    cell_size: float
+    clusters: List[PlanCluster]
+
+# 批量操作单批最多条数
+BULK_MAX_ITEMS = 500
+
+# 批量创建拍摄计划，user_id 会被替换为当前用户
+class PlanBulkCreate(BaseModel):
+    items: List[PlanCreate] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+# 批量更新中的单条，id 指定要更新的计划
+class PlanBulkUpdateItem(PlanUpdate):
+    id: UUID
+
+# 批量更新拍摄计划
+class PlanBulkUpdate(BaseModel):
+    items: List[PlanBulkUpdateItem] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+# 批量删除拍摄计划
+class PlanBulkDelete(BaseModel):
+    ids: List[UUID] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+# 批量操作中单条的结果，index 对应请求中的位置
+class PlanBulkItemResult(BaseModel):
+    index: int
+    success: bool
+    id: Optional[UUID] = None
+    plan: Optional[Plan] = None
+    error: Optional[str] = None
+
+# 批量操作结果
+class PlanBulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[PlanBulkItemResult]
@@ -1,10 +1,14 @@
 import sys
 import pathlib
 sys.path.append(str(pathlib.Path(__file__).parent.parent.parent))
-from typing import Optional
+from typing import Optional, Tuple
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-import bcrypt
+import time
+import hashlib
+import logging
 from jose import JWTError, jwt
 from uuid import UUID
 import uuid
@@ -16,24 +20,42 @@ from app.schemas.auth_model import (
     PasswordChangeRequest, MessageResponse
 )
 
-from app.core.config import ConfigLoader
+from app.core.config import ConfigLoader, settings
+from app.core.cache import create_cache
+from app.core import password as password_hasher
+from app.core.password import PasswordHasherBusy
 
 config = ConfigLoader()
+logger = logging.getLogger(__name__)
 
 # JWT配置
 SECRET_KEY = config.get_env("DREAMCATCHER_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# 认证缓存，每个请求都要校验令牌并读取当前用户，这里省掉JWT解码和一次用户查询
+# - 令牌缓存：sha256(token) -> TokenData，条目在令牌的 exp 时过期，不缓存无效令牌
+# - 用户缓存：user_id -> UserDetailResponse，修改用户信息或密码时失效
+_token_cache = create_cache(
+    "auth_token", settings.AUTH_CACHE_BACKEND, settings.AUTH_CACHE_MAXSIZE,
+    ACCESS_TOKEN_EXPIRE_MINUTES * 60, settings.CACHE_REDIS_URL,
+    dumps=lambda token_data: token_data.model_dump_json(),
+    loads=TokenData.model_validate_json,
+)
+_user_cache = create_cache(
+    "auth_user", settings.AUTH_CACHE_BACKEND, settings.AUTH_CACHE_MAXSIZE,
+    settings.AUTH_CACHE_TTL, settings.CACHE_REDIS_URL,
+    dumps=lambda user: user.model_dump_json(),
+    loads=UserDetailResponse.model_validate_json,
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return password_hasher.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """生成密码哈希"""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    return password_hasher.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建JWT访问令牌"""
@@ -46,8 +68,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[TokenData]:
-    """验证JWT令牌"""
+def _decode_token(token: str) -> Optional[Tuple[TokenData, Optional[float]]]:
+    """解码并校验JWT令牌，返回 (令牌数据, 过期时间戳)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -55,9 +77,38 @@ def verify_token(token: str) -> Optional[TokenData]:
         if user_id is None:
             return None
         token_data = TokenData(user_id=UUID(user_id), email=email)
+        return token_data, payload.get("exp")
+    except (JWTError, ValueError):
+        return None
+
+def verify_token(token: str) -> Optional[TokenData]:
+    """验证JWT令牌"""
+    decoded = _decode_token(token)
+    return decoded[0] if decoded else None
+
+def _token_key(token: str) -> str:
+    """令牌缓存的键，不在缓存中保存令牌原文"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+async def verify_token_async(token: str) -> Optional[TokenData]:
+    """验证JWT令牌，有效的令牌按摘要缓存到其过期时间为止"""
+    key = _token_key(token)
+    token_data = await _token_cache.aget(key)
+    if token_data is not None:
         return token_data
-    except JWTError:
+    decoded = _decode_token(token)
+    if decoded is None:
         return None
+    token_data, exp = decoded
+    # 没有 exp 的令牌按默认有效期缓存；剩余不足1秒的不缓存，避免过期令牌被继续接受
+    remaining = None if exp is None else exp - time.time()
+    if remaining is None or remaining >= 1:
+        await _token_cache.aset(key, token_data, remaining)
+    return token_data
+
+async def invalidate_user_async(user_id: UUID) -> None:
+    """用户信息或密码变更后使缓存的用户信息失效"""
+    await _user_cache.adelete(user_id)
 
 def get_user_by_id(db: Session, user_id: UUID) -> Optional[UserModel]:
     """根据用户ID获取用户"""
@@ -123,6 +174,7 @@ def update_user(db: Session, user_id: UUID, user_update: UserUpdate) -> Optional
     
     db.commit()
     db.refresh(db_user)
+    _user_cache.delete(user_id)
     return db_user
 
 def change_password(db: Session, user_id: UUID, password_change: PasswordChangeRequest) -> bool:
@@ -138,6 +190,7 @@ def change_password(db: Session, user_id: UUID, password_change: PasswordChangeR
     # 更新密码
     db_user.password = get_password_hash(password_change.new_password)
     db.commit()
+    _user_cache.delete(user_id)
     return True
 
 def register_user(db: Session, user_create: UserCreate) -> RegisterResponse:
@@ -188,3 +241,160 @@ def get_current_user(db: Session, token: str) -> Optional[UserModel]:
     
     user = get_user_by_id(db, token_data.user_id)
     return user
+
+# ===== 异步版本，供 async def 路由配合 get_async_db 使用 =====
+
+async def get_user_by_id_async(db: AsyncSession, user_id: UUID) -> Optional[UserModel]:
+    """根据用户ID获取用户（异步）"""
+    if db is None:
+        raise ValueError("数据库会话不能为空")
+    result = await db.execute(select(UserModel).where(UserModel.user_id == user_id))
+    return result.scalars().first()
+
+async def get_user_by_email_async(db: AsyncSession, email: str) -> Optional[UserModel]:
+    """根据邮箱获取用户（异步）"""
+    if db is None:
+        raise ValueError("数据库会话不能为空")
+    result = await db.execute(select(UserModel).where(UserModel.email == email))
+    return result.scalars().first()
+
+async def authenticate_user_async(db: AsyncSession, email: str, password: str) -> Optional[UserModel]:
+    """
+    验证用户登录（异步），bcrypt 在进程池中执行
+
+    存储的哈希 cost 与当前配置不一致时，顺带用当前配置重新哈希并保存
+    """
+    user = await get_user_by_email_async(db, email)
+    if not user:
+        return None
+    if not await password_hasher.verify_password_async(password, user.password):
+        return None
+    if password_hasher.needs_rehash(user.password):
+        try:
+            user.password = await password_hasher.hash_password_async(password)
+            await db.commit()
+        except PasswordHasherBusy:
+            # 升级哈希不影响本次登录，下次登录再试
+            logger.info(f"密码哈希进程池繁忙，跳过用户 {user.user_id} 的哈希升级")
+    return user
+
+async def create_user_async(db: AsyncSession, user: UserCreate) -> UserModel:
+    """创建新用户（异步）"""
+    db_user = await get_user_by_email_async(db, str(user.email))
+    if db_user:
+        raise ValueError("邮箱已被注册")
+    
+    hashed_password = await password_hasher.hash_password_async(user.password)
+    db_user = UserModel(
+        user_name=user.user_name,
+        email=str(user.email),
+        password=hashed_password,
+        user_id=uuid.uuid4()
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+async def update_user_async(db: AsyncSession, user_id: UUID, user_update: UserUpdate) -> Optional[UserModel]:
+    """更新用户信息（异步）"""
+    db_user = await get_user_by_id_async(db, user_id)
+    if not db_user:
+        return None
+    
+    update_data = user_update.dict(exclude_unset=True)
+    
+    if "email" in update_data:
+        existing_user = await get_user_by_email_async(db, update_data["email"])
+        if existing_user and existing_user.user_id != user_id:
+            raise ValueError("邮箱已被其他用户使用")
+    
+    if "password" in update_data:
+        update_data["password"] = await password_hasher.hash_password_async(update_data["password"])
+    
+    for key, value in update_data.items():
+        setattr(db_user, key, value)
+    
+    await db.commit()
+    await db.refresh(db_user)
+    await invalidate_user_async(user_id)
+    return db_user
+
+async def change_password_async(db: AsyncSession, user_id: UUID, password_change: PasswordChangeRequest) -> bool:
+    """修改密码（异步）"""
+    db_user = await get_user_by_id_async(db, user_id)
+    if not db_user:
+        return False
+    
+    if not await password_hasher.verify_password_async(password_change.old_password, db_user.password):
+        return False
+    
+    db_user.password = await password_hasher.hash_password_async(password_change.new_password)
+    await db.commit()
+    await invalidate_user_async(user_id)
+    return True
+
+async def register_user_async(db: AsyncSession, user_create: UserCreate) -> RegisterResponse:
+    """用户注册（异步）"""
+    db_user = await create_user_async(db, user_create)
+    user_response = UserResponse(
+        user_id=db_user.user_id,
+        user_name=db_user.user_name,
+        email=db_user.email
+    )
+    return RegisterResponse(user=user_response, message="注册成功")
+
+async def login_user_async(db: AsyncSession, login_request: LoginRequest) -> LoginResponse:
+    """用户登录（异步）"""
+    user = await authenticate_user_async(db, str(login_request.email), login_request.password)
+    if not user:
+        raise ValueError("邮箱或密码错误")
+    
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": str(user.user_id), "email": user.email}, 
+        expires_delta=access_token_expires
+    )
+    
+    user_response = UserResponse(
+        user_id=user.user_id,
+        user_name=user.user_name,
+        email=user.email
+    )
+    
+    token = Token(
+        access_token=access_token,
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    )
+    
+    return LoginResponse(user=user_response, token=token, message="登录成功")
+
+async def get_user_cached_async(db: AsyncSession, user_id: UUID) -> Optional[UserDetailResponse]:
+    """获取用户信息，优先读缓存，未命中时查库并写入缓存"""
+    user = await _user_cache.aget(user_id)
+    if user is not None:
+        return user
+    db_user = await get_user_by_id_async(db, user_id)
+    if db_user is None:
+        return None
+    user = UserDetailResponse.model_validate(db_user)
+    await _user_cache.aset(user_id, user)
+    return user
+
+async def get_current_user_async(db: AsyncSession, token: str) -> Optional[UserDetailResponse]:
+    """根据JWT令牌获取当前用户（异步），令牌和用户信息均走缓存"""
+    token_data = await verify_token_async(token)
+    if token_data is None:
+        return None
+    
+    return await get_user_cached_async(db, token_data.user_id)
+
+async def get_current_user_id_async(token: str) -> Optional[UUID]:
+    """
+    只校验令牌并返回其中的用户ID，不查询数据库
+
+    令牌签发后被删除的用户在令牌过期前仍能通过校验，需要确认用户存在的端点使用 get_current_user_async
+    """
+    token_data = await verify_token_async(token)
+    return token_data.user_id if token_data else None
@@ -0,0 +1,151 @@
+"""
+LLM对话的快速路径
+
+"列出我的计划"、"现在几点"这类请求占了 /llm/chat 的很大一部分，答案可以直接由
+plan_service / get_current_time 确定。这里在调用LLM之前用规则识别这几种意图并按模板回复：
+
+- 只处理只读的意图；删除、修改计划等写操作即使句式简单也交给LLM，规则无法可靠识别否定
+  （如"不要删除xx计划"）和确认语义
+- 只匹配整句都是该意图的短请求，带有其他要求的请求（如"列出我的计划再新建一个"）不会命中
+- 任何一步不确定或出错都返回 None，由调用方回退到LLM
+
+命中率和节省的耗时见 /metrics 中的 llm_fast_path_* 指标；节省的耗时按成功LLM对话的平均耗时
+（llm_chat_seconds）减去快速路径的耗时估算。
+"""
+import re
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.services import plan_service
+from app.services.llm_service import LLM_CHAT_SECONDS, get_current_time
+
+logger = logging.getLogger(__name__)
+
+FAST_PATH_TOTAL = registry.counter(
+    "llm_fast_path_total",
+    "LLM对话请求的意图识别结果，intent 为 none 表示未识别；result 为 hit、fallback 或 error",
+    ["intent", "result"],
+)
+FAST_PATH_SECONDS = registry.histogram(
+    "llm_fast_path_seconds", "快速路径直接回复的耗时（秒）", ["intent"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+FAST_PATH_SAVED = registry.counter(
+    "llm_fast_path_saved_seconds_total", "快速路径相对LLM对话平均耗时估算节省的总秒数",
+)
+
+# 超过这个长度的请求通常带有其他要求，直接交给LLM
+_MAX_QUERY_LENGTH = 40
+# 列出计划时最多展示的条数
+_LIST_LIMIT = 20
+
+_PREFIX = re.compile(r"^(请问|请|麻烦|帮我|帮忙|你|能不能|可以|可不可以|给我)+")
+_SUFFIX = re.compile(r"(吧|呢|呀|啊|嘛|吗|谢谢)+$")
+_PUNCTUATION = re.compile(r"[\s，,。.！!？?~～]+")
+
+_TIME_PATTERNS = [
+    re.compile(r"(现在|当前|目前|今天)?(是)?(几点(了|钟)?|什么时间|(北京)?时间(是)?(多少|几点)?|几号|星期几|周几)"),
+    re.compile(r"whattimeisit(now)?", re.IGNORECASE),
+]
+_LIST_PATTERNS = [
+    re.compile(r"(列出|查看|看看|看一下|看下|显示|查询|查一下|查下)?(一下)?我(的)?(所有|全部)?(的)?(拍摄)?计划(列表)?(有哪些|有什么|都有哪些|都有什么)?"),
+    re.compile(r"我(有|的)(哪些|什么|几个|多少)(拍摄)?计划"),
+    re.compile(r"(list|show)(all)?myplans", re.IGNORECASE),
+]
+
+
+def _normalize(query: str) -> str:
+    """去掉空白、标点和客套的前后缀"""
+    text = _PUNCTUATION.sub("", query)
+    text = _PREFIX.sub("", text)
+    return _SUFFIX.sub("", text)
+
+
+def classify(query: str) -> Optional[str]:
+    """识别请求的意图：current_time、list_plans 或 None（未识别）"""
+    if len(query) > _MAX_QUERY_LENGTH:
+        return None
+    text = _normalize(query)
+    if not text:
+        return None
+    if any(p.fullmatch(text) for p in _TIME_PATTERNS):
+        return "current_time"
+    if any(p.fullmatch(text) for p in _LIST_PATTERNS):
+        return "list_plans"
+    return None
+
+
+def _format_time(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(ZoneInfo("Asia/Shanghai")).strftime("%Y-%m-%d %H:%M")
+
+
+def _reply_current_time() -> Optional[str]:
+    current = get_current_time()
+    if current == "时间获取失败":
+        return None
+    return f"现在是北京时间 {current}。"
+
+
+async def _reply_list_plans(db: AsyncSession, user_id: UUID) -> str:
+    plans, next_cursor = await plan_service.get_plans_page_async(db, user_id, limit=_LIST_LIMIT, summary=True)
+    if not plans:
+        return "您还没有创建任何拍摄计划。"
+    now = datetime.now(timezone.utc)
+    lines = ["您的拍摄计划如下（按开始时间排序）："]
+    for i, plan in enumerate(plans, 1):
+        expired = "（已过期）" if plan.start_time <= now else ""
+        lines.append(f"{i}. {plan.name}，开始时间 {_format_time(plan.start_time)}{expired}")
+    if next_cursor:
+        lines.append(f"以上为前 {_LIST_LIMIT} 个计划，更多计划请在计划列表中查看。")
+    return "\n".join(lines)
+
+
+async def try_fast_path(db: AsyncSession, user_id: UUID, query: str) -> Optional[str]:
+    """
+    尝试不经过LLM直接回复，返回回复文本；未识别或不确定时返回 None，调用方应回退到LLM
+
+    返回前结束未提交的只读事务，回退到LLM时不会在整个对话期间占用数据库连接
+    """
+    if not settings.LLM_FAST_PATH_ENABLED:
+        return None
+    intent = classify(query)
+    if intent is None:
+        FAST_PATH_TOTAL.inc(intent="none", result="fallback")
+        return None
+
+    start = time.perf_counter()
+    try:
+        if intent == "current_time":
+            reply = _reply_current_time()
+        else:
+            reply = await _reply_list_plans(db, user_id)
+    except Exception as e:
+        logger.error(f"快速路径处理失败，回退到LLM: 意图 {intent}, 错误: {str(e)}")
+        FAST_PATH_TOTAL.inc(intent=intent, result="error")
+        return None
+    finally:
+        if db.in_transaction():
+            await db.rollback()
+
+    if reply is None:
+        FAST_PATH_TOTAL.inc(intent=intent, result="fallback")
+        return None
+
+    elapsed = time.perf_counter() - start
+    FAST_PATH_TOTAL.inc(intent=intent, result="hit")
+    FAST_PATH_SECONDS.observe(elapsed, intent=intent)
+    llm_count = LLM_CHAT_SECONDS.count()
+    if llm_count:
+        FAST_PATH_SAVED.inc(max(LLM_CHAT_SECONDS.sum() / llm_count - elapsed, 0.0))
+    logger.info(f"快速路径命中: 用户 {user_id}, 意图 {intent}, 耗时 {elapsed * 1000:.1f}ms")
+    return reply
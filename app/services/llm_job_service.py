@@ -0,0 +1,291 @@
+"""
+后台LLM对话任务
+
+搜索、读取网页再修改多个计划的长对话经常超过反向代理的超时（nginx/conf.d/api.conf）。
+POST /llm/jobs 只把请求写入 llm_jobs 表并立即返回任务ID，由工作协程在后台执行对话，
+回复和对话追踪记录写回数据库，客户端通过 GET /llm/jobs/{id} 查询（可长轮询等待）。
+
+- 每个进程启动 LLM_JOB_WORKERS 个工作协程，用 FOR UPDATE SKIP LOCKED 领取任务，多进程部署时不会重复执行；
+  同一用户已有执行中的任务时先领取其他用户的任务
+- 对话仍通过 chat_async 执行，共用全局并发上限和上游额度；并发受限时等待后重试，总耗时不超过 LLM_JOB_TIMEOUT
+- 进程异常退出时任务停留在 running，超过 LLM_JOB_TIMEOUT 后由其他工作协程重新领取，
+  最多执行 LLM_JOB_MAX_ATTEMPTS 次；正常关闭时执行中的任务放回队列
+- 已完成的任务保留 LLM_JOB_RETENTION_DAYS 天
+"""
+import json
+import time
+import asyncio
+import logging
+from datetime import timedelta
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import and_, delete, exists, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.concurrency import ConcurrencyLimitExceeded
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db import AsyncSessionLocal
+from app.models import LLMJob
+from app.services.intent_service import try_fast_path
+from app.services.llm_service import LLMChatTimeout, chat_async
+
+logger = logging.getLogger(__name__)
+
+LLM_JOBS_TOTAL = registry.counter(
+    "llm_jobs_total", "后台对话任务的结束次数，status 为 succeeded、failed 或 requeued（关闭时放回队列）", ["status"],
+)
+LLM_JOB_QUEUE_SECONDS = registry.histogram(
+    "llm_job_queue_seconds", "后台对话任务从提交到开始执行的耗时（秒）",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+LLM_JOB_SECONDS = registry.histogram(
+    "llm_job_seconds", "后台对话任务的执行耗时（秒）", ["status"],
+    buckets=(1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+# 任务开始执行超过 LLM_JOB_TIMEOUT + 该秒数仍为 running，视为执行它的进程已退出
+_STALE_MARGIN = 60
+# 清理已完成任务和中断任务的间隔（秒）
+_CLEANUP_INTERVAL = 600
+# 长轮询查询任务状态的间隔（秒）
+_WAIT_POLL_INTERVAL = 0.5
+
+# 提交任务后唤醒本进程的工作协程；其他进程的工作协程按 LLM_JOB_POLL_INTERVAL 轮询
+_wakeup: Optional[asyncio.Event] = None
+_workers: List[asyncio.Task] = []
+
+
+def _stale_before():
+    return func.now() - timedelta(seconds=settings.LLM_JOB_TIMEOUT + _STALE_MARGIN)
+
+
+async def create_job_async(db: AsyncSession, user_id: UUID, query: str) -> LLMJob:
+    """
+    提交后台对话任务
+
+    用户未完成（pending/running）的任务达到 LLM_JOB_MAX_PENDING_PER_USER 时抛出 ConcurrencyLimitExceeded（429）
+    """
+    unfinished = await db.scalar(
+        select(func.count()).select_from(LLMJob).where(LLMJob.user_id == user_id, LLMJob.status.in_((PENDING, RUNNING)))
+    )
+    if unfinished >= settings.LLM_JOB_MAX_PENDING_PER_USER:
+        raise ConcurrencyLimitExceeded(429, "您未完成的任务太多，请稍后再提交", settings.LLM_RETRY_AFTER)
+
+    job = LLMJob(user_id=user_id, query=query, status=PENDING, attempts=0)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    if _wakeup is not None:
+        _wakeup.set()
+    logger.info(f"已提交后台对话任务: {job.id}, 用户 {user_id}")
+    return job
+
+
+async def get_job_async(db: AsyncSession, job_id: UUID, user_id: UUID) -> Optional[LLMJob]:
+    """获取用户的任务，不存在或不属于该用户时返回 None；每次都从数据库读取最新状态"""
+    stmt = (
+        select(LLMJob)
+        .where(LLMJob.id == job_id, LLMJob.user_id == user_id)
+        .execution_options(populate_existing=True)
+    )
+    return (await db.execute(stmt)).scalars().first()
+
+
+async def wait_job_async(db: AsyncSession, job_id: UUID, user_id: UUID, timeout: float) -> Optional[LLMJob]:
+    """
+    获取任务，任务未完成时最多等待 timeout 秒
+
+    每次查询后结束事务，等待期间不占用数据库连接
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        job = await get_job_async(db, job_id, user_id)
+        # 分离后 rollback 不会让对象过期，返回后仍可直接读取属性
+        if job is not None:
+            db.expunge(job)
+        await db.rollback()
+        remaining = deadline - loop.time()
+        if job is None or job.status in FINISHED_STATUSES or remaining <= 0:
+            return job
+        await asyncio.sleep(min(_WAIT_POLL_INTERVAL, remaining))
+
+
+async def _claim_next(db: AsyncSession):
+    """
+    领取一个任务并标记为 running，没有可执行的任务时返回 None
+
+    可执行的任务：pending，或 running 但已超时（执行它的进程已退出）且执行次数未达上限；
+    优先领取当前没有执行中任务的用户的任务，按提交时间排序
+    """
+    stale_before = _stale_before()
+    other = aliased(LLMJob)
+    user_busy = exists().where(
+        other.user_id == LLMJob.user_id, other.status == RUNNING, other.started_at >= stale_before,
+    )
+    candidate = (
+        select(LLMJob.id)
+        .where(
+            or_(LLMJob.status == PENDING, and_(LLMJob.status == RUNNING, LLMJob.started_at < stale_before)),
+            LLMJob.attempts < settings.LLM_JOB_MAX_ATTEMPTS,
+        )
+        .order_by(user_busy, LLMJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True, of=LLMJob)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(LLMJob)
+        .where(LLMJob.id == candidate)
+        .values(status=RUNNING, started_at=func.now(), attempts=LLMJob.attempts + 1)
+        .returning(LLMJob.id, LLMJob.user_id, LLMJob.query, LLMJob.created_at, LLMJob.started_at)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(stmt)).first()
+    await db.commit()
+    return row
+
+
+async def _finish(job_id: UUID, values: dict) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(LLMJob).where(LLMJob.id == job_id).values(**values).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+def _json_trace(trace: List[dict]) -> List[dict]:
+    """工具参数来自LLM输出，个别类型（如元组）转换为JSON可保存的形式"""
+    return json.loads(json.dumps(trace, ensure_ascii=False, default=str))
+
+
+async def _run(job, trace: List[dict]) -> str:
+    """执行任务中的对话，返回回复；并发受限时等待后重试，总耗时超过 LLM_JOB_TIMEOUT 抛出 LLMChatTimeout"""
+    async with AsyncSessionLocal() as db:
+        reply = await try_fast_path(db, job.user_id, job.query)
+    if reply is not None:
+        return reply
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.LLM_JOB_TIMEOUT
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise LLMChatTimeout(f"任务超过 {settings.LLM_JOB_TIMEOUT:g} 秒未完成")
+        try:
+            return await chat_async(str(job.user_id), job.query, timeout=remaining, trace=trace)
+        except ConcurrencyLimitExceeded as e:
+            await asyncio.sleep(min(e.retry_after, remaining))
+
+
+async def _execute(job) -> None:
+    """执行领取到的任务并保存结果"""
+    LLM_JOB_QUEUE_SECONDS.observe(max((job.started_at - job.created_at).total_seconds(), 0.0))
+    start = time.perf_counter()
+    trace: List[dict] = []
+    try:
+        values = {"status": SUCCEEDED, "response": await _run(job, trace), "error": None}
+    except asyncio.CancelledError:
+        # 应用关闭：放回队列，不计入执行次数，由其他进程或重启后重新执行
+        await _finish(job.id, {"status": PENDING, "started_at": None, "attempts": LLMJob.attempts - 1})
+        LLM_JOBS_TOTAL.inc(status="requeued")
+        logger.info(f"应用关闭，后台对话任务已放回队列: {job.id}")
+        raise
+    except LLMChatTimeout as e:
+        logger.warning(f"后台对话任务超时: {job.id}, {str(e)}")
+        values = {"status": FAILED, "error": "请求超时"}
+    except Exception:
+        # 详细错误只写入日志，任务的 error 字段会返回给客户端
+        logger.exception(f"后台对话任务失败: {job.id}")
+        values = {"status": FAILED, "error": "服务错误"}
+
+    # 失败的任务同样保存已完成的LLM请求和工具调用，便于排查
+    await _finish(job.id, {**values, "trace": _json_trace(trace), "finished_at": func.now()})
+    LLM_JOBS_TOTAL.inc(status=values["status"])
+    LLM_JOB_SECONDS.observe(time.perf_counter() - start, status=values["status"])
+    logger.info(f"后台对话任务完成: {job.id}, 状态 {values['status']}, 耗时 {time.perf_counter() - start:.1f}s")
+
+
+async def _cleanup() -> None:
+    """把执行次数已用完的中断任务标记为失败，删除超过保留期的已完成任务"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(LLMJob)
+            .where(
+                LLMJob.status == RUNNING,
+                LLMJob.started_at < _stale_before(),
+                LLMJob.attempts >= settings.LLM_JOB_MAX_ATTEMPTS,
+            )
+            .values(status=FAILED, error="任务执行中断", finished_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            delete(LLMJob)
+            .where(
+                LLMJob.status.in_(FINISHED_STATUSES),
+                LLMJob.finished_at < func.now() - timedelta(days=settings.LLM_JOB_RETENTION_DAYS),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def _worker(index: int) -> None:
+    """工作协程：领取并执行任务，没有任务时等待唤醒或轮询；0号协程负责定期清理"""
+    last_cleanup = 0.0
+    while True:
+        try:
+            if index == 0 and time.monotonic() - last_cleanup >= _CLEANUP_INTERVAL:
+                last_cleanup = time.monotonic()
+                await _cleanup()
+            # 先清除唤醒标记再查询，查询期间提交的任务不会错过
+            _wakeup.clear()
+            async with AsyncSessionLocal() as db:
+                job = await _claim_next(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"领取后台对话任务失败: {str(e)}")
+            job = None
+
+        if job is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), settings.LLM_JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _execute(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 保存结果失败时任务仍是运行中，超时后会被重新领取或由清理标记为失败
+            logger.error(f"保存后台对话任务结果失败: {job.id}, 错误: {str(e)}")
+
+
+def start_job_workers() -> None:
+    """启动本进程的工作协程，应用启动时调用；LLM_JOB_WORKERS 为0时本进程只接收任务、不执行"""
+    global _wakeup
+    if _workers or settings.LLM_JOB_WORKERS <= 0:
+        return
+    _wakeup = asyncio.Event()
+    for i in range(settings.LLM_JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker(i), name=f"llm-job-{i}"))
+    logger.info(f"已启动 {settings.LLM_JOB_WORKERS} 个后台对话任务工作协程")
+
+
+async def stop_job_workers() -> None:
+    """停止工作协程，执行中的任务放回队列，应用退出时调用"""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -2,13 +2,20 @@ import sys
 import pathlib
 sys.path.append(str(pathlib.Path(__file__).parent.parent.parent))
 from zoneinfo import ZoneInfo
-from app.core.config import ConfigLoader
+from app.core.config import ConfigLoader, settings
+from app.core.concurrency import ConcurrencyLimiter
+from app.core.metrics import registry
 import datetime
 import logging
-from typing import List
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 import threading
 import time
 import random
+import functools
+import contextvars
+from contextlib import contextmanager
+from types import SimpleNamespace
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -18,12 +25,11 @@ config_loader = ConfigLoader()
 project_root = config_loader.project_root
 logger.info(f"项目根路径: {project_root}")
 
-from SimpleLLMFunc import OpenAICompatible
+from app.core.llm_router import LLMRouter
 
 try:
-    # 从配置文件加载模型接口
-    # llm_interface = OpenAICompatible.load_from_json_file(project_root / "configs" / "provider.json")["volc_engine"]["deepseek-v3-250324"]
-    llm_interface = OpenAICompatible.load_from_json_file(project_root / "configs" / "provider.json")["dreamcatcher"]["gemini-2.5-pro-exp-03-25"]
+    # 从配置文件加载全部模型，按耗时和健康状态路由；默认模型由 LLM_DEFAULT_MODEL 指定
+    llm_interface = LLMRouter(project_root / "configs" / "provider.json", settings.LLM_DEFAULT_MODEL)
     logger.info("LLM接口加载成功")
     logger.info(f"基础URL: {llm_interface.base_url}")
     logger.info(f"模型名称: {llm_interface.model_name}")
@@ -33,43 +39,393 @@ except Exception as e:
 
 from SimpleLLMFunc import tool
 import app.services.plan_service as plan_service
+from app.services.util_service import is_gaode_success
+from app.core.external_cache import cached_call
+from app.core.fetch import fetch_text
+from app.core.text import estimate_tokens
 import app.services.auth_service as auth_service
 from app.db import SessionLocal
 import asyncio
 import requests
-from app.schemas.plan_model import PlanCreate, PlanUpdate, Camera
+from app.schemas.plan_model import PlanCreate, PlanUpdate, Camera, CameraUpdate
 import uuid
 import json
 from duckduckgo_search import DDGS
 
 GAODE_API_KEY = config_loader.get_env("GAODE_API_KEY")
 
-# 线程本地存储，用于统一的数据库连接管理
-thread_local = threading.local()
+@contextmanager
+def tool_db_session():
+    """
+    为单次工具调用从连接池取一个短生命周期的会话，调用结束即归还连接
 
-def get_db_session():
-    """获取当前线程的数据库会话"""
-    if not hasattr(thread_local, 'db_session') or thread_local.db_session is None:
-        thread_local.db_session = SessionLocal()
-    return thread_local.db_session
+    对话的大部分时间在等待LLM，按工具调用取连接，长对话不会一直占着一个连接。
+    会话关闭后返回的对象处于分离状态，已加载的属性仍可读取
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# ===== 对话取消与事件 =====
+# 对话在线程池中同步执行，超时或客户端断开时无法中断正在进行的HTTP请求，
+# 只能设置取消标记：下一次请求LLM或调用工具前检查标记并终止对话，避免客户端离开后继续创建、修改计划。
+# 流式对话另外设置事件回调，工具调用的开始/结束和LLM输出的文本片段通过它推送给客户端
+
+class LLMChatCancelled(Exception):
+    """对话已被取消（超时或客户端断开）"""
+
+class LLMChatTimeout(Exception):
+    """对话超过 LLM_TIMEOUT 仍未完成"""
+
+ChatEventSink = Callable[[str, dict], None]
+
+_cancel_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("llm_cancel_event", default=None)
+_event_sink: contextvars.ContextVar[Optional[ChatEventSink]] = contextvars.ContextVar("llm_event_sink", default=None)
+# 对话追踪：每轮LLM请求和每次工具调用各一条记录，见 _trace_llm_turn、_trace_tool_call
+_chat_trace: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar("llm_chat_trace", default=None)
+
+# 工具调用事件中展示给用户的说明
+TOOL_LABELS = {
+    "search": "正在搜索",
+    "fetch": "正在读取网页",
+    "get_position": "正在查询地点",
+    "get_weather": "正在查询天气",
+    "get_current_time": "正在获取当前时间",
+    "get_plans_by_user": "正在查询拍摄计划",
+    "get_nearby_plans": "正在查询附近的拍摄计划",
+    "create_plan": "正在创建拍摄计划",
+    "update_plan": "正在更新拍摄计划",
+    "delete_plan": "正在删除拍摄计划",
+}
+
+def _check_cancelled():
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise LLMChatCancelled("对话已取消")
+
+def _emit(event: str, data: dict):
+    sink = _event_sink.get()
+    if sink is not None:
+        sink(event, data)
+
+def _tool_error(result) -> Optional[str]:
+    """工具返回的 error 字段"""
+    if isinstance(result, list) and len(result) == 1:
+        result = result[0]
+    if isinstance(result, dict) and "error" in result:
+        return str(result["error"])
+    return None
+
+# ===== 对话追踪 =====
+# 每次对话记录各轮LLM请求（耗时、输入/输出token数）和各次工具调用（参数/结果大小、耗时、错误），
+# 同时计入 /metrics 的直方图，用来定位慢的工具和统计token消耗；请求中 debug=true 时记录随响应返回
+
+LLM_TURN_SECONDS = registry.histogram(
+    "llm_turn_seconds", "对话中单轮LLM请求的耗时（秒），不含因上游额度等待的时间",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+LLM_TURN_TOKENS = registry.histogram(
+    "llm_turn_tokens", "对话中单轮LLM请求的token数，kind 为 prompt 或 completion", ["kind"],
+    buckets=(100, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+LLM_TOKENS_TOTAL = registry.counter(
+    "llm_tokens_total", "对话消耗的token总数，kind 为 prompt 或 completion；上游未返回用量时按估算计入", ["kind"],
+)
+LLM_TOOL_SECONDS = registry.histogram(
+    "llm_tool_seconds", "LLM工具调用的耗时（秒）", ["tool"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+LLM_TOOL_ARGS_BYTES = registry.histogram(
+    "llm_tool_args_bytes", "LLM工具调用参数的大小（JSON字节数）", ["tool"],
+    buckets=(64, 256, 1024, 4096, 16384),
+)
+LLM_TOOL_RESULT_BYTES = registry.histogram(
+    "llm_tool_result_bytes", "LLM工具调用结果的大小（字节），结果会放进下一轮的提示词", ["tool"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144),
+)
+LLM_TOOL_ERRORS = registry.counter("llm_tool_errors_total", "LLM工具调用失败的次数", ["tool"])
+
+def _json_size(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+def _trace_append(entry: dict) -> None:
+    trace = _chat_trace.get()
+    if trace is not None:
+        # 并行执行的工具在不同线程中追加，list.append 是原子的
+        trace.append(entry)
+
+def _trace_tool_call(name: str, kwargs: dict, result, error: Optional[str], seconds: float) -> None:
+    args_bytes = _json_size(kwargs)
+    result_bytes = _json_size(result) if result is not None else 0
+    LLM_TOOL_SECONDS.observe(seconds, tool=name)
+    LLM_TOOL_ARGS_BYTES.observe(args_bytes, tool=name)
+    LLM_TOOL_RESULT_BYTES.observe(result_bytes, tool=name)
+    if error is not None:
+        LLM_TOOL_ERRORS.inc(tool=name)
+    _trace_append({
+        "type": "tool",
+        "tool": name,
+        "arguments": kwargs,
+        "args_bytes": args_bytes,
+        "result_bytes": result_bytes,
+        "seconds": round(seconds, 3),
+        "success": error is None,
+        "error": error,
+    })
+
+def _trace_llm_turn(response, prompt_tokens: int, completion_tokens: int, estimated: bool, seconds: float) -> None:
+    LLM_TURN_SECONDS.observe(seconds)
+    LLM_TURN_TOKENS.observe(prompt_tokens, kind="prompt")
+    LLM_TURN_TOKENS.observe(completion_tokens, kind="completion")
+    LLM_TOKENS_TOTAL.inc(prompt_tokens, kind="prompt")
+    LLM_TOKENS_TOTAL.inc(completion_tokens, kind="completion")
+    message = response.choices[0].message
+    _trace_append({
+        "type": "llm",
+        "model": getattr(response, "model", None),
+        "seconds": round(seconds, 3),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "estimated": estimated,
+        "tool_calls": len(message.tool_calls or []),
+    })
+
+def trace_summary(trace: List[dict]) -> dict:
+    """汇总对话追踪记录：LLM轮数、耗时、token数，工具调用次数、耗时和失败次数"""
+    turns = [e for e in trace if e["type"] == "llm"]
+    tools = [e for e in trace if e["type"] == "tool"]
+    return {
+        "llm": {
+            "turns": len(turns),
+            "seconds": round(sum(e["seconds"] for e in turns), 3),
+            "prompt_tokens": sum(e["prompt_tokens"] for e in turns),
+            "completion_tokens": sum(e["completion_tokens"] for e in turns),
+        },
+        "tools": {
+            "calls": len(tools),
+            "seconds": round(sum(e["seconds"] for e in tools), 3),
+            "errors": sum(1 for e in tools if not e["success"]),
+        },
+    }
+
+def trace_payload(trace: List[dict]) -> dict:
+    """debug=true 时随响应返回的追踪信息：汇总加逐条记录，工具参数转换为JSON可序列化的形式"""
+    return {**trace_summary(trace), "steps": json.loads(json.dumps(trace, ensure_ascii=False, default=str))}
+
+def _run_tool(name: str, func, args: tuple, kwargs: dict):
+    """执行工具：检查取消标记，推送工具调用的开始/结束事件，并记录到对话追踪"""
+    _check_cancelled()
+    _emit("tool_start", {"tool": name, "label": TOOL_LABELS.get(name, name)})
+    result = None
+    error = None
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        error = _tool_error(result)
+        return result
+    except BaseException as e:
+        error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        _emit("tool_end", {"tool": name, "success": error is None and result is not None})
+        _trace_tool_call(name, kwargs, result, error, time.perf_counter() - start)
+
+# ===== 工具并行执行 =====
+# SimpleLLMFunc 按顺序逐个执行同一轮中的工具调用。收到LLM响应时，先把其中的只读工具调用提交到线程池并行执行，
+# 框架随后按原顺序调用工具时直接等待对应的结果，一轮的耗时取决于最慢的工具而不是所有工具之和。
+# 写操作（创建、更新、删除计划）之间可能有先后依赖，仍由框架按顺序执行
 
-def close_db_session():
-    """关闭当前线程的数据库会话"""
-    if hasattr(thread_local, 'db_session') and thread_local.db_session is not None:
-        thread_local.db_session.close()
-        thread_local.db_session = None
+READ_ONLY_TOOLS = {
+    "search", "fetch", "get_position", "get_weather", "get_current_time", "get_plans_by_user", "get_nearby_plans",
+}
+
+_tool_registry: Dict[str, Callable] = {}
+_tool_executor = ThreadPoolExecutor(max_workers=settings.LLM_TOOL_WORKERS, thread_name_prefix="llm-tool")
+# 当前对话中已提交并行执行的工具调用：(工具名, 参数JSON) -> [Future]
+_prefetched: contextvars.ContextVar[Optional[Dict[tuple, List[Future]]]] = contextvars.ContextVar("llm_prefetched_tools", default=None)
+
+def _tool_call_key(name: str, arguments: dict) -> tuple:
+    return name, json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str)
+
+def _prefetch_tool_calls(response):
+    """把响应中的只读工具调用提交到线程池；少于2个时顺序执行即可，不提交"""
+    prefetched = _prefetched.get()
+    if prefetched is None:
+        return
+    try:
+        tool_calls = response.choices[0].message.tool_calls or []
+    except (AttributeError, IndexError, TypeError):
+        return
+
+    calls = []
+    for call in tool_calls:
+        name = call.function.name
+        if name not in READ_ONLY_TOOLS or name not in _tool_registry:
+            continue
+        try:
+            arguments = json.loads(call.function.arguments or "{}")
+        except ValueError:
+            continue
+        if isinstance(arguments, dict):
+            calls.append((name, arguments))
+    if len(calls) < 2:
+        return
+
+    logger.info(f"并行执行 {len(calls)} 个工具调用: {[name for name, _ in calls]}")
+    for name, arguments in calls:
+        # 复制上下文，工具线程中同样能检查取消标记、推送事件
+        future = _tool_executor.submit(
+            contextvars.copy_context().run, _run_tool, name, _tool_registry[name], (), arguments
+        )
+        prefetched.setdefault(_tool_call_key(name, arguments), []).append(future)
+
+def _take_prefetched(name: str, kwargs: dict) -> Optional[Future]:
+    prefetched = _prefetched.get()
+    if not prefetched:
+        return None
+    futures = prefetched.get(_tool_call_key(name, kwargs))
+    return futures.pop(0) if futures else None
+
+def _chat_tool(func):
+    """
+    包装工具：已并行执行的调用直接等待结果（超过 LLM_TOOL_TIMEOUT 返回错误），否则就地执行
+
+    functools.wraps 会复制 @tool 附加的 _tool 属性，包装后的函数仍可放入 toolkit
+    """
+    name = func._tool.name
+    _tool_registry[name] = func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        future = None if args else _take_prefetched(name, kwargs)
+        if future is None:
+            return _run_tool(name, func, args, kwargs)
+        try:
+            return future.result(timeout=settings.LLM_TOOL_TIMEOUT)
+        except FutureTimeout:
+            logger.warning(f"工具 {name} 超过 {settings.LLM_TOOL_TIMEOUT} 秒未完成")
+            return {"error": f"工具执行超时（{settings.LLM_TOOL_TIMEOUT}秒）"}
+    return wrapper
+
+def _merge_stream(chunks) -> SimpleNamespace:
+    """
+    把流式响应的分块合并为与非流式响应相同结构的对象，供 SimpleLLMFunc 提取内容和工具调用
+
+    文本片段在合并的同时以 token 事件推送；每个分块之间检查取消标记，
+    客户端断开后关闭流，不再为剩余的输出付费
+    """
+    content = []
+    tool_calls = {}
+    try:
+        for chunk in chunks:
+            _check_cancelled()
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta is None:
+                continue
+            if delta.content:
+                content.append(delta.content)
+                _emit("token", {"text": delta.content})
+            for call in delta.tool_calls or []:
+                merged = tool_calls.setdefault(call.index, {"id": None, "type": "function", "name": "", "arguments": ""})
+                if call.id:
+                    merged["id"] = call.id
+                if call.function is not None:
+                    merged["name"] += call.function.name or ""
+                    merged["arguments"] += call.function.arguments or ""
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+    message = SimpleNamespace(
+        role="assistant",
+        content="".join(content),
+        tool_calls=[
+            SimpleNamespace(
+                id=call["id"], type=call["type"],
+                function=SimpleNamespace(name=call["name"], arguments=call["arguments"] or "{}"),
+            )
+            for _, call in sorted(tool_calls.items())
+        ] or None,
+    )
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message)])
+
+def _estimate_request_tokens(kwargs: dict) -> int:
+    """估算一次LLM请求的输入token数（消息和工具定义）"""
+    payload = {"messages": kwargs.get("messages"), "tools": kwargs.get("tools")}
+    return estimate_tokens(json.dumps(payload, ensure_ascii=False, default=str))
+
+def _response_usage(response, estimated: int) -> Tuple[int, int, bool]:
+    """
+    本次请求的 (输入token数, 输出token数, 是否为估算)
+
+    响应没有 usage（如合并的流式响应）时输入取请求前的估算值，输出按回复内容和工具调用估算
+    """
+    usage = getattr(response, "usage", None)
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if isinstance(prompt, int) and isinstance(completion, int):
+        return prompt, completion, False
+    message = response.choices[0].message
+    output = message.content or ""
+    for call in message.tool_calls or []:
+        output += call.function.name + call.function.arguments
+    return estimated, estimate_tokens(output), True
+
+class _ChatInterface:
+    """
+    LLM接口代理
+
+    每次请求LLM前检查取消标记，请求后把耗时和token数记录到对话追踪；流式对话（设置了事件回调）时改用 chat_stream 请求，
+    合并后的结果与 chat 相同，SimpleLLMFunc 的工具调用循环无需改动；
+    收到响应后把其中的只读工具调用提交并行执行
+    """
+
+    def __init__(self, interface):
+        self._interface = interface
+
+    def __getattr__(self, name):
+        return getattr(self._interface, name)
+
+    def chat(self, *args, **kwargs):
+        _check_cancelled()
+        estimated = _estimate_request_tokens(kwargs)
+        start = time.perf_counter()
+        if _event_sink.get() is not None:
+            kwargs.pop("stream", None)
+            response = _merge_stream(self._interface.chat_stream(*args, tokens=estimated, check=_check_cancelled, **kwargs))
+        else:
+            response = self._interface.chat(*args, tokens=estimated, check=_check_cancelled, **kwargs)
+        prompt_tokens, completion_tokens, is_estimate = _response_usage(response, estimated)
+        _trace_llm_turn(response, prompt_tokens, completion_tokens, is_estimate, time.perf_counter() - start)
+        _prefetch_tool_calls(response)
+        return response
+
+    def chat_stream(self, *args, **kwargs):
+        _check_cancelled()
+        return self._interface.chat_stream(*args, tokens=_estimate_request_tokens(kwargs), check=_check_cancelled, **kwargs)
 
 # llm tool kit
 
+def _ddg_search(query: str, headers: dict) -> List[dict]:
+    """DuckDuckGo 搜索前5个结果，设置中文区域"""
+    with DDGS(headers=headers) as ddgs:
+        return list(ddgs.text(query, region='cn-zh', max_results=5))
+
 @tool(name="search", description="搜索所有你需要的,别的工具无法提供的信息")
-def search(query: str) -> str:
+def search(query: str) -> Union[str, dict]:
     '''
     搜索所有你需要的,别的工具无法提供的信息，使用DuckDuckGo搜索引擎
 
     Args:
         query: 搜索关键词
     Returns:
-        str: 搜索结果，包含标题、链接和描述
+        str: 搜索结果，包含标题、链接和描述；失败时返回包含 error 的字典
     '''
     try:
         logger.info(f"正在搜索: {query}")
@@ -89,15 +445,14 @@ def search(query: str) -> str:
             'Cache-Control': 'max-age=0'
         }
         results = []
-        with DDGS(headers=headers) as ddgs:
-            # 获取前5个搜索结果，设置中文区域
-            search_results = list(ddgs.text(query, region='cn-zh', max_results=5))
-            for i, result in enumerate(search_results, 1):
-                title = result.get('title', '无标题')
-                body = result.get('body', '无描述')
-                href = result.get('href', '无链接')
+        # 空结果可能是被限流，不缓存
+        search_results = cached_call("ddg_search", query.strip(), _ddg_search, query, headers, cacheable=bool)
+        for i, result in enumerate(search_results, 1):
+            title = result.get('title', '无标题')
+            body = result.get('body', '无描述')
+            href = result.get('href', '无链接')
 
-                results.append(f"{i}. 标题: {title}\n   链接: {href}\n   描述: {body}\n")
+            results.append(f"{i}. 标题: {title}\n   链接: {href}\n   描述: {body}\n")
 
         if results:
             search_summary = f"搜索 '{query}' 的结果:\n\n" + "\n".join(results)
@@ -109,24 +464,29 @@ def search(query: str) -> str:
 
     except Exception as e:
         logger.error(f"搜索异常: {query}, 错误: {str(e)}")
-        return f"搜索时发生错误: {str(e)}"
+        return {"error": f"搜索时发生错误: {str(e)}"}
 
-@tool(name="fetch", description="fetch 一个url, 返回url的内容")
-def fetch(url : str) -> str:
+@tool(name="fetch", description="fetch 一个url, 返回网页的标题和正文文本")
+def fetch(url : str) -> Union[str, dict]:
     '''
-    fetch 一个url, 返回url的内容
+    fetch 一个url, 返回网页的标题和正文文本（已去掉脚本、导航等，过长时截断）
     Args:
-        url: 需要fetch的url
+        url: 需要fetch的url，只支持 http/https
     Returns:
-        str: url的内容
+        str: 网页的正文文本；失败时返回包含 error 的字典
     '''
     try:
         logger.info(f"正在fetch: {url}")
-        response = requests.get(url, timeout=10)
-        return response.text
+        return fetch_text(url)
     except Exception as e:
         logger.error(f"fetch异常: {url}, 错误: {str(e)}")
-        return f"fetch时发生错误: {str(e)}"
+        return {"error": f"fetch时发生错误: {str(e)}"}
+
+def _gaode_inputtips(name: str) -> dict:
+    tips_url = "https://restapi.amap.com/v3/assistant/inputtips"
+    tips_response = requests.get(tips_url, params={"key": GAODE_API_KEY, "keywords": name}, timeout=10)
+    tips_response.raise_for_status()
+    return tips_response.json()
 
 @tool(name="get_position", description="从地点名称，获取经纬度")
 def get_positions(name : str) -> dict:
@@ -139,10 +499,8 @@ def get_positions(name : str) -> dict:
     '''
     try:
         logger.info(f"正在查询地点: {name}")
-        tips_url = f"https://restapi.amap.com/v3/assistant/inputtips?key={GAODE_API_KEY}&keywords={name}"
-        tips_response = requests.get(tips_url, timeout=10)
-        tips_data = tips_response.json()
-        return tips_data
+        # 与 /util/position 共用缓存
+        return cached_call("gaode_inputtips", name.strip(), _gaode_inputtips, name, cacheable=is_gaode_success)
     except Exception as e:
         logger.error(f"地点查询异常: {name}, 错误: {str(e)}")
         return {"error": f"地点查询失败: {str(e)}"}
@@ -204,9 +562,9 @@ def get_plans_by_user(user_id : str) -> List[dict]:
     '''
     try:
         logger.info(f"正在查询用户计划: {user_id}")
-        db = get_db_session()
         user_id_uuid = uuid.UUID(user_id)
-        plans = plan_service.get_plans_by_user(db, user_id_uuid)
+        with tool_db_session() as db:
+            plans = plan_service.get_plans_by_user(db, user_id_uuid)
         
         # 将计划对象转换为字典列表
         plans_dict = []
@@ -242,6 +600,41 @@ def get_plans_by_user(user_id : str) -> List[dict]:
         logger.error(f"查询用户计划异常: {user_id}, 错误: {str(e)}")
         return [{"error": f"查询计划失败: {str(e)}"}]
 
+@tool(name="get_nearby_plans", description="获取某个位置附近的拍摄计划")
+def get_nearby_plans(user_id: str, longitude: float, latitude: float, radius_km: float = 5.0) -> List[dict]:
+    '''
+    获取用户在某个位置附近的拍摄计划,按距离由近到远排序
+    位置的经纬度可以通过get_positions工具获取
+    Args:
+        user_id: 用户ID
+        longitude: 经度
+        latitude: 纬度
+        radius_km: 搜索半径,单位为公里 (可选,默认5公里)
+    Returns:
+        List[dict]: 附近的拍摄计划列表, 包含计划id、名称、开始时间、相机位置和距离(米)
+    '''
+    try:
+        logger.info(f"正在查询附近计划: {user_id}, ({longitude}, {latitude}), {radius_km}km")
+        with tool_db_session() as db:
+            plans = plan_service.get_nearby_plans(db, uuid.UUID(user_id), longitude, latitude, radius_km * 1000)
+        
+        plans_dict = [
+            {
+                "id": str(plan.id),
+                "name": plan.name,
+                "start_time": plan.start_time.isoformat() if plan.start_time else None,
+                "position": list(plan.position) if plan.position else None,
+                "distance_m": round(plan.distance, 1),
+            }
+            for plan in plans
+        ]
+        logger.info(f"附近计划查询成功: 找到 {len(plans_dict)} 个计划")
+        return plans_dict
+        
+    except Exception as e:
+        logger.error(f"查询附近计划异常: {user_id}, 错误: {str(e)}")
+        return [{"error": f"查询附近计划失败: {str(e)}"}]
+
 @tool(name="create_plan", description="创建拍摄计划")
 def create_plan(name: str, description: str, start_time: str, focal_length: float, position: List[float], rotation: List[float], user_id: str, tileset_url: str = "") -> dict:
     '''
@@ -261,7 +654,6 @@ def create_plan(name: str, description: str, start_time: str, focal_length: floa
     '''
     try:
         logger.info(f"正在创建拍摄计划: {name}")
-        db = get_db_session()
         
         # 解析start_time
         start_time_parsed = None
@@ -285,7 +677,8 @@ def create_plan(name: str, description: str, start_time: str, focal_length: floa
             tileset_url=tileset_url,
             user_id=uuid.UUID(user_id)
         )
-        created_plan = plan_service.create_plan(db, plan)
+        with tool_db_session() as db:
+            created_plan = plan_service.create_plan(db, plan)
         
         # 将创建的计划转换为字典
         result = {
@@ -328,7 +721,6 @@ def update_plan(plan_id: str, name: str = None, description: str = None, start_t
     '''
     try:
         logger.info(f"正在更新拍摄计划: {plan_id}")
-        db = get_db_session()
         
         # 构建更新数据字典，只包含非None的字段
         update_data = {}
@@ -346,33 +738,23 @@ def update_plan(plan_id: str, name: str = None, description: str = None, start_t
         if tileset_url is not None:
             update_data["tileset_url"] = tileset_url
             
-        # 如果相机参数有更新，构建相机对象
-        if focal_length is not None or position is not None or rotation is not None:
-            # 先获取现有计划的相机参数
-            existing_plan = plan_service.get_plan(db, uuid.UUID(plan_id), uuid.UUID(user_id))
-            if not existing_plan:
-                return {"error": "计划不存在或无权限访问", "status": "failed"}
-            
-            # 解析现有相机数据
-            existing_camera = existing_plan.camera
-            if isinstance(existing_camera, str):
-                existing_camera = json.loads(existing_camera)
-            
-            # 使用新值或保留现有值
-            camera_data = {
-                "focal_length": focal_length if focal_length is not None else existing_camera.get("focal_length", 50.0),
-                "position": tuple(position) if position is not None else tuple(existing_camera.get("position", [0, 0, 0])),
-                "rotation": tuple(rotation) if rotation is not None else tuple(existing_camera.get("rotation", [0, 0, 0, 1]))
-            }
-            
-            camera = Camera(**camera_data)
-            update_data["camera"] = camera
+        # 相机参数只提交有更新的子字段，由数据库合并到现有相机参数中
+        camera_data = {}
+        if focal_length is not None:
+            camera_data["focal_length"] = focal_length
+        if position is not None:
+            camera_data["position"] = tuple(position)
+        if rotation is not None:
+            camera_data["rotation"] = tuple(rotation)
+        if camera_data:
+            update_data["camera"] = CameraUpdate(**camera_data)
         
         # 创建更新对象
         plan_update = PlanUpdate(**update_data)
         
         # 执行更新
-        updated_plan = plan_service.update_plan(db, uuid.UUID(plan_id), plan_update, uuid.UUID(user_id))
+        with tool_db_session() as db:
+            updated_plan = plan_service.update_plan(db, uuid.UUID(plan_id), plan_update, uuid.UUID(user_id))
         
         if not updated_plan:
             return {"error": "计划不存在或无权限更新", "status": "failed"}
@@ -423,10 +805,10 @@ def delete_plan(plan_id: str, user_id: str) -> dict:
     '''
     try:
         logger.info(f"正在删除拍摄计划: {plan_id}")
-        db = get_db_session()
         
         # 执行删除操作
-        success = plan_service.delete_plan(db, uuid.UUID(plan_id), uuid.UUID(user_id))
+        with tool_db_session() as db:
+            success = plan_service.delete_plan(db, uuid.UUID(plan_id), uuid.UUID(user_id))
         
         if success:
             result = {
@@ -452,21 +834,94 @@ def delete_plan(plan_id: str, user_id: str) -> dict:
         }
 
 
+# ===== 对话上下文 =====
+# 几乎每次对话LLM都会先调用 get_current_time 和 get_plans_by_user，各多一轮LLM请求；
+# 这里在对话开始前查好当前时间和即将开始的计划摘要，作为 context 参数放进提示词
+
+LLM_CONTEXT_TOKENS = registry.histogram(
+    "llm_context_tokens", "注入提示词的上下文估算token数",
+    buckets=(50, 100, 200, 400, 800, 1600),
+)
+LLM_CONTEXT_TRUNCATED = registry.counter("llm_context_truncated_total", "计划摘要因条数或token预算未列全的对话数")
+LLM_CHAT_ROUNDS = registry.histogram(
+    "llm_chat_rounds", "成功完成的对话请求LLM的轮数", buckets=(1, 2, 3, 4, 6, 8, 12),
+)
+
+# 上下文中计划名称的最大字符数，超出部分截断
+_CONTEXT_NAME_CHARS = 30
+_CONTEXT_MORE = "……还有更多计划未列出，需要时调用 get_plans_by_user 查询"
+
+def _context_plan_line(plan) -> str:
+    name = plan.name if len(plan.name) <= _CONTEXT_NAME_CHARS else plan.name[:_CONTEXT_NAME_CHARS] + "…"
+    start = plan.start_time.astimezone(ZoneInfo("Asia/Shanghai")).strftime("%Y-%m-%d %H:%M")
+    line = f"- {plan.id} | {name} | {start}"
+    if plan.position and len(plan.position) >= 2:
+        line += f" | {plan.position[0]:.4f},{plan.position[1]:.4f}"
+    return line
+
+def build_chat_context(user_id: str) -> str:
+    """
+    生成注入提示词的上下文：当前时间（Asia/Shanghai）和用户即将开始的计划摘要（含ID）
+
+    计划按开始时间从近到远排列，最多 LLM_CONTEXT_MAX_PLANS 条，估算token数超过 LLM_CONTEXT_MAX_TOKENS 时
+    丢弃较远的计划；未列全时在末尾注明，LLM仍可调用 get_plans_by_user。查询失败时只提供时间
+    """
+    now = datetime.datetime.now(tz=ZoneInfo("Asia/Shanghai"))
+    weekdays = "一二三四五六日"
+    lines = [f"当前时间: {now.strftime('%Y-%m-%d %H:%M:%S')} 星期{weekdays[now.weekday()]}（Asia/Shanghai）"]
+    try:
+        with tool_db_session() as db:
+            plans, next_cursor = plan_service.get_plans_page(
+                db, uuid.UUID(user_id), limit=settings.LLM_CONTEXT_MAX_PLANS, summary=True, expired=False
+            )
+    except Exception as e:
+        logger.error(f"对话上下文查询计划失败: 用户 {user_id}, 错误: {str(e)}")
+        lines.append("即将开始的拍摄计划: 查询失败，需要时调用 get_plans_by_user 查询")
+        return "\n".join(lines)
+
+    if not plans:
+        lines.append("即将开始的拍摄计划: 无（已过期的计划未列出）")
+        return "\n".join(lines)
+
+    lines.append("即将开始的拍摄计划（按开始时间排序，已过期的未列出；格式: ID | 名称 | 开始时间 | 经度,纬度）:")
+    # 为末尾的"未列全"说明预留预算
+    budget = settings.LLM_CONTEXT_MAX_TOKENS - estimate_tokens("\n".join(lines)) - estimate_tokens(_CONTEXT_MORE)
+    truncated = next_cursor is not None
+    for plan in plans:
+        line = _context_plan_line(plan)
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            truncated = True
+            break
+        lines.append(line)
+        budget -= cost
+    if truncated:
+        lines.append(_CONTEXT_MORE)
+        LLM_CONTEXT_TRUNCATED.inc()
+    return "\n".join(lines)
+
 # llm interface
 from SimpleLLMFunc import llm_function
 
 @llm_function(
-    llm_interface=llm_interface,
-    toolkit=[search, get_positions, get_weather, get_current_time, get_plans_by_user, create_plan, update_plan, delete_plan, fetch],
+    llm_interface=_ChatInterface(llm_interface),
+    toolkit=[
+        _chat_tool(t)
+        for t in [search, get_positions, get_weather, get_current_time, get_plans_by_user, get_nearby_plans, create_plan, update_plan, delete_plan, fetch]
+    ],
 )
-def llm_service(user_id : str, query : str) -> str:
+def llm_service(user_id : str, context : str, query : str) -> str:
     '''
     你叫Morpheus,是一个专业的拍照计划管理助手，根据用户的请求提供帮助,
     在必要的时候调用工具函数来获取,删除或更新拍摄计划信息。
-    你需要确保计划的创建和更新都不会设置为过去的时间,可以通过get_current_time工具获取当前时间。
+    你需要确保计划的创建和更新都不会设置为过去的时间,context 中给出了当前时间。
+
+    context 是对话开始时已经查好的信息：当前时间和用户即将开始的拍摄计划（含计划ID）。
+    请直接使用其中的时间和计划ID，不要再调用 get_current_time 或 get_plans_by_user；
+    只有 context 注明计划未列全、需要已过期的计划或计划的详细内容时，才调用 get_plans_by_user。
     
     你可以：
-    1. 查询和管理用户的拍摄计划
+    1. 查询和管理用户的拍摄计划，按位置查找附近的拍摄计划
     2. 创建新的拍摄计划
     3. 获取地点的经纬度信息
     4. 查询天气信息
@@ -493,22 +948,181 @@ def llm_service(user_id : str, query : str) -> str:
     
     Args:
         user_id: 用户ID
+        context: 当前时间和用户即将开始的拍摄计划摘要
         query: 用户的请求
     Returns:
         str: 友好的回复，包含你执行的操作和结果,要求清晰的陈述你调用了哪些工具,切记不要直接返回tool返回的内容,而是根据tool的返回结果进行总结后友好的回答用户的请求.
     '''
+    # 这里会被SimpleLLMFunc框架填充实际的LLM逻辑，工具调用各自通过 tool_db_session 获取数据库会话
+    pass
+
+# ===== 对话执行 =====
+# 对话（含多轮工具调用）是同步阻塞的，在独立线程池中执行，不占用事件循环；
+# 线程数等于全局并发上限，超出的请求在 _chat_limiter 中按用户公平排队或被拒绝。
+# 每次请求上游前还要通过所选模型的额度和并发限制（见 llm_router），保证不超过各提供商的每分钟请求数、token数和并发数
+
+_chat_executor = ThreadPoolExecutor(max_workers=settings.LLM_MAX_CONCURRENCY, thread_name_prefix="llm-chat")
+_chat_limiter = ConcurrencyLimiter(
+    "llm_chat",
+    limit=settings.LLM_MAX_CONCURRENCY,
+    per_key_limit=settings.LLM_MAX_CONCURRENCY_PER_USER,
+    max_waiting=settings.LLM_MAX_WAITING,
+    wait_timeout=settings.LLM_QUEUE_TIMEOUT,
+    retry_after=settings.LLM_RETRY_AFTER,
+)
+
+# 检查客户端是否断开的间隔（秒）
+_DISCONNECT_POLL_INTERVAL = 1.0
+
+LLM_CHAT_SECONDS = registry.histogram(
+    "llm_chat_seconds", "成功完成的LLM对话在线程中的执行耗时（秒）",
+    buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+
+def _run_chat(user_id: str, query: str, cancel_event: threading.Event, sink: Optional[ChatEventSink] = None,
+              trace: Optional[List[dict]] = None) -> str:
+    """在线程池中执行一次完整对话；trace 不为 None 时把对话追踪记录追加到其中"""
+    if trace is None:
+        trace = []
+    cancel_token = _cancel_event.set(cancel_event)
+    sink_token = _event_sink.set(sink)
+    trace_token = _chat_trace.set(trace)
+    prefetched = {}
+    prefetched_token = _prefetched.set(prefetched)
+    start = time.perf_counter()
     try:
-        # 在开始处理前创建统一的数据库会话
-        get_db_session()
-        logger.info(f"为用户 {user_id} 创建统一数据库会话")
-        
-        # 这里会被SimpleLLMFunc框架填充实际的LLM逻辑
-        pass
-        
+        context = build_chat_context(user_id)
+        LLM_CONTEXT_TOKENS.observe(estimate_tokens(context))
+        response = llm_service(user_id, context, query)
+        elapsed = time.perf_counter() - start
+        summary = trace_summary(trace)
+        LLM_CHAT_SECONDS.observe(elapsed)
+        LLM_CHAT_ROUNDS.observe(summary["llm"]["turns"])
+        logger.info(
+            f"LLM对话完成: 用户 {user_id}, 耗时 {elapsed:.2f}s, "
+            f"LLM {summary['llm']['turns']} 轮 {summary['llm']['seconds']:.2f}s "
+            f"(输入 {summary['llm']['prompt_tokens']} / 输出 {summary['llm']['completion_tokens']} token), "
+            f"工具 {summary['tools']['calls']} 次 {summary['tools']['seconds']:.2f}s"
+        )
+        return response
     finally:
-        # 确保在处理完成后关闭数据库会话
-        close_db_session()
-        logger.info(f"关闭用户 {user_id} 的数据库会话")
+        # 对话异常结束时可能留有未取用的并行调用，尚未开始的直接取消
+        for futures in prefetched.values():
+            for future in futures:
+                future.cancel()
+        _prefetched.reset(prefetched_token)
+        _chat_trace.reset(trace_token)
+        _event_sink.reset(sink_token)
+        _cancel_event.reset(cancel_token)
+
+async def _start_chat(user_id: str, query: str, sink: Optional[ChatEventSink] = None, trace: Optional[List[dict]] = None):
+    """
+    获取执行名额并在线程池中开始对话，返回 (future, cancel_event)
+
+    并发超限时抛出 ConcurrencyLimitExceeded；执行名额在线程真正结束后才释放
+    """
+    release = await _chat_limiter.acquire(user_id)
+    cancel_event = threading.Event()
+    try:
+        future = asyncio.get_running_loop().run_in_executor(_chat_executor, _run_chat, user_id, query, cancel_event, sink, trace)
+    except BaseException:
+        release()
+        raise
+
+    def _on_done(f):
+        release()
+        # 调用方已放弃等待时，取走异常避免 "exception was never retrieved" 日志
+        if not f.cancelled():
+            f.exception()
+
+    future.add_done_callback(_on_done)
+    return future, cancel_event
+
+async def chat_async(user_id: str, query: str, is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+                     timeout: Optional[float] = None, trace: Optional[List[dict]] = None) -> str:
+    """
+    异步执行LLM对话
+
+    并发超限时抛出 ConcurrencyLimitExceeded；超过 timeout（默认 LLM_TIMEOUT）秒抛出 LLMChatTimeout；
+    is_disconnected 返回 True（客户端已断开）时抛出 LLMChatCancelled。超时和断开都会取消线程中的对话。
+    trace 不为 None 时把对话追踪记录（各轮LLM请求和工具调用）追加到其中
+    """
+    timeout = settings.LLM_TIMEOUT if timeout is None else timeout
+    future, cancel_event = await _start_chat(user_id, query, trace=trace)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise LLMChatTimeout(f"对话超过 {timeout:g} 秒未完成")
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), min(remaining, _DISCONNECT_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    raise LLMChatCancelled("客户端已断开连接")
+    except BaseException:
+        cancel_event.set()
+        raise
+
+ChatEvent = Tuple[str, dict]
+
+async def chat_stream_async(user_id: str, query: str, debug: bool = False) -> AsyncIterator[ChatEvent]:
+    """
+    流式执行LLM对话，返回 (事件名, 数据) 的异步迭代器
+
+    事件依次为 start、若干 tool_start/tool_end/token，最后是 done（完整回复，debug 时附带 trace）或 error。
+    并发超限时在返回迭代器之前抛出 ConcurrencyLimitExceeded，调用方可以直接返回429/503；
+    迭代器被关闭（客户端断开）时取消线程中的对话
+    """
+    trace: List[dict] = []
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def sink(event: str, data: dict):
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    future, cancel_event = await _start_chat(user_id, query, sink, trace)
+    # 对话结束的回调在所有事件之后入队（同为 call_soon_threadsafe，按顺序执行）
+    future.add_done_callback(lambda _: queue.put_nowait(None))
+
+    async def events() -> AsyncIterator[ChatEvent]:
+        deadline = loop.time() + settings.LLM_TIMEOUT
+        try:
+            yield "start", {}
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    yield "error", {"message": "请求超时"}
+                    return
+                try:
+                    item = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    continue
+                if item is None:
+                    break
+                yield item
+            try:
+                done = {"response": future.result()}
+                if debug:
+                    done["trace"] = trace_payload(trace)
+                yield "done", done
+            except LLMChatCancelled:
+                yield "error", {"message": "请求已取消"}
+            except Exception:
+                logger.exception(f"LLM流式对话异常: 用户 {user_id}")
+                yield "error", {"message": "服务错误"}
+        finally:
+            # 正常结束时对话已完成，设置标记无副作用；超时或客户端断开时终止对话
+            cancel_event.set()
+
+    return events()
+
+def shutdown_chat_executor() -> None:
+    """关闭对话、工具和对冲请求的线程池，取消排队中的任务，应用退出时调用"""
+    _chat_executor.shutdown(wait=False, cancel_futures=True)
+    _tool_executor.shutdown(wait=False, cancel_futures=True)
+    llm_interface.shutdown()
 
 if __name__ == "__main__":
     # 测试代码
@@ -516,9 +1130,8 @@ if __name__ == "__main__":
         # result = get_plans_by_user("89f0f3a0-4c1e-4a41-bb8e-a786dd0828b4")
         # print("测试计划查询:", result)
         
-        ans = llm_service("89f0f3a0-4c1e-4a41-bb8e-a786dd0828b4", "帮我更新西湖拍摄计划的开始时间为2025-06-09 15:00:00,焦距为35mm,位置在西湖附近")
+        user_id = "89f0f3a0-4c1e-4a41-bb8e-a786dd0828b4"
+        ans = llm_service(user_id, build_chat_context(user_id), "帮我更新西湖拍摄计划的开始时间为2025-06-09 15:00:00,焦距为35mm,位置在西湖附近")
         print("LLM回复:", ans)
     except Exception as e:
         logger.error(f"测试运行失败: {str(e)}")
-    finally:
-        close_db_session()
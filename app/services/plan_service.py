@@ -1,10 +1,57 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
+from sqlalchemy import JSON, cast, column, delete, func, insert, literal, or_, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by, array_agg
+from geoalchemy2 import Geography
 from sqlalchemy.orm import Session
-from datetime import datetime, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
 from uuid import UUID
+import base64
+import json
+import time
 
+from app.core.cache import create_cache
+from app.core.etag import etag_matches, hash_etag, parse_etags
+from app.core.config import settings
 from app.models import Plan as PlanModel
-from app.schemas.plan_model import PlanCreate, PlanUpdate, Plan
+from app.schemas.plan_model import (
+    PlanCreate, PlanUpdate, Plan, PlanSummary, PlanWithStatus, PlanNearby, PlanCluster, PlanClusters,
+    PlanBulkUpdateItem, PlanBulkItemResult, PlanBulkResult,
+)
+
+# 单个计划的读缓存，键为 (plan_id, user_id)，更新/删除时失效
+_plan_cache = create_cache(
+    "plan",
+    backend=settings.PLAN_CACHE_BACKEND,
+    maxsize=settings.PLAN_CACHE_MAXSIZE,
+    ttl=settings.PLAN_CACHE_TTL,
+    redis_url=settings.CACHE_REDIS_URL,
+    dumps=lambda plan: plan.model_dump_json(),
+    loads=Plan.model_validate_json,
+)
+
+# 计划列表的版本缓存，键为 user_id，该用户的计划创建、更新、删除时失效；
+# 值为 [版本, 最近一个未开始计划的开始时间戳]，到达该时间后有计划过期，视为失效重新计算。
+# 只在 redis 后端启用：进程内缓存收不到其他worker（LLM工具、后台任务）写入时的失效，会对已变化的列表返回 304
+_plans_version_cache = create_cache(
+    "plans_version",
+    backend=settings.PLAN_CACHE_BACKEND,
+    ttl=settings.PLAN_CACHE_TTL,
+    redis_url=settings.CACHE_REDIS_URL,
+    dumps=json.dumps,
+    loads=json.loads,
+) if settings.PLAN_CACHE_BACKEND == "redis" else None
+
+def _invalidate_plans_version(user_id: UUID) -> None:
+    if _plans_version_cache is not None:
+        _plans_version_cache.delete(user_id)
+
+async def _ainvalidate_plans_version(user_id: UUID) -> None:
+    if _plans_version_cache is not None:
+        await _plans_version_cache.adelete(user_id)
+
+# 允许通过更新接口修改的字段，user_id 不可修改
+_UPDATE_FIELDS = ("name", "description", "start_time", "camera", "tileset_url")
 
 def _validate_start_time(start_time: datetime) -> None:
     """验证开始时间不能是过去的时间"""
@@ -17,6 +64,29 @@ def _validate_start_time(start_time: datetime) -> None:
     if start_time <= now:
         raise ValueError("计划开始时间不能是过去的时间，计划将立即过期")
 
+class PlanVersionMismatch(Exception):
+    """If-Match 指定的版本与计划当前版本不一致"""
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def plan_etag(updated_at: datetime) -> str:
+    """单个计划的强ETag：updated_at 的微秒时间戳（十六进制），可由 If-Match 还原为 updated_at"""
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return f'"{(updated_at - _EPOCH) // timedelta(microseconds=1):x}"'
+
+def plan_etag_versions(if_match: str) -> List[datetime]:
+    """从 If-Match 解析出期望的 updated_at；If-Match 使用强比较，弱ETag和无法解析的值忽略"""
+    versions = []
+    for weak, tag in parse_etags(if_match):
+        if weak:
+            continue
+        try:
+            versions.append(_EPOCH + timedelta(microseconds=int(tag, 16)))
+        except (ValueError, OverflowError):
+            continue
+    return versions
+
 def is_plan_expired(plan: Plan) -> bool:
     """检查计划是否已过期"""
     if not plan or not plan.start_time:
@@ -41,15 +111,209 @@ def get_plan(db: Session, plan_id: UUID, user_id: Optional[UUID] = None) -> Opti
     
     return query.first()
 
-def get_plans(db: Session, user_id: Optional[UUID] = None, skip: int = 0, limit: int = 100) -> List[Plan]:
-    """获取计划列表，支持按用户筛选"""
-    query = db.query(PlanModel)
+def encode_plan_cursor(start_time: datetime, plan_id: UUID) -> str:
+    """把排序键 (start_time, id) 编码为不透明的分页游标"""
+    raw = json.dumps({"t": start_time.isoformat(), "id": str(plan_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_plan_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """解析分页游标，格式不正确时抛出ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(data["t"]), UUID(data["id"])
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+# 摘要视图只查询这些列，camera 只取 position 子字段，description 等大字段不传输
+_SUMMARY_COLUMNS = (
+    PlanModel.id,
+    PlanModel.name,
+    PlanModel.start_time,
+    PlanModel.camera["position"].label("position"),
+)
+
+# 计划是否已过期（开始时间不晚于当前时间），在数据库中计算
+_IS_EXPIRED = (PlanModel.start_time <= func.now()).label("is_expired")
+
+# 带过期状态的查询列，结果行可直接校验为 PlanWithStatus
+_STATUS_COLUMNS = (
+    PlanModel.id,
+    PlanModel.name,
+    PlanModel.description,
+    PlanModel.start_time,
+    PlanModel.camera,
+    PlanModel.tileset_url,
+    PlanModel.user_id,
+    PlanModel.created_at,
+    PlanModel.updated_at,
+    _IS_EXPIRED,
+)
+
+def _plans_statement(
+    user_id: Optional[UUID] = None,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    expired: Optional[bool] = None,
+    start_from: Optional[datetime] = None,
+    start_to: Optional[datetime] = None,
+    with_status: bool = False,
+):
+    """
+    构建计划列表查询：按 (start_time, id) 稳定排序，有游标时走键集分页，否则兼容 offset 分页
+
+    expired 与时间窗口 [start_from, start_to) 都在数据库中过滤，配合 (user_id, start_time, id) 索引做范围扫描
+    """
+    if summary:
+        stmt = select(*_SUMMARY_COLUMNS)
+    elif with_status:
+        stmt = select(*_STATUS_COLUMNS)
+    else:
+        stmt = select(PlanModel)
     
     # 如果提供了user_id，则按用户筛选
     if user_id:
-        query = query.filter(PlanModel.user_id == user_id)
+        stmt = stmt.where(PlanModel.user_id == user_id)
+    
+    if expired is not None:
+        stmt = stmt.where(PlanModel.start_time <= func.now() if expired else PlanModel.start_time > func.now())
+    if start_from is not None:
+        stmt = stmt.where(PlanModel.start_time >= start_from)
+    if start_to is not None:
+        stmt = stmt.where(PlanModel.start_time < start_to)
     
-    return query.offset(skip).limit(limit).all()
+    if cursor:
+        start_time, plan_id = decode_plan_cursor(cursor)
+        stmt = stmt.where(tuple_(PlanModel.start_time, PlanModel.id) > tuple_(start_time, plan_id))
+    elif skip:
+        stmt = stmt.offset(skip)
+    
+    return stmt.order_by(PlanModel.start_time, PlanModel.id).limit(limit)
+
+def _to_summaries(rows) -> List[PlanSummary]:
+    """数据库行直接构造摘要对象，数据来自数据库无需再次校验"""
+    return [
+        PlanSummary.model_construct(
+            id=row.id,
+            name=row.name,
+            start_time=row.start_time,
+            position=tuple(row.position) if row.position else None,
+        )
+        for row in rows
+    ]
+
+def _next_cursor(plans: list, limit: int) -> Optional[str]:
+    """多取的一行存在说明还有下一页，游标指向本页最后一条（ORM对象或摘要行均可）"""
+    if len(plans) <= limit:
+        return None
+    last = plans[limit - 1]
+    return encode_plan_cursor(last.start_time, last.id)
+
+# ===== 空间查询：基于 camera.position 生成的 plans.position 地理列 =====
+
+# (最小经度, 最小纬度, 最大经度, 最大纬度)
+BBox = Tuple[float, float, float, float]
+
+def _geography_point(longitude: float, latitude: float):
+    """WGS84 经纬度点，转换为 geography 以按米计算距离"""
+    return cast(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326), Geography(srid=4326))
+
+def _bbox_condition(bbox: BBox):
+    """
+    position 落在经纬度矩形内
+
+    按平面经纬度比较，命中 ix_plans_position_geom 表达式索引；最小经度大于最大经度时视为跨越180度经线
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    geom = func.geometry(PlanModel.position)
+    if min_lon <= max_lon:
+        return geom.op("&&")(func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326))
+    return or_(
+        geom.op("&&")(func.ST_MakeEnvelope(min_lon, min_lat, 180, max_lat, 4326)),
+        geom.op("&&")(func.ST_MakeEnvelope(-180, min_lat, max_lon, max_lat, 4326)),
+    )
+
+def _nearby_statement(user_id: Optional[UUID], longitude: float, latitude: float, radius: float, limit: int):
+    """半径范围内的计划（ST_DWithin 走 ix_plans_position 索引），按距离由近到远"""
+    point = _geography_point(longitude, latitude)
+    distance = func.ST_Distance(PlanModel.position, point).label("distance")
+    stmt = select(*_SUMMARY_COLUMNS, distance).where(func.ST_DWithin(PlanModel.position, point, radius))
+    if user_id:
+        stmt = stmt.where(PlanModel.user_id == user_id)
+    return stmt.order_by(distance, PlanModel.id).limit(limit)
+
+def _bbox_statement(user_id: Optional[UUID], bbox: BBox, limit: int):
+    """经纬度矩形内的计划摘要，按 (start_time, id) 排序"""
+    stmt = select(*_SUMMARY_COLUMNS).where(_bbox_condition(bbox))
+    if user_id:
+        stmt = stmt.where(PlanModel.user_id == user_id)
+    return stmt.order_by(PlanModel.start_time, PlanModel.id).limit(limit)
+
+def _to_nearby(rows) -> List[PlanNearby]:
+    return [
+        PlanNearby.model_construct(
+            id=row.id,
+            name=row.name,
+            start_time=row.start_time,
+            position=tuple(row.position) if row.position else None,
+            distance=row.distance,
+        )
+        for row in rows
+    ]
+
+# 地图聚合：每个瓦片（256px）划分为 4x4 个网格，约 64px 一簇
+_CLUSTER_CELLS_PER_TILE = 4
+# 无论 bbox 多大，每个方向最多这么多个网格，保证返回的簇数量有上限
+_MAX_CLUSTER_CELLS_PER_AXIS = 32
+# 每个簇返回的示例计划ID数量
+_CLUSTER_SAMPLE_SIZE = 5
+
+def cluster_cell_size(bbox: BBox, zoom: int) -> float:
+    """按缩放级别计算网格边长（度），bbox 过大时放大网格以限制簇数量"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_span = max_lon - min_lon if min_lon <= max_lon else max_lon + 360 - min_lon
+    lat_span = max_lat - min_lat
+    return max(
+        360 / (2 ** zoom) / _CLUSTER_CELLS_PER_TILE,
+        lon_span / _MAX_CLUSTER_CELLS_PER_AXIS,
+        lat_span / _MAX_CLUSTER_CELLS_PER_AXIS,
+    )
+
+def _clusters_statement(user_id: UUID, bbox: BBox, cell_size: float):
+    """按 ST_SnapToGrid 网格分组统计数量、平均位置和最早开始的若干个计划ID"""
+    geom = func.ST_Force2D(func.geometry(PlanModel.position))
+    cell = func.ST_SnapToGrid(geom, cell_size)
+    sample_ids = array_agg(aggregate_order_by(PlanModel.id, PlanModel.start_time, PlanModel.id))
+    stmt = (
+        select(
+            func.count().label("count"),
+            func.avg(func.ST_X(geom)).label("lon"),
+            func.avg(func.ST_Y(geom)).label("lat"),
+            sample_ids[1:_CLUSTER_SAMPLE_SIZE].label("sample_ids"),
+        )
+        .where(PlanModel.user_id == user_id, _bbox_condition(bbox))
+        .group_by(cell)
+    )
+    return stmt
+
+def get_nearby_plans(db: Session, user_id: Optional[UUID], longitude: float, latitude: float, radius: float, limit: int = 100) -> List[PlanNearby]:
+    """获取指定点半径（米）范围内的计划"""
+    return _to_nearby(db.execute(_nearby_statement(user_id, longitude, latitude, radius, limit)).all())
+
+def get_plans(db: Session, user_id: Optional[UUID] = None, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[Plan]:
+    """获取计划列表，支持按用户筛选"""
+    return list(db.execute(_plans_statement(user_id, skip, limit, cursor)).scalars().all())
+
+def get_plans_page(db: Session, user_id: Optional[UUID] = None, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, summary: bool = False, expired: Optional[bool] = None) -> Tuple[Union[List[Plan], List[PlanSummary]], Optional[str]]:
+    """获取一页计划及下一页游标，没有更多数据时游标为None；summary=True 时返回摘要"""
+    result = db.execute(_plans_statement(user_id, skip, limit + 1, cursor, summary, expired))
+    if summary:
+        rows = list(result.all())
+        return _to_summaries(rows[:limit]), _next_cursor(rows, limit)
+    plans = list(result.scalars().all())
+    return plans[:limit], _next_cursor(plans, limit)
 
 # 保留这个函数用于向后兼容，但它实际上只是调用新的get_plans函数
 def get_plans_by_user(db: Session, user_id: UUID, skip: int = 0, limit: int = 100) -> List[Plan]:
@@ -71,51 +335,87 @@ def create_plan(db: Session, plan: PlanCreate) -> Plan:
     )
     db.add(db_plan)
     db.commit()
+    _invalidate_plans_version(plan.user_id)
     db.refresh(db_plan)
     return db_plan
 
-def update_plan(db: Session, plan_id: UUID, plan: PlanUpdate, user_id: UUID) -> Optional[Plan]:
-    """更新计划，仅允许计划所有者更新"""
-    # 首先检查计划是否存在且属于当前用户
-    db_plan = get_plan(db, plan_id, user_id)
-    if not db_plan:
-        return None
+def _camera_merge(patch):
+    """在SQL中合并相机参数：camera = (camera::jsonb || patch::jsonb)::json，只覆盖提交的子字段"""
+    return cast(cast(PlanModel.camera, JSONB).op("||")(cast(patch, JSONB)), JSON)
+
+def _plan_update_data(plan: PlanUpdate) -> dict:
+    """
+    提取要更新的字段并校验
+
+    开始时间不能是过去的时间，非空字段不能置空；camera 只保留提交的非空子字段，
+    由 _camera_merge 在数据库中合并
+    """
+    update_data = plan.model_dump(exclude_unset=True, include=set(_UPDATE_FIELDS))
     
-    update_data = plan.model_dump(exclude_unset=True)
+    # 特殊处理camera字段，只合并提交的子字段
+    if update_data.get("camera") is not None:
+        camera = {k: v for k, v in update_data["camera"].items() if v is not None}
+        if camera:
+            update_data["camera"] = camera
+        else:
+            update_data.pop("camera")
     
-    # 移除user_id，防止恶意修改
-    update_data.pop('user_id', None)
+    columns = PlanModel.__table__.c
+    null_fields = [f for f, v in update_data.items() if v is None and not columns[f].nullable]
+    if null_fields:
+        raise ValueError(f"字段 {', '.join(null_fields)} 不能为空")
     
     # 验证开始时间（如果有更新）
-    if "start_time" in update_data and update_data["start_time"]:
+    if update_data.get("start_time"):
         _validate_start_time(update_data["start_time"])
-    
-    # 特殊处理camera字段，因为它是嵌套对象
-    if "camera" in update_data and update_data["camera"]:
-        # 如果 camera 是 Pydantic 模型对象，转换为字典
-        if hasattr(update_data["camera"], 'model_dump'):
-            update_data["camera"] = update_data["camera"].model_dump()
-        # 如果已经是字典，保持不变
-        # 如果是 JSON 字符串，SQLAlchemy 会自动处理
+    return update_data
+
+def _update_statement(plan_id: UUID, user_id: UUID, update_data: dict, versions: Optional[List[datetime]] = None):
+    """
+    UPDATE plans SET ... WHERE id = :id AND user_id = :uid RETURNING *，不属于该用户时不返回行
+
+    指定 versions 时只有 updated_at 是其中之一才更新（If-Match 乐观并发控制）
+    """
+    assignments = dict(update_data)
+    if "camera" in assignments:
+        assignments["camera"] = _camera_merge(literal(assignments["camera"], JSONB))
+    assignments["updated_at"] = func.now()
+    stmt = update(PlanModel).where(PlanModel.id == plan_id, PlanModel.user_id == user_id)
+    if versions:
+        stmt = stmt.where(PlanModel.updated_at.in_(versions))
+    return stmt.values(assignments).returning(PlanModel)
+
+def _delete_statement(plan_id: UUID, user_id: UUID):
+    """DELETE FROM plans WHERE id = :id AND user_id = :uid RETURNING id"""
+    return (
+        delete(PlanModel)
+        .where(PlanModel.id == plan_id, PlanModel.user_id == user_id)
+        .returning(PlanModel.id)
+    )
+
+# RETURNING 的结果直接覆盖会话中已有的同一对象，不再额外同步会话
+_RETURNING_OPTIONS = {"synchronize_session": False, "populate_existing": True}
 
-    for key, value in update_data.items():
-        setattr(db_plan, key, value)
+def update_plan(db: Session, plan_id: UUID, plan: PlanUpdate, user_id: UUID) -> Optional[Plan]:
+    """更新计划，仅允许计划所有者更新，一条 UPDATE ... RETURNING 完成权限检查、更新和读取"""
+    update_data = _plan_update_data(plan)
     
-    db_plan.updated_at = datetime.now()
+    db_plan = db.execute(_update_statement(plan_id, user_id, update_data), execution_options=_RETURNING_OPTIONS).scalars().first()
+    if db_plan is not None:
+        # 移出会话，避免提交后过期导致访问属性时再查一次
+        db.expunge(db_plan)
     db.commit()
-    db.refresh(db_plan)
+    _plan_cache.delete((plan_id, user_id))
+    _invalidate_plans_version(user_id)
     return db_plan
 
 def delete_plan(db: Session, plan_id: UUID, user_id: UUID) -> bool:
     """删除计划，仅允许计划所有者删除"""
-    # 首先检查计划是否存在且属于当前用户
-    db_plan = get_plan(db, plan_id, user_id)
-    if not db_plan:
-        return False
-    
-    db.delete(db_plan)
+    deleted_id = db.execute(_delete_statement(plan_id, user_id), execution_options=_RETURNING_OPTIONS).scalar_one_or_none()
     db.commit()
-    return True
+    _plan_cache.delete((plan_id, user_id))
+    _invalidate_plans_version(user_id)
+    return deleted_id is not None
 
 def check_plan_owner(db: Session, plan_id: UUID, user_id: UUID) -> bool:
     """检查计划是否属于指定用户"""
@@ -126,16 +426,350 @@ def check_plan_owner(db: Session, plan_id: UUID, user_id: UUID) -> bool:
     return plan is not None
 
 def get_plan_with_status(db: Session, plan_id: UUID, user_id: Optional[UUID] = None) -> Optional[dict]:
-    """获取计划并包含过期状态信息"""
-    plan = get_plan(db, plan_id, user_id)
-    if not plan:
+    """获取计划并包含过期状态信息，过期状态在数据库中计算"""
+    stmt = select(PlanModel, _IS_EXPIRED).where(PlanModel.id == plan_id)
+    if user_id:
+        stmt = stmt.where(PlanModel.user_id == user_id)
+    
+    row = db.execute(stmt).first()
+    if not row:
         return None
     
     return {
-        "plan": plan,
-        "is_expired": is_plan_expired(plan)
+        "plan": row[0],
+        "is_expired": row.is_expired
     }
 
+# ===== 异步版本，供 async def 路由配合 get_async_db 使用 =====
+
+async def get_plan_async(db: AsyncSession, plan_id: UUID, user_id: Optional[UUID] = None) -> Optional[Plan]:
+    """获取单个计划（异步），可选择性检查用户权限"""
+    stmt = select(PlanModel).where(PlanModel.id == plan_id)
+    if user_id:
+        stmt = stmt.where(PlanModel.user_id == user_id)
+    
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def _load_plan_into_cache(db: AsyncSession, key: Tuple[UUID, UUID]) -> Optional[Plan]:
+    """查库并写入计划缓存，计划不存在时不缓存"""
+    db_plan = await get_plan_async(db, *key)
+    if db_plan is None:
+        return None
+    plan = Plan.model_validate(db_plan)
+    await _plan_cache.aset(key, plan)
+    return plan
+
+async def get_plan_cached_async(db: AsyncSession, plan_id: UUID, user_id: UUID) -> Optional[Plan]:
+    """获取单个计划（异步，读穿缓存），未命中时查库并写入缓存"""
+    key = (plan_id, user_id)
+    plan = await _plan_cache.aget(key)
+    if plan is None:
+        plan = await _load_plan_into_cache(db, key)
+    return plan
+
+async def get_plan_updated_at_async(db: AsyncSession, plan_id: UUID, user_id: UUID) -> Optional[datetime]:
+    """只查询计划的 updated_at（不加载整行），计划不存在时返回None"""
+    stmt = select(PlanModel.updated_at).where(PlanModel.id == plan_id, PlanModel.user_id == user_id)
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+async def get_plan_if_modified_async(db: AsyncSession, plan_id: UUID, user_id: UUID, if_none_match: Optional[str] = None) -> Tuple[Optional[Plan], Optional[str]]:
+    """
+    条件读取单个计划，返回 (计划, ETag)
+
+    If-None-Match 命中时计划为None、只返回ETag；计划不存在时两者都为None。
+    缓存未命中且带 If-None-Match 时先只查 updated_at，命中即返回，不加载整行
+    """
+    key = (plan_id, user_id)
+    plan = await _plan_cache.aget(key)
+    if plan is None:
+        if if_none_match:
+            updated_at = await get_plan_updated_at_async(db, plan_id, user_id)
+            if updated_at is None:
+                return None, None
+            if etag_matches(if_none_match, plan_etag(updated_at)):
+                return None, plan_etag(updated_at)
+        plan = await _load_plan_into_cache(db, key)
+        if plan is None:
+            return None, None
+    
+    etag = plan_etag(plan.updated_at)
+    if etag_matches(if_none_match, etag):
+        return None, etag
+    return plan, etag
+
+async def _query_plans_version(db: AsyncSession, user_id: Optional[UUID]) -> Tuple[str, Optional[float]]:
+    """聚合查询计划列表的版本和最近一个未开始计划的开始时间戳（没有时为 None）"""
+    stmt = select(
+        func.count(),
+        func.count().filter(PlanModel.start_time <= func.now()),
+        func.max(PlanModel.updated_at),
+        func.min(PlanModel.start_time).filter(PlanModel.start_time > func.now()),
+    )
+    if user_id:
+        stmt = stmt.where(PlanModel.user_id == user_id)
+    count, expired, last_updated, next_start = (await db.execute(stmt)).one()
+    version = repr((count, expired, last_updated))
+    return version, next_start.timestamp() if next_start is not None else None
+
+async def get_plans_version_async(db: AsyncSession, user_id: Optional[UUID] = None) -> str:
+    """
+    计划列表的版本，由 (计划数, 已过期计划数, 最大 updated_at) 决定
+
+    任何创建、更新、删除都会改变计划数或最大 updated_at；计划随时间过期时已过期计划数变化。
+    指定用户且缓存后端为 redis 时使用缓存，只在该用户的计划变化或有计划过期后重新聚合；其他情况直接查询
+    """
+    if not user_id or _plans_version_cache is None:
+        return (await _query_plans_version(db, user_id))[0]
+    cached = await _plans_version_cache.aget(user_id)
+    if cached is not None and (cached[1] is None or time.time() < cached[1]):
+        return cached[0]
+    version, next_start = await _query_plans_version(db, user_id)
+    await _plans_version_cache.aset(user_id, [version, next_start])
+    return version
+
+def plans_list_etag(version: str, **params) -> str:
+    """计划列表的强ETag，由列表版本和查询参数共同决定"""
+    return hash_etag(version, sorted(params.items()))
+
+async def get_plans_async(db: AsyncSession, user_id: Optional[UUID] = None, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[Plan]:
+    """获取计划列表（异步），支持按用户筛选"""
+    result = await db.execute(_plans_statement(user_id, skip, limit, cursor))
+    return list(result.scalars().all())
+
+async def get_plans_page_async(db: AsyncSession, user_id: Optional[UUID] = None, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, summary: bool = False, expired: Optional[bool] = None) -> Tuple[Union[List[Plan], List[PlanSummary]], Optional[str]]:
+    """获取一页计划及下一页游标（异步），没有更多数据时游标为None；summary=True 时返回摘要"""
+    result = await db.execute(_plans_statement(user_id, skip, limit + 1, cursor, summary, expired))
+    if summary:
+        rows = list(result.all())
+        return _to_summaries(rows[:limit]), _next_cursor(rows, limit)
+    plans = list(result.scalars().all())
+    return plans[:limit], _next_cursor(plans, limit)
+
+# 未指定结束时间时，即将开始的计划默认查询的时间窗口
+UPCOMING_WINDOW = timedelta(hours=48)
+
+async def get_upcoming_plans_async(db: AsyncSession, user_id: UUID, start_from: Optional[datetime] = None, start_to: Optional[datetime] = None, limit: int = 100, cursor: Optional[str] = None, expired: Optional[bool] = None) -> Tuple[List[PlanWithStatus], Optional[str]]:
+    """
+    获取开始时间在 [start_from, start_to) 内的一页计划（异步），附带数据库计算的过期状态
+
+    start_from 默认为当前时间，start_to 默认为 start_from 之后48小时；结束时间不晚于开始时间时抛出ValueError
+    """
+    if start_from is None:
+        start_from = datetime.now(timezone.utc)
+    elif start_from.tzinfo is None:
+        start_from = start_from.replace(tzinfo=timezone.utc)
+    if start_to is None:
+        start_to = start_from + UPCOMING_WINDOW
+    elif start_to.tzinfo is None:
+        start_to = start_to.replace(tzinfo=timezone.utc)
+    if start_to <= start_from:
+        raise ValueError("结束时间必须晚于开始时间")
+    
+    stmt = _plans_statement(user_id, 0, limit + 1, cursor, expired=expired, start_from=start_from, start_to=start_to, with_status=True)
+    rows = list((await db.execute(stmt)).all())
+    return [PlanWithStatus.model_validate(row) for row in rows[:limit]], _next_cursor(rows, limit)
+
+async def get_nearby_plans_async(db: AsyncSession, user_id: Optional[UUID], longitude: float, latitude: float, radius: float, limit: int = 100) -> List[PlanNearby]:
+    """获取指定点半径（米）范围内的计划（异步）"""
+    result = await db.execute(_nearby_statement(user_id, longitude, latitude, radius, limit))
+    return _to_nearby(result.all())
+
+async def get_plans_in_bbox_async(db: AsyncSession, user_id: Optional[UUID], bbox: BBox, limit: int = 100) -> List[PlanSummary]:
+    """获取经纬度矩形内的计划摘要（异步）"""
+    result = await db.execute(_bbox_statement(user_id, bbox, limit))
+    return _to_summaries(result.all())
+
+async def get_plan_clusters_async(db: AsyncSession, user_id: UUID, bbox: BBox, zoom: int) -> PlanClusters:
+    """获取 bbox 内按缩放级别聚合的指定用户计划簇（异步）"""
+    cell_size = cluster_cell_size(bbox, zoom)
+    result = await db.execute(_clusters_statement(user_id, bbox, cell_size))
+    clusters = [
+        PlanCluster.model_construct(count=row.count, position=(row.lon, row.lat), sample_ids=list(row.sample_ids))
+        for row in result.all()
+    ]
+    return PlanClusters.model_construct(cell_size=cell_size, clusters=clusters)
+
+async def create_plan_async(db: AsyncSession, plan: PlanCreate) -> Plan:
+    """创建新计划（异步）"""
+    _validate_start_time(plan.start_time)
+    
+    db_plan = PlanModel(
+        name=plan.name,
+        description=plan.description,
+        start_time=plan.start_time,
+        camera=plan.camera.model_dump(),
+        tileset_url=plan.tileset_url,
+        user_id=plan.user_id
+    )
+    db.add(db_plan)
+    await db.commit()
+    await _ainvalidate_plans_version(plan.user_id)
+    await db.refresh(db_plan)
+    return db_plan
+
+async def update_plan_async(db: AsyncSession, plan_id: UUID, plan: PlanUpdate, user_id: UUID, versions: Optional[List[datetime]] = None) -> Optional[Plan]:
+    """
+    更新计划（异步），仅允许计划所有者更新，一条 UPDATE ... RETURNING 完成
+
+    versions 为 If-Match 解析出的期望版本，计划存在但版本不一致时抛出 PlanVersionMismatch
+    """
+    update_data = _plan_update_data(plan)
+    
+    result = await db.execute(_update_statement(plan_id, user_id, update_data, versions), execution_options=_RETURNING_OPTIONS)
+    db_plan = result.scalars().first()
+    await db.commit()
+    if db_plan is None:
+        if versions and await get_plan_updated_at_async(db, plan_id, user_id) is not None:
+            raise PlanVersionMismatch("计划已被修改，请重新获取后再更新")
+        return None
+    await _plan_cache.adelete((plan_id, user_id))
+    await _ainvalidate_plans_version(user_id)
+    return db_plan
+
+async def delete_plan_async(db: AsyncSession, plan_id: UUID, user_id: UUID) -> bool:
+    """删除计划（异步），仅允许计划所有者删除，一条 DELETE ... RETURNING 完成"""
+    result = await db.execute(_delete_statement(plan_id, user_id), execution_options=_RETURNING_OPTIONS)
+    deleted_id = result.scalar_one_or_none()
+    await db.commit()
+    await _plan_cache.adelete((plan_id, user_id))
+    await _ainvalidate_plans_version(user_id)
+    return deleted_id is not None
+
+# ===== 批量操作：整批校验后在同一事务内用多行 INSERT/UPDATE/DELETE ... RETURNING 写入 =====
+
+def _bulk_result(results: List[PlanBulkItemResult]) -> PlanBulkResult:
+    """按请求顺序汇总每条结果"""
+    results.sort(key=lambda r: r.index)
+    succeeded = sum(1 for r in results if r.success)
+    return PlanBulkResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+def _bulk_failure(index: int, error: str, plan_id: Optional[UUID] = None) -> PlanBulkItemResult:
+    return PlanBulkItemResult(index=index, success=False, id=plan_id, error=error)
+
+def _bulk_success(index: int, db_plan: PlanModel) -> PlanBulkItemResult:
+    return PlanBulkItemResult(index=index, success=True, id=db_plan.id, plan=Plan.model_validate(db_plan))
+
+def _bulk_update_statement(user_id: UUID, fields: Tuple[str, ...], entries: List[Tuple[int, UUID, dict]]):
+    """
+    构建 UPDATE plans SET ... FROM (VALUES ...) v WHERE plans.id = v.id ... RETURNING plans.*
+
+    同一组内的条目更新相同的字段集合，一条语句完成整组更新
+    """
+    table = PlanModel.__table__
+    rows = values(
+        column("id", table.c.id.type),
+        *(column(f, table.c[f].type) for f in fields),
+        name="v",
+    ).data([(plan_id, *(data[f] for f in fields)) for _, plan_id, data in entries])
+
+    assignments = {f: rows.c[f] for f in fields}
+    if "camera" in assignments:
+        assignments["camera"] = _camera_merge(rows.c.camera)
+    assignments["updated_at"] = func.now()
+    return (
+        update(PlanModel)
+        .where(PlanModel.id == rows.c.id, PlanModel.user_id == user_id)
+        .values(assignments)
+        .returning(PlanModel)
+    )
+
+async def create_plans_bulk_async(db: AsyncSession, plans: List[PlanCreate], user_id: UUID) -> PlanBulkResult:
+    """批量创建计划（异步），校验失败的条目单独报错，其余一次多行插入"""
+    results: List[PlanBulkItemResult] = []
+    rows, indexes = [], []
+    for i, plan in enumerate(plans):
+        try:
+            _validate_start_time(plan.start_time)
+        except ValueError as e:
+            results.append(_bulk_failure(i, str(e)))
+            continue
+        rows.append({
+            "name": plan.name,
+            "description": plan.description,
+            "start_time": plan.start_time,
+            "camera": plan.camera.model_dump(),
+            "tileset_url": plan.tileset_url,
+            "user_id": user_id,
+        })
+        indexes.append(i)
+
+    if rows:
+        stmt = insert(PlanModel).returning(PlanModel, sort_by_parameter_order=True)
+        created = (await db.scalars(stmt, rows)).all()
+        results.extend(_bulk_success(i, db_plan) for i, db_plan in zip(indexes, created))
+        await db.commit()
+        await _ainvalidate_plans_version(user_id)
+    return _bulk_result(results)
+
+async def update_plans_bulk_async(db: AsyncSession, items: List[PlanBulkUpdateItem], user_id: UUID) -> PlanBulkResult:
+    """
+    批量更新计划（异步），仅更新当前用户的计划
+
+    按更新的字段集合分组，每组一条多行 UPDATE ... RETURNING，所有组在同一事务内提交
+    """
+    results: List[PlanBulkItemResult] = []
+    groups: Dict[Tuple[str, ...], List[Tuple[int, UUID, dict]]] = {}
+    seen = set()
+    for i, item in enumerate(items):
+        if item.id in seen:
+            results.append(_bulk_failure(i, "同一批次中计划ID重复", item.id))
+            continue
+        seen.add(item.id)
+
+        try:
+            data = _plan_update_data(item)
+        except ValueError as e:
+            results.append(_bulk_failure(i, str(e), item.id))
+            continue
+
+        fields = tuple(f for f in _UPDATE_FIELDS if f in data)
+        groups.setdefault(fields, []).append((i, item.id, data))
+
+    for fields, entries in groups.items():
+        result = await db.execute(_bulk_update_statement(user_id, fields, entries), execution_options=_RETURNING_OPTIONS)
+        updated = {db_plan.id: db_plan for db_plan in result.scalars().all()}
+        for i, plan_id, _ in entries:
+            db_plan = updated.get(plan_id)
+            if db_plan is None:
+                results.append(_bulk_failure(i, "计划未找到或无权访问", plan_id))
+            else:
+                results.append(_bulk_success(i, db_plan))
+
+    if groups:
+        await db.commit()
+        for entries in groups.values():
+            for _, plan_id, _ in entries:
+                await _plan_cache.adelete((plan_id, user_id))
+        await _ainvalidate_plans_version(user_id)
+    return _bulk_result(results)
+
+async def delete_plans_bulk_async(db: AsyncSession, plan_ids: List[UUID], user_id: UUID) -> PlanBulkResult:
+    """批量删除计划（异步），一条 DELETE ... RETURNING 删除当前用户名下的全部指定计划"""
+    stmt = (
+        delete(PlanModel)
+        .where(PlanModel.id.in_(set(plan_ids)), PlanModel.user_id == user_id)
+        .returning(PlanModel.id)
+    )
+    result = await db.execute(stmt, execution_options=_RETURNING_OPTIONS)
+    deleted = set(result.scalars().all())
+    await db.commit()
+    for plan_id in deleted:
+        await _plan_cache.adelete((plan_id, user_id))
+    await _ainvalidate_plans_version(user_id)
+
+    results: List[PlanBulkItemResult] = []
+    seen = set()
+    for i, plan_id in enumerate(plan_ids):
+        if plan_id in seen:
+            results.append(_bulk_failure(i, "同一批次中计划ID重复", plan_id))
+        elif plan_id in deleted:
+            results.append(PlanBulkItemResult(index=i, success=True, id=plan_id))
+        else:
+            results.append(_bulk_failure(i, "计划未找到或无权访问", plan_id))
+        seen.add(plan_id)
+    return _bulk_result(results)
+
 # 使用示例:
 # 
 # 1. 创建计划时，如果start_time是过去的时间，会抛出ValueError:
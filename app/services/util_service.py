@@ -3,6 +3,7 @@ import pathlib
 sys.path.append(str(pathlib.Path(__file__).parent.parent.parent))
 
 from app.core.config import ConfigLoader
+from app.core.external_cache import acached_call
 import httpx
 import logging
 from typing import Optional
@@ -37,9 +38,25 @@ async def get_tile(x: int, y: int, z: int) -> str:
         logger.error(f"获取瓦片失败: x={x}, y={y}, z={z}, 错误: {str(e)}")
         raise Exception(f"获取瓦片失败: {str(e)}")
 
+def is_gaode_success(result: dict) -> bool:
+    """高德接口以 status="1" 表示成功，配额用尽等业务错误也返回HTTP 200，不应缓存"""
+    return isinstance(result, dict) and result.get("status") == "1"
+
+async def _fetch_position(name: str) -> dict:
+    url = "https://restapi.amap.com/v3/assistant/inputtips"
+    params = {
+        "key": GAODE_API_KEY,
+        "keywords": name
+    }
+    
+    async with httpx.AsyncClient() as client:
+        response = await client.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
 async def get_position(name: str) -> dict:
     """
-    模糊查询位置,使用高德地图API进行模糊查询
+    模糊查询位置,使用高德地图API进行模糊查询，结果与LLM工具共用外部接口缓存
     
     Args:
         name: 地点名称
@@ -48,19 +65,9 @@ async def get_position(name: str) -> dict:
         dict: 完整的搜索结果
     """
     try:
-        url = "https://restapi.amap.com/v3/assistant/inputtips"
-        params = {
-            "key": GAODE_API_KEY,
-            "keywords": name
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"位置搜索完成: {name}, 结果数量: {result.get('count', 0)}")
-            return result
+        result = await acached_call("gaode_inputtips", name.strip(), _fetch_position, name, cacheable=is_gaode_success)
+        logger.info(f"位置搜索完成: {name}, 结果数量: {result.get('count', 0)}")
+        return result
             
     except httpx.HTTPError as e:
         logger.error(f"位置搜索HTTP错误: {name}, 错误: {str(e)}")
@@ -69,9 +76,23 @@ async def get_position(name: str) -> dict:
         logger.error(f"位置搜索失败: {name}, 错误: {str(e)}")
         raise Exception(f"位置搜索失败: {str(e)}")
 
+async def _fetch_weather(lat: float, lon: float, dt: int) -> dict:
+    url = "https://api.openweathermap.org/data/3.0/onecall/timemachine"
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "dt": dt,
+        "appid": OPENWEATHER_API_KEY
+    }
+    
+    async with httpx.AsyncClient() as client:
+        response = await client.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
 async def get_weather(lat: float, lon: float, dt: int) -> dict:
     """
-    根据输入的经纬度和日期获得天气信息,使用openweather的api
+    根据输入的经纬度和日期获得天气信息,使用openweather的api，结果经外部接口缓存
     
     Args:
         lat: 纬度
@@ -82,21 +103,11 @@ async def get_weather(lat: float, lon: float, dt: int) -> dict:
         dict: 天气信息
     """
     try:
-        url = "https://api.openweathermap.org/data/3.0/onecall/timemachine"
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "dt": dt,
-            "appid": OPENWEATHER_API_KEY
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"天气查询完成: lat={lat}, lon={lon}, dt={dt}")
-            return result
+        # 经纬度保留4位小数（约10米）作为缓存键，避免浮点尾数不同导致重复请求
+        key = (round(lat, 4), round(lon, 4), dt)
+        result = await acached_call("openweather", key, _fetch_weather, lat, lon, dt)
+        logger.info(f"天气查询完成: lat={lat}, lon={lon}, dt={dt}")
+        return result
             
     except httpx.HTTPError as e:
         logger.error(f"天气查询HTTP错误: lat={lat}, lon={lon}, dt={dt}, 错误: {str(e)}")
@@ -0,0 +1,107 @@
+"""
+测试配置和固件
+
+app/core 下的模块不依赖数据库，可以直接导入测试；导入 app.db（以及 plan_service、intent_service 等服务）
+时会连接数据库并建表，这类测试通过下面的固件延迟导入，数据库或 configs/provider.json 不可用时跳过
+"""
+import sys
+import types
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+
+project_root = Path(__file__).resolve().parents[2]
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+
+def _database_available() -> bool:
+    import psycopg2
+    from app.core.config import settings
+
+    try:
+        psycopg2.connect(settings.DATABASE_URL, connect_timeout=2).close()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@pytest.fixture(scope="session")
+def plan_service():
+    """导入 plan_service（会连接数据库），数据库不可用时跳过"""
+    if not _database_available():
+        pytest.skip("数据库不可用")
+    from app.services import plan_service
+    return plan_service
+
+
+@pytest.fixture(scope="session")
+def intent_service(plan_service):
+    """导入 intent_service（会加载 provider.json 中的LLM配置），配置文件不存在时跳过"""
+    if not (project_root / "configs" / "provider.json").exists():
+        pytest.skip("configs/provider.json 不存在")
+    from app.services import intent_service
+    return intent_service
+
+
+@pytest.fixture(scope="session")
+def llm_job_service(intent_service):
+    """导入 llm_job_service，依赖与 intent_service 相同"""
+    from app.services import llm_job_service
+    return llm_job_service
+
+
+@pytest_asyncio.fixture
+async def async_sessions(plan_service):
+    """
+    异步会话工厂，会话都在同一个外层事务中，测试结束时回滚全部修改
+
+    会话内的 commit 只释放保存点；不同会话的保存点会互相影响，使用另一个会话前先提交当前会话。
+    每个测试单独创建不带连接池的引擎，连接不会跨事件循环复用
+    """
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+    from app.db import ASYNC_SQLALCHEMY_DATABASE_URL
+
+    engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+    async with engine.connect() as connection:
+        await connection.begin()
+        yield async_sessionmaker(
+            connection, class_=AsyncSession, autoflush=False, expire_on_commit=False,
+            join_transaction_mode="create_savepoint",
+        )
+        await connection.rollback()
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def async_db(async_sessions):
+    """测试结束时回滚的异步数据库会话"""
+    async with async_sessions() as session:
+        yield session
+
+
+@pytest.fixture
+def password_pool(monkeypatch):
+    """密码哈希改用线程池执行（任务函数相同，不启动子进程），cost 取最小值加快测试"""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.core import password
+    from app.core.config import settings
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(password, "_get_pool", lambda: executor)
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    assert password._pending == 0
+    yield executor
+    executor.shutdown(wait=True)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """替换 app.core.cache 使用的时钟，测试中用 clock.now += 秒数 推进时间"""
+    from app.core import cache
+
+    fake = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=lambda: fake.now, time=lambda: fake.now))
+    return fake
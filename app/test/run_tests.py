@@ -0,0 +1,13 @@
+"""
+运行 app/test 下的全部测试，额外的命令行参数原样传给 pytest
+
+    python app/test/run_tests.py
+    python app/test/run_tests.py -k cache
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([str(Path(__file__).resolve().parent), *sys.argv[1:]]))
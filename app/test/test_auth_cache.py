@@ -0,0 +1,118 @@
+"""认证缓存：令牌按剩余有效期缓存，用户信息修改后失效"""
+import time
+import uuid
+
+import pytest
+import pytest_asyncio
+from jose import jwt
+from sqlalchemy import update
+
+from app.core import password
+from app.core.cache import LRUCache
+from app.models import User as UserModel
+from app.schemas.auth_model import PasswordChangeRequest, UserUpdate
+from app.services import auth_service
+
+
+@pytest.fixture
+def caches(monkeypatch, clock):
+    """每个测试使用新的进程内缓存，时间由 clock 控制"""
+    monkeypatch.setattr(auth_service, "SECRET_KEY", "test-secret")
+    monkeypatch.setattr(auth_service, "_token_cache", LRUCache("test_auth_token", 100, 1800))
+    monkeypatch.setattr(auth_service, "_user_cache", LRUCache("test_auth_user", 100, 300))
+    return auth_service
+
+
+def make_token(expires_in=None, **claims):
+    payload = {"sub": str(uuid.uuid4()), "email": "a@example.com", **claims}
+    if expires_in is not None:
+        payload["exp"] = int(time.time()) + expires_in
+    return jwt.encode(payload, "test-secret", algorithm=auth_service.ALGORITHM)
+
+
+def cached(token):
+    return auth_service._token_cache.get(auth_service._token_key(token))
+
+
+@pytest.mark.asyncio
+async def test_token_is_cached_until_it_expires(caches, clock):
+    token = make_token(expires_in=60)
+    token_data = await auth_service.verify_token_async(token)
+    assert cached(token) == token_data
+
+    clock.now += 50
+    assert cached(token) == token_data
+    # 缓存的有效期不超过令牌剩余的有效期，而不是缓存默认的 1800 秒
+    clock.now += 15
+    assert cached(token) is None
+
+
+@pytest.mark.asyncio
+async def test_token_without_exp_uses_default_ttl(caches, clock):
+    token = make_token()
+    assert await auth_service.verify_token_async(token) is not None
+    clock.now += 1799
+    assert cached(token) is not None
+    clock.now += 2
+    assert cached(token) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token", [
+    make_token(expires_in=-10),
+    "not-a-jwt",
+    jwt.encode({"sub": str(uuid.uuid4()), "exp": int(time.time()) + 600}, "other-secret", algorithm="HS256"),
+    jwt.encode({"email": "a@example.com", "exp": int(time.time()) + 600}, "test-secret", algorithm="HS256"),
+])
+async def test_invalid_tokens_are_not_cached(caches, token):
+    assert await auth_service.verify_token_async(token) is None
+    assert cached(token) is None
+
+
+@pytest.mark.asyncio
+async def test_token_about_to_expire_is_not_cached(caches):
+    token = make_token(expires_in=1)
+    assert await auth_service.verify_token_async(token) is not None
+    assert cached(token) is None
+
+
+@pytest_asyncio.fixture
+async def user(caches, password_pool, async_db):
+    db_user = UserModel(
+        user_id=uuid.uuid4(), user_name="摄影师", email=f"{uuid.uuid4().hex}@example.com",
+        password=password.hash_password("old-password"),
+    )
+    async_db.add(db_user)
+    await async_db.commit()
+    return db_user
+
+
+@pytest.mark.asyncio
+async def test_user_is_cached(user, async_db):
+    assert (await auth_service.get_user_cached_async(async_db, user.user_id)).user_name == "摄影师"
+    # 不经过服务直接修改数据库，缓存中仍是旧值
+    await async_db.execute(update(UserModel).where(UserModel.user_id == user.user_id).values(user_name="直接修改"))
+    await async_db.commit()
+    assert (await auth_service.get_user_cached_async(async_db, user.user_id)).user_name == "摄影师"
+    assert await auth_service.get_user_cached_async(async_db, uuid.uuid4()) is None
+
+
+@pytest.mark.asyncio
+async def test_update_user_invalidates_cache(user, async_db):
+    await auth_service.get_user_cached_async(async_db, user.user_id)
+    await auth_service.update_user_async(async_db, user.user_id, UserUpdate(user_name="新名字"))
+    assert auth_service._user_cache.get(user.user_id) is None
+    assert (await auth_service.get_user_cached_async(async_db, user.user_id)).user_name == "新名字"
+
+
+@pytest.mark.asyncio
+async def test_change_password_invalidates_cache(user, async_db):
+    await auth_service.get_user_cached_async(async_db, user.user_id)
+    wrong = PasswordChangeRequest(old_password="wrong-password", new_password="new-password")
+    assert not await auth_service.change_password_async(async_db, user.user_id, wrong)
+    assert auth_service._user_cache.get(user.user_id) is not None
+
+    change = PasswordChangeRequest(old_password="old-password", new_password="new-password")
+    assert await auth_service.change_password_async(async_db, user.user_id, change)
+    assert auth_service._user_cache.get(user.user_id) is None
+    assert password.verify_password("new-password", user.password)
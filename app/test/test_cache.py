@@ -0,0 +1,66 @@
+"""进程内 LRU + TTL 缓存"""
+import pytest
+
+from app.core.cache import LRUCache, create_cache
+
+
+def test_get_returns_default_on_miss():
+    c = LRUCache("test", maxsize=2)
+    assert c.get("a") is None
+    assert c.get("a", "default") == "default"
+
+
+def test_evicts_least_recently_used():
+    c = LRUCache("test", maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1  # a 变为最近使用
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert len(c) == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    c = LRUCache("test", ttl=10)
+    c.set("a", 1)
+    c.set("b", 2, ttl=30)
+    clock.now += 10
+    assert c.get("a") is None
+    assert c.get("b") == 2
+    clock.now += 20
+    assert c.get("b") is None
+    assert len(c) == 0
+
+
+def test_cached_none_is_distinct_from_miss():
+    c = LRUCache("test")
+    marker = object()
+    c.set("a", None)
+    assert c.get("a", marker) is None
+
+
+def test_delete_and_clear():
+    c = LRUCache("test")
+    c.set("a", 1)
+    c.set("b", 2)
+    c.delete("a")
+    c.delete("missing")
+    assert c.get("a") is None and c.get("b") == 2
+    c.clear()
+    assert len(c) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_interface():
+    c = LRUCache("test")
+    await c.aset(("plan", 1), "value")
+    assert await c.aget(("plan", 1)) == "value"
+    await c.adelete(("plan", 1))
+    assert await c.aget(("plan", 1)) is None
+
+
+def test_create_cache_backends():
+    assert isinstance(create_cache("test", backend="memory", maxsize=5, ttl=1), LRUCache)
+    with pytest.raises(ValueError):
+        create_cache("test", backend="memcached")
@@ -0,0 +1,97 @@
+"""全局 + 按用户的并发限制"""
+import asyncio
+
+import pytest
+
+from app.core.concurrency import ConcurrencyLimiter, ConcurrencyLimitExceeded
+
+
+def make_limiter(limit=1, per_key_limit=2, max_waiting=10, wait_timeout=5.0, retry_after=3):
+    return ConcurrencyLimiter(
+        "test", limit=limit, per_key_limit=per_key_limit, max_waiting=max_waiting,
+        wait_timeout=wait_timeout, retry_after=retry_after,
+    )
+
+
+@pytest.mark.asyncio
+async def test_acquire_within_limit_does_not_wait():
+    limiter = make_limiter(limit=2)
+    release_a = await limiter.acquire("a")
+    release_b = await limiter.acquire("b")
+    assert limiter._active == 2
+    release_a()
+    release_b()
+    assert limiter._active == 0 and limiter._per_key == {}
+
+
+@pytest.mark.asyncio
+async def test_release_is_idempotent():
+    limiter = make_limiter()
+    release = await limiter.acquire("a")
+    release()
+    release()
+    assert limiter._active == 0
+
+
+@pytest.mark.asyncio
+async def test_waiter_runs_after_release():
+    limiter = make_limiter(limit=1)
+    release = await limiter.acquire("a")
+    waiter = asyncio.create_task(limiter.acquire("b"))
+    await asyncio.sleep(0)
+    assert not waiter.done() and limiter._waiting == 1
+    release()
+    release_b = await asyncio.wait_for(waiter, 1)
+    assert limiter._active == 1 and limiter._waiting == 0
+    release_b()
+
+
+@pytest.mark.asyncio
+async def test_per_key_limit_rejects_with_429():
+    limiter = make_limiter(limit=5, per_key_limit=1)
+    release = await limiter.acquire("a")
+    with pytest.raises(ConcurrencyLimitExceeded) as exc:
+        await limiter.acquire("a")
+    assert exc.value.status_code == 429 and exc.value.retry_after == 3
+    # 其他用户不受影响
+    (await limiter.acquire("b"))()
+    release()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_with_429():
+    limiter = make_limiter(limit=1, max_waiting=1)
+    release = await limiter.acquire("a")
+    waiter = asyncio.create_task(limiter.acquire("b"))
+    await asyncio.sleep(0)
+    with pytest.raises(ConcurrencyLimitExceeded) as exc:
+        await limiter.acquire("c")
+    assert exc.value.status_code == 429
+    release()
+    (await waiter)()
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_rejects_with_503_and_cleans_up():
+    limiter = make_limiter(limit=1, wait_timeout=0.05)
+    release = await limiter.acquire("a")
+    with pytest.raises(ConcurrencyLimitExceeded) as exc:
+        await limiter.acquire("b")
+    assert exc.value.status_code == 503
+    assert limiter._waiting == 0 and "b" not in limiter._per_key
+    release()
+    assert limiter._active == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    limiter = make_limiter(limit=1)
+    release = await limiter.acquire("a")
+    waiter = asyncio.create_task(limiter.acquire("b"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter._waiting == 0 and "b" not in limiter._per_key
+    release()
+    assert limiter._active == 0
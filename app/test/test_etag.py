@@ -0,0 +1,38 @@
+"""ETag / If-None-Match 的解析与比较"""
+import pytest
+
+from app.core.etag import etag_matches, hash_etag, parse_etags
+
+
+def test_parse_etags():
+    assert parse_etags('"a", W/"b" ,"c"') == [(False, "a"), (True, "b"), (False, "c")]
+
+
+@pytest.mark.parametrize("header", [None, "", "*", "a", '"'])
+def test_parse_etags_ignores_missing_and_invalid(header):
+    assert parse_etags(header) == []
+
+
+@pytest.mark.parametrize("header, matched", [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", "abc"', True),
+    ("*", True),
+    ('"x"', False),
+    ("abc", False),
+    (None, False),
+])
+def test_etag_matches_uses_weak_comparison(header, matched):
+    assert etag_matches(header, '"abc"') is matched
+
+
+def test_etag_matches_weak_etag():
+    assert etag_matches('"abc"', 'W/"abc"')
+
+
+def test_hash_etag_is_stable_and_quoted():
+    etag = hash_etag(1, "a", (2, 3))
+    assert etag == hash_etag(1, "a", (2, 3))
+    assert etag != hash_etag(1, "a", (3, 2))
+    assert etag.startswith('"') and etag.endswith('"')
+    assert parse_etags(etag) == [(False, etag.strip('"'))]
@@ -0,0 +1,134 @@
+"""SQLite 磁盘缓存、两级缓存和外部接口调用缓存"""
+import pytest
+
+from app.core import external_cache
+from app.core.cache import LRUCache, SQLiteCache, TieredCache
+from app.core.config import settings
+from app.core.external_cache import ExternalCallError, acached_call, cached_call
+
+
+@pytest.fixture
+def external(monkeypatch, tmp_path):
+    """外部接口缓存使用临时目录中的SQLite文件，每个测试重新创建"""
+    monkeypatch.setattr(settings, "EXTERNAL_CACHE_PATH", str(tmp_path / "external.sqlite3"))
+    monkeypatch.setattr(external_cache, "_caches", {})
+    return tmp_path
+
+
+def test_sqlite_cache_round_trip(tmp_path):
+    disk = SQLiteCache("test", tmp_path / "cache.sqlite3")
+    disk.set(("inputtips", "西湖"), {"tips": [1, 2]})
+    assert disk.get(("inputtips", "西湖")) == {"tips": [1, 2]}
+    assert disk.get(("inputtips", "断桥"), "default") == "default"
+    disk.delete(("inputtips", "西湖"))
+    assert disk.get(("inputtips", "西湖")) is None
+
+
+def test_sqlite_cache_survives_reopen(tmp_path):
+    SQLiteCache("test", tmp_path / "cache.sqlite3").set("k", [1, "a"])
+    assert SQLiteCache("test", tmp_path / "cache.sqlite3").get("k") == [1, "a"]
+    # 不同名称的缓存共用文件但互不可见
+    assert SQLiteCache("other", tmp_path / "cache.sqlite3").get("k") is None
+
+
+def test_sqlite_cache_expiry_and_remaining_ttl(tmp_path, clock):
+    disk = SQLiteCache("test", tmp_path / "cache.sqlite3", ttl=60)
+    disk.set("k", "v")
+    clock.now += 20
+    value, remaining = disk.get_with_ttl("k")
+    assert value == "v" and remaining == pytest.approx(40)
+    clock.now += 40
+    assert disk.get_with_ttl("k") is None
+
+
+def test_sqlite_cache_prunes_to_maxsize(tmp_path, clock):
+    disk = SQLiteCache("test", tmp_path / "cache.sqlite3", maxsize=2, ttl=60)
+    disk._PRUNE_EVERY = 3
+    for i in range(3):
+        clock.now += 1
+        disk.set(i, i)
+    # 超出 maxsize 时删除最早过期的条目
+    assert disk.get(0) is None
+    assert disk.get(1) == 1 and disk.get(2) == 2
+
+
+def test_sqlite_cache_skips_unserializable_values(tmp_path):
+    disk = SQLiteCache("test", tmp_path / "cache.sqlite3")
+    disk.set("k", object())
+    assert disk.get("k") is None
+
+
+def test_tiered_cache_backfills_memory_with_remaining_ttl(tmp_path, clock):
+    disk = SQLiteCache("test:disk", tmp_path / "cache.sqlite3", ttl=60)
+    disk.set("k", "v")
+    clock.now += 50
+    tiered = TieredCache(LRUCache("test", ttl=60), disk)
+    assert tiered.get("k") == "v"
+    assert tiered.memory.get("k") == "v"
+    clock.now += 10
+    assert tiered.memory.get("k") is None
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_async_interface(tmp_path):
+    tiered = TieredCache(LRUCache("test"), SQLiteCache("test:disk", tmp_path / "cache.sqlite3"))
+    await tiered.aset("k", {"a": 1})
+    tiered.memory.clear()
+    assert await tiered.aget("k") == {"a": 1}
+    await tiered.adelete("k")
+    assert await tiered.aget("k") is None
+
+
+def test_cached_call_hits_cache(external):
+    calls = []
+
+    def fetch(name):
+        calls.append(name)
+        return {"name": name}
+
+    assert cached_call("test_source", "西湖", fetch, "西湖") == {"name": "西湖"}
+    assert cached_call("test_source", "西湖", fetch, "西湖") == {"name": "西湖"}
+    assert calls == ["西湖"]
+    # 新进程只有磁盘缓存
+    external_cache._caches.clear()
+    assert cached_call("test_source", "西湖", fetch, "西湖") == {"name": "西湖"}
+    assert calls == ["西湖"]
+
+
+def test_cached_call_does_not_cache_rejected_results(external):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"status": "0"}
+
+    for _ in range(2):
+        cached_call("test_source", "k", fetch, cacheable=lambda r: r["status"] == "1")
+    assert len(calls) == 2
+
+
+def test_cached_call_caches_errors(external):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise RuntimeError("接口超时")
+
+    with pytest.raises(RuntimeError):
+        cached_call("test_source", "k", fetch)
+    with pytest.raises(ExternalCallError, match="接口超时"):
+        cached_call("test_source", "k", fetch)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_acached_call(external):
+    calls = []
+
+    async def fetch(city):
+        calls.append(city)
+        return [city]
+
+    assert await acached_call("test_source", "杭州", fetch, "杭州") == ["杭州"]
+    assert await acached_call("test_source", "杭州", fetch, "杭州") == ["杭州"]
+    assert calls == ["杭州"]
@@ -0,0 +1,105 @@
+"""按用户公平调度的等待队列和上游额度限制"""
+import asyncio
+import types
+
+import pytest
+
+from app.core import concurrency
+from app.core.concurrency import ConcurrencyLimiter, RateLimiter
+
+
+@pytest.fixture
+def rate_clock(monkeypatch):
+    """替换 concurrency 模块的时钟，sleep 直接推进时间并记录每次等待的秒数"""
+    fake = types.SimpleNamespace(now=1000.0, sleeps=[])
+
+    def sleep(seconds):
+        fake.sleeps.append(seconds)
+        fake.now += seconds
+
+    monkeypatch.setattr(concurrency, "time", types.SimpleNamespace(
+        monotonic=lambda: fake.now, perf_counter=lambda: fake.now, sleep=sleep,
+    ))
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_released_round_robin_by_user():
+    limiter = ConcurrencyLimiter("test", limit=1, per_key_limit=10, max_waiting=10, wait_timeout=5, retry_after=1)
+    release = await limiter.acquire("busy")
+    order = []
+
+    async def chat(user, n):
+        done = await limiter.acquire(user)
+        order.append(f"{user}{n}")
+        await asyncio.sleep(0)
+        done()
+
+    # a 先连发三个请求，b、c 随后各发一个
+    tasks = [asyncio.create_task(chat("a", i)) for i in range(3)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(chat("b", 0)), asyncio.create_task(chat("c", 0))]
+    await asyncio.sleep(0)
+    release()
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+    assert order == ["a0", "b0", "c0", "a1", "a2"]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_grows_with_queue_and_hold_time():
+    limiter = ConcurrencyLimiter("test", limit=1, per_key_limit=10, max_waiting=2, wait_timeout=5, retry_after=2)
+    assert limiter._estimate_retry_after() == 2
+    limiter._avg_hold = 10.0
+    limiter._waiting = 2
+    assert limiter._estimate_retry_after() == 30
+    limiter._avg_hold = 1000.0
+    assert limiter._estimate_retry_after() == 60
+
+
+def test_unlimited_rate_limiter_never_waits(rate_clock):
+    limiter = RateLimiter("test")
+    for _ in range(100):
+        limiter.acquire(10_000)
+    assert rate_clock.sleeps == []
+
+
+def test_rpm_limit_waits_for_refill(rate_clock):
+    limiter = RateLimiter("test", rpm=2)
+    limiter.acquire()
+    limiter.acquire()
+    assert rate_clock.sleeps == []
+    limiter.acquire()
+    # 每30秒补充一次请求额度，每次最多睡0.5秒
+    assert sum(rate_clock.sleeps) == pytest.approx(30)
+
+
+def test_tpm_limit_and_charge(rate_clock):
+    limiter = RateLimiter("test", tpm=600)
+    limiter.acquire(500)
+    # 实际用量比估算少，退还额度后可以立即再请求
+    limiter.charge(-400)
+    limiter.acquire(500)
+    assert rate_clock.sleeps == []
+    # 实际用量比估算多，补扣后额度为 -300，再请求100个token要等补充400个（每秒10个）
+    limiter.charge(300)
+    limiter.acquire(100)
+    assert sum(rate_clock.sleeps) == pytest.approx(40)
+
+
+def test_request_larger_than_tpm_is_capped(rate_clock):
+    limiter = RateLimiter("test", tpm=100)
+    limiter.acquire(1000)
+    assert rate_clock.sleeps == []
+
+
+def test_check_can_abort_waiting(rate_clock):
+    limiter = RateLimiter("test", rpm=1)
+    limiter.acquire()
+
+    def check():
+        if rate_clock.sleeps:
+            raise RuntimeError("对话已取消")
+
+    with pytest.raises(RuntimeError):
+        limiter.acquire(check=check)
+    assert len(rate_clock.sleeps) == 1
@@ -0,0 +1,29 @@
+"""LLM对话快速路径的意图识别"""
+import pytest
+
+
+@pytest.mark.parametrize("query", ["现在几点", "现在几点了？", "请问现在是什么时间", "今天星期几", "What time is it now?"])
+def test_current_time(intent_service, query):
+    assert intent_service.classify(query) == "current_time"
+
+
+@pytest.mark.parametrize("query", ["列出我的计划", "帮我看看我的拍摄计划吧", "我有哪些计划？", "查看一下我的所有计划", "show my plans"])
+def test_list_plans(intent_service, query):
+    assert intent_service.classify(query) == "list_plans"
+
+
+@pytest.mark.parametrize("query", [
+    # 写操作交给LLM，规则无法可靠识别否定和确认
+    "删除西湖日落计划",
+    "不要删除西湖日落计划",
+    "把西湖计划删了",
+    # 带有其他要求
+    "列出我的计划再新建一个",
+    "现在几点，明天西湖天气怎么样",
+    "帮我创建一个明天早上去西湖拍日出的计划",
+    "",
+    "？？",
+    "列出我的计划" * 10,
+])
+def test_other_requests_fall_back_to_llm(intent_service, query):
+    assert intent_service.classify(query) is None
@@ -0,0 +1,155 @@
+"""后台对话任务的提交、领取、放回队列、清理和长轮询"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, func, inspect, select
+
+from app.core.concurrency import ConcurrencyLimitExceeded
+from app.core.config import settings
+from app.models import LLMJob
+
+
+@pytest_asyncio.fixture
+async def jobs(llm_job_service, async_sessions, async_db, monkeypatch):
+    """清空任务表（测试结束时回滚），服务内部创建的会话同样在测试事务中"""
+    monkeypatch.setattr(llm_job_service, "AsyncSessionLocal", async_sessions)
+    monkeypatch.setattr(settings, "LLM_JOB_MAX_ATTEMPTS", 3)
+    await async_db.execute(delete(LLMJob))
+    await async_db.commit()
+    return llm_job_service
+
+
+def stale_start():
+    """早于超时判定时间的开始时间，执行它的进程视为已退出"""
+    return datetime.now(timezone.utc) - timedelta(seconds=settings.LLM_JOB_TIMEOUT + 3600)
+
+
+def add_job(db, user_id, status="pending", minute=0, started_at=None, attempts=0, finished_at=None):
+    # 同一事务中 now() 不变，显式指定提交时间保证顺序
+    created_at = datetime.now(timezone.utc) - timedelta(hours=1) + timedelta(minutes=minute)
+    job = LLMJob(
+        user_id=user_id, query="现在几点", status=status, attempts=attempts,
+        created_at=created_at, started_at=started_at, finished_at=finished_at,
+    )
+    db.add(job)
+    return job
+
+
+async def reload(db, job):
+    await db.refresh(job)
+    return job
+
+
+@pytest.mark.asyncio
+async def test_claim_prefers_users_without_running_jobs(jobs, async_db):
+    busy, idle = uuid.uuid4(), uuid.uuid4()
+    add_job(async_db, busy, "running", started_at=datetime.now(timezone.utc), attempts=1)
+    busy_job = add_job(async_db, busy, minute=1)
+    idle_job = add_job(async_db, idle, minute=2)
+    await async_db.commit()
+
+    claimed = [(await jobs._claim_next(async_db)).id for _ in range(2)]
+    assert claimed == [idle_job.id, busy_job.id]
+    assert await jobs._claim_next(async_db) is None
+    job = await reload(async_db, busy_job)
+    assert (job.status, job.attempts) == ("running", 1)
+
+
+@pytest.mark.asyncio
+async def test_stale_running_job_is_reclaimed_until_attempts_run_out(jobs, async_db):
+    stale = add_job(async_db, uuid.uuid4(), "running", started_at=stale_start(), attempts=1)
+    add_job(async_db, uuid.uuid4(), "running", minute=-1, started_at=stale_start(), attempts=3)
+    await async_db.commit()
+
+    assert (await jobs._claim_next(async_db)).id == stale.id
+    assert (await reload(async_db, stale)).attempts == 2
+    assert await jobs._claim_next(async_db) is None
+
+
+@pytest.mark.asyncio
+async def test_cancelled_job_is_requeued(jobs, async_db, monkeypatch):
+    job = add_job(async_db, uuid.uuid4())
+    await async_db.commit()
+    claimed = await jobs._claim_next(async_db)
+
+    async def cancelled(job, trace):
+        raise asyncio.CancelledError()
+
+    monkeypatch.setattr(jobs, "_run", cancelled)
+    with pytest.raises(asyncio.CancelledError):
+        await jobs._execute(claimed)
+    job = await reload(async_db, job)
+    assert (job.status, job.attempts, job.started_at) == ("pending", 0, None)
+
+
+@pytest.mark.asyncio
+async def test_failed_job_stores_generic_error(jobs, async_db, monkeypatch):
+    job = add_job(async_db, uuid.uuid4())
+    await async_db.commit()
+    claimed = await jobs._claim_next(async_db)
+
+    async def failing(job, trace):
+        trace.append({"type": "llm", "model": ("m", 1)})
+        raise RuntimeError("connection refused by 10.0.0.5")
+
+    monkeypatch.setattr(jobs, "_run", failing)
+    await jobs._execute(claimed)
+    job = await reload(async_db, job)
+    assert (job.status, job.error) == ("failed", "服务错误")
+    assert job.trace == [{"type": "llm", "model": ["m", 1]}]
+    assert job.finished_at is not None
+
+
+@pytest.mark.asyncio
+async def test_cleanup_fails_exhausted_jobs_and_deletes_old_ones(jobs, async_db):
+    now = datetime.now(timezone.utc)
+    exhausted = add_job(async_db, uuid.uuid4(), "running", started_at=stale_start(), attempts=3)
+    retrying = add_job(async_db, uuid.uuid4(), "running", started_at=stale_start(), attempts=1)
+    old = add_job(async_db, uuid.uuid4(), "succeeded", finished_at=now - timedelta(days=settings.LLM_JOB_RETENTION_DAYS + 1))
+    recent = add_job(async_db, uuid.uuid4(), "failed", finished_at=now)
+    await async_db.commit()
+
+    await jobs._cleanup()
+    result = await async_db.execute(select(LLMJob).execution_options(populate_existing=True))
+    remaining = {job.id: job for job in result.scalars()}
+    assert set(remaining) == {exhausted.id, retrying.id, recent.id}
+    assert (remaining[exhausted.id].status, remaining[exhausted.id].error) == ("failed", "任务执行中断")
+    assert remaining[retrying.id].status == "running"
+    assert old.id not in remaining
+
+
+@pytest.mark.asyncio
+async def test_too_many_unfinished_jobs_per_user(jobs, async_db, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_JOB_MAX_PENDING_PER_USER", 2)
+    user_id = uuid.uuid4()
+    # 已完成的任务不计数
+    add_job(async_db, user_id, "succeeded", finished_at=datetime.now(timezone.utc))
+    for _ in range(2):
+        await jobs.create_job_async(async_db, user_id, "现在几点")
+
+    with pytest.raises(ConcurrencyLimitExceeded) as exc_info:
+        await jobs.create_job_async(async_db, user_id, "现在几点")
+    assert exc_info.value.status_code == 429
+    await jobs.create_job_async(async_db, uuid.uuid4(), "现在几点")
+
+
+@pytest.mark.asyncio
+async def test_wait_returns_detached_job(jobs, async_db):
+    user_id = uuid.uuid4()
+    job = await jobs.create_job_async(async_db, user_id, "现在几点")
+
+    waited = await jobs.wait_job_async(async_db, job.id, user_id, timeout=0.1)
+    assert waited.status == "pending"
+    assert inspect(waited).detached
+    assert await jobs.wait_job_async(async_db, job.id, uuid.uuid4(), timeout=0.1) is None
+
+    await jobs._finish(job.id, {"status": "succeeded", "response": "现在是 10:00", "finished_at": func.now()})
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    waited = await jobs.wait_job_async(async_db, job.id, user_id, timeout=5)
+    assert loop.time() - start < 1
+    assert (waited.status, waited.response) == ("succeeded", "现在是 10:00")
+    assert inspect(waited).detached
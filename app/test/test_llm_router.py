@@ -0,0 +1,230 @@
+"""多模型路由：故障转移、对冲、额度和热更新"""
+import json
+import time
+import types
+
+import pytest
+
+from app.core.config import settings
+from app.core.llm_router import LLMRouter
+
+
+class FakeInterface:
+    """代替 OpenAICompatible，按预设的延迟返回或抛出异常，并记录调用次数"""
+
+    def __init__(self, name, delay=0.0, error=None, total_tokens=None):
+        self.name = self.model_name = name
+        self.delay = delay
+        self.error = error
+        self.total_tokens = total_tokens
+        self.calls = 0
+
+    def _response(self):
+        usage = types.SimpleNamespace(total_tokens=self.total_tokens) if self.total_tokens else None
+        return types.SimpleNamespace(model=self.name, usage=usage)
+
+    def chat(self, *args, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self._response()
+
+    def chat_stream(self, *args, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        yield types.SimpleNamespace(content=f"{self.name}-1", usage=None)
+        yield self._response()
+
+
+def provider_entry(model_name, **extra):
+    return {"model_name": model_name, "api_keys": ["key"], "base_url": "http://upstream.invalid/v1", **extra}
+
+
+@pytest.fixture
+def provider_file(tmp_path):
+    path = tmp_path / "provider.json"
+    path.write_text(json.dumps({"p": [provider_entry("m1", rpm=10), provider_entry("m2", rpm=10), provider_entry("m3")]}))
+    return path
+
+
+@pytest.fixture
+def router(provider_file, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DELAY", 0.05)
+    monkeypatch.setattr(settings, "LLM_ROUTER_RELOAD_INTERVAL", 3600)
+    instance = LLMRouter(provider_file, "p/m1")
+    yield instance
+    instance.shutdown()
+
+
+def use(router, **interfaces):
+    """把各模型的接口替换为 FakeInterface"""
+    for name, interface in interfaces.items():
+        router._models[f"p/{name}"].interface = interface
+    return interfaces
+
+
+def test_default_model_is_tried_first(router):
+    fakes = use(router, m1=FakeInterface("m1"), m2=FakeInterface("m2"), m3=FakeInterface("m3"))
+    assert router.chat(messages=[]).model == "m1"
+    assert (fakes["m2"].calls, fakes["m3"].calls) == (0, 0)
+    assert router.model_name == "m1"
+
+
+def test_failover_to_next_model(router):
+    fakes = use(router, m1=FakeInterface("m1", error=RuntimeError("502")), m2=FakeInterface("m2"), m3=FakeInterface("m3"))
+    assert router.chat(messages=[]).model == "m2"
+    assert fakes["m1"].calls == 1
+    assert list(router._models["p/m1"].stats.samples) == [None]
+
+
+def test_all_models_failing_raises_last_error(router):
+    use(router, **{name: FakeInterface(name, error=RuntimeError(name)) for name in ("m1", "m2", "m3")})
+    with pytest.raises(RuntimeError):
+        router.chat(messages=[])
+
+
+def test_slow_primary_is_hedged(router):
+    fakes = use(router, m1=FakeInterface("m1", delay=0.5), m2=FakeInterface("m2"), m3=FakeInterface("m3"))
+    start = time.perf_counter()
+    assert router.chat(messages=[]).model == "m2"
+    assert time.perf_counter() - start < 0.4
+    assert fakes["m1"].calls == 1 and fakes["m2"].calls == 1
+
+
+def test_every_attempt_is_charged_to_its_model(router):
+    use(router, m1=FakeInterface("m1", delay=0.3), m2=FakeInterface("m2"), m3=FakeInterface("m3"))
+    router.chat(messages=[], tokens=100)
+    # 首选请求和对冲请求各扣一次对应模型的请求额度
+    assert router._models["p/m1"].limiter._requests == pytest.approx(9, abs=0.1)
+    assert router._models["p/m2"].limiter._requests == pytest.approx(9, abs=0.1)
+
+
+def test_usage_settles_estimated_tokens(router):
+    use(router, m1=FakeInterface("m1", total_tokens=150))
+    model = router._models["p/m1"]
+    model.limiter.tpm = model.limiter._tokens = 1000
+    router.chat(messages=[], tokens=100)
+    assert model.limiter._tokens == pytest.approx(850, abs=1)
+
+
+def test_max_concurrency_slot_is_released(provider_file, monkeypatch):
+    provider_file.write_text(json.dumps({"p": [provider_entry("m1", max_concurrency=1)]}))
+    router = LLMRouter(provider_file, "p/m1")
+    use(router, m1=FakeInterface("m1", error=RuntimeError("502")))
+    with pytest.raises(RuntimeError):
+        router.chat(messages=[])
+    slots = router._models["p/m1"].slots
+    assert slots.acquire(blocking=False)
+    slots.release()
+    router.shutdown()
+
+
+def test_unhealthy_model_is_ranked_last(router, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_ROUTER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(settings, "LLM_ROUTER_COOLDOWN", 60)
+    stats = router._models["p/m1"].stats
+    for _ in range(3):
+        stats.record(None)
+    assert not stats.healthy
+    assert [m.key for m in router._candidates()][-1] == "p/m1"
+
+
+def test_stream_fails_over_before_first_chunk(router):
+    fakes = use(router, m1=FakeInterface("m1", error=RuntimeError("502")), m2=FakeInterface("m2"))
+    chunks = list(router.chat_stream(messages=[]))
+    assert chunks[0].content == "m2-1"
+    assert fakes["m1"].calls == 1
+
+
+def test_reload_rebuilds_only_changed_entries(router, provider_file, monkeypatch):
+    m1, m2 = router._models["p/m1"], router._models["p/m2"]
+    m1.stats.record(1.0)
+    provider_file.write_text(json.dumps({"p": [
+        provider_entry("m1", rpm=20),
+        provider_entry("m2", rpm=10),
+        provider_entry("m3", enabled=False),
+    ]}))
+    monkeypatch.setattr(settings, "LLM_ROUTER_RELOAD_INTERVAL", 0)
+    router._mtime = None
+    router._candidates()
+    assert set(router._models) == {"p/m1", "p/m2"}
+    assert router._models["p/m2"] is m2
+    # 条目变化的模型按新配置重建额度，保留耗时统计
+    assert router._models["p/m1"] is not m1
+    assert router._models["p/m1"].limiter.rpm == 20
+    assert router._models["p/m1"].stats is m1.stats
+
+
+def test_invalid_file_keeps_previous_models(router, provider_file, monkeypatch):
+    models = dict(router._models)
+    provider_file.write_text("{")
+    monkeypatch.setattr(settings, "LLM_ROUTER_RELOAD_INTERVAL", 0)
+    router._mtime = None
+    router._candidates()
+    assert router._models == models
+
+
+def test_key_change_creates_new_key_pool(router, provider_file):
+    pool = router._models["p/m1"].interface.key_pool
+    provider_file.write_text(json.dumps({"p": [provider_entry("m1", api_keys=["other-key"])]}))
+    router._load()
+    new_pool = router._models["p/m1"].interface.key_pool
+    assert new_pool is not pool and new_pool.api_keys == ["other-key"]
+
+
+class Cancelled(Exception):
+    pass
+
+
+def cancel_after_first_error():
+    """模拟对话取消：第一个模型失败的同时对话被取消"""
+    state = types.SimpleNamespace(cancelled=False)
+
+    def check():
+        if state.cancelled:
+            raise Cancelled()
+
+    class Failing(FakeInterface):
+        def chat(self, *args, **kwargs):
+            state.cancelled = True
+            return super().chat(*args, **kwargs)
+
+        def chat_stream(self, *args, **kwargs):
+            state.cancelled = True
+            return super().chat_stream(*args, **kwargs)
+
+    return check, Failing("m1", error=RuntimeError("502"))
+
+
+def test_cancelled_chat_does_not_fail_over(router):
+    check, failing = cancel_after_first_error()
+    fakes = use(router, m1=failing, m2=FakeInterface("m2"), m3=FakeInterface("m3"))
+    with pytest.raises(Cancelled):
+        router.chat(messages=[], check=check)
+    assert fakes["m2"].calls == 0 and fakes["m3"].calls == 0
+
+
+def test_cancelled_stream_does_not_fail_over(router):
+    check, failing = cancel_after_first_error()
+    fakes = use(router, m1=failing, m2=FakeInterface("m2"))
+    with pytest.raises(Cancelled):
+        list(router.chat_stream(messages=[], check=check))
+    assert fakes["m2"].calls == 0
+
+
+def test_cancelled_while_waiting_for_slot(provider_file):
+    provider_file.write_text(json.dumps({"p": [provider_entry("m1", max_concurrency=1), provider_entry("m2")]}))
+    router = LLMRouter(provider_file, "p/m1")
+    fakes = use(router, m1=FakeInterface("m1"), m2=FakeInterface("m2"))
+    router._models["p/m1"].slots.acquire()
+
+    def check():
+        raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        router.chat(messages=[], check=check)
+    assert fakes["m1"].calls == 0 and fakes["m2"].calls == 0
+    router.shutdown()
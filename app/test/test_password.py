@@ -0,0 +1,68 @@
+"""密码哈希的排队上限、计数和 cost 升级判断"""
+import asyncio
+import threading
+
+import pytest
+
+from app.core import password
+from app.core.config import settings
+from app.core.password import PasswordHasherBusy
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify(password_pool):
+    hashed = await password.hash_password_async("西湖日落")
+    assert hashed.startswith("$2b$04$")
+    assert await password.verify_password_async("西湖日落", hashed)
+    assert not await password.verify_password_async("断桥残雪", hashed)
+    assert password.verify_password("西湖日落", hashed)
+    assert password._pending == 0
+
+
+@pytest.mark.asyncio
+async def test_pending_is_released_after_failure(password_pool):
+    with pytest.raises(ValueError):
+        await password.verify_password_async("西湖日落", "not-a-bcrypt-hash")
+    assert password._pending == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_pool_is_full(password_pool, monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_MAX_PENDING", 1)
+    monkeypatch.setattr(settings, "BCRYPT_RETRY_AFTER", 3)
+    release = threading.Event()
+    busy = asyncio.create_task(password._submit("hash", release.wait))
+    try:
+        while password._pending == 0:
+            await asyncio.sleep(0.01)
+        with pytest.raises(PasswordHasherBusy) as exc_info:
+            await password.hash_password_async("西湖日落")
+        assert exc_info.value.retry_after == 3
+        assert password._pending == 1
+    finally:
+        release.set()
+        await busy
+    assert password._pending == 0
+    assert await password.hash_password_async("西湖日落")
+
+
+@pytest.mark.parametrize("hashed, rounds, expected", [
+    ("$2b$12$" + "a" * 53, 12, False),
+    ("$2b$10$" + "a" * 53, 12, True),
+    ("$2b$14$" + "a" * 53, 12, True),
+    ("$2a$04$" + "a" * 53, 4, False),
+    # 无法识别的格式不升级
+    ("plain-text", 12, False),
+    ("", 12, False),
+])
+def test_needs_rehash(monkeypatch, hashed, rounds, expected):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", rounds)
+    assert password.needs_rehash(hashed) is expected
+
+
+def test_hash_uses_configured_rounds(monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    hashed = password.hash_password("西湖日落")
+    assert not password.needs_rehash(hashed)
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+    assert password.needs_rehash(hashed)
@@ -0,0 +1,121 @@
+"""批量创建、更新、删除计划：结果顺序、按字段分组更新和归属校验"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.models import Plan as PlanModel
+from app.schemas.plan_model import Camera, CameraUpdate, PlanBulkUpdateItem, PlanCreate
+
+
+def new_plan(name, hours=24):
+    return PlanCreate(
+        name=name,
+        start_time=datetime.now(timezone.utc) + timedelta(hours=hours),
+        camera=Camera(focal_length=35, position=(120.15, 30.25, 10), rotation=(0, 0, 0, 1)),
+        tileset_url="https://tiles.example.com/tileset.json",
+        user_id=uuid.uuid4(),
+    )
+
+
+async def create_plans(plan_service, db, user_id, count):
+    result = await plan_service.create_plans_bulk_async(db, [new_plan(f"计划{i}") for i in range(count)], user_id)
+    return [r.id for r in result.results]
+
+
+async def load(db, plan_id):
+    return (await db.execute(
+        select(PlanModel).where(PlanModel.id == plan_id).execution_options(populate_existing=True)
+    )).scalars().first()
+
+
+@pytest.mark.asyncio
+async def test_create_results_follow_request_order(plan_service, async_db):
+    user_id = uuid.uuid4()
+    plans = [new_plan(f"计划{i}", hours=i + 1) for i in range(20)]
+    plans[3] = new_plan("已过期", hours=-1)
+
+    result = await plan_service.create_plans_bulk_async(async_db, plans, user_id)
+    assert (result.succeeded, result.failed) == (19, 1)
+    assert [r.index for r in result.results] == list(range(20))
+    assert not result.results[3].success and result.results[3].id is None
+    for i, item in enumerate(result.results):
+        if i == 3:
+            continue
+        # RETURNING 的行与请求中的条目一一对应
+        assert item.plan.name == f"计划{i}"
+        db_plan = await load(async_db, item.id)
+        assert (db_plan.name, db_plan.user_id) == (f"计划{i}", user_id)
+
+
+@pytest.mark.asyncio
+async def test_update_groups_items_by_field_set(plan_service, async_db, monkeypatch):
+    user_id = uuid.uuid4()
+    a, b, c, d = await create_plans(plan_service, async_db, user_id, 4)
+    groups = []
+    build = plan_service._bulk_update_statement
+
+    def record(user_id, fields, entries):
+        groups.append((fields, [plan_id for _, plan_id, _ in entries]))
+        return build(user_id, fields, entries)
+
+    monkeypatch.setattr(plan_service, "_bulk_update_statement", record)
+    result = await plan_service.update_plans_bulk_async(async_db, [
+        PlanBulkUpdateItem(id=a, name="新名字A"),
+        PlanBulkUpdateItem(id=b, description="只改描述"),
+        PlanBulkUpdateItem(id=c, name="新名字C", camera=CameraUpdate(focal_length=85)),
+        PlanBulkUpdateItem(id=d, name="新名字D"),
+        PlanBulkUpdateItem(id=a, name="重复"),
+        PlanBulkUpdateItem(id=b, start_time=datetime.now(timezone.utc) - timedelta(hours=1)),
+    ], user_id)
+
+    assert sorted(groups) == sorted([
+        (("name",), [a, d]),
+        (("description",), [b]),
+        (("name", "camera"), [c]),
+    ])
+    assert [r.success for r in result.results] == [True, True, True, True, False, False]
+    assert [r.id for r in result.results] == [a, b, c, d, a, b]
+
+    plan_a, plan_b, plan_c = [await load(async_db, plan_id) for plan_id in (a, b, c)]
+    assert (plan_a.name, plan_a.description) == ("新名字A", None)
+    assert (plan_b.name, plan_b.description) == ("计划1", "只改描述")
+    # 相机参数只覆盖提交的子字段
+    assert plan_c.camera["focal_length"] == 85
+    assert plan_c.camera["position"] == [120.15, 30.25, 10]
+
+
+@pytest.mark.asyncio
+async def test_update_skips_other_users_plans(plan_service, async_db):
+    owner, other = uuid.uuid4(), uuid.uuid4()
+    (owned,) = await create_plans(plan_service, async_db, owner, 1)
+    (mine,) = await create_plans(plan_service, async_db, other, 1)
+
+    result = await plan_service.update_plans_bulk_async(async_db, [
+        PlanBulkUpdateItem(id=owned, name="改别人的"),
+        PlanBulkUpdateItem(id=mine, name="改自己的"),
+        PlanBulkUpdateItem(id=uuid.uuid4(), name="不存在"),
+    ], other)
+
+    assert [(r.success, r.error) for r in result.results] == [
+        (False, "计划未找到或无权访问"), (True, None), (False, "计划未找到或无权访问"),
+    ]
+    assert (await load(async_db, owned)).name == "计划0"
+    assert (await load(async_db, mine)).name == "改自己的"
+
+
+@pytest.mark.asyncio
+async def test_delete_only_removes_own_plans(plan_service, async_db):
+    owner, other = uuid.uuid4(), uuid.uuid4()
+    (owned,) = await create_plans(plan_service, async_db, owner, 1)
+    mine = await create_plans(plan_service, async_db, other, 2)
+
+    result = await plan_service.delete_plans_bulk_async(async_db, [mine[1], owned, mine[0], mine[1]], other)
+
+    assert [(r.index, r.id, r.success) for r in result.results] == [
+        (0, mine[1], True), (1, owned, False), (2, mine[0], True), (3, mine[1], False),
+    ]
+    assert result.results[3].error == "同一批次中计划ID重复"
+    assert await load(async_db, owned) is not None
+    assert [await load(async_db, plan_id) for plan_id in mine] == [None, None]
@@ -0,0 +1,24 @@
+"""地图聚合的网格大小"""
+import pytest
+
+
+def test_cell_size_follows_zoom(plan_service):
+    bbox = (120.0, 30.0, 120.1, 30.1)
+    assert plan_service.cluster_cell_size(bbox, 10) == pytest.approx(360 / 2 ** 10 / 4)
+    assert plan_service.cluster_cell_size(bbox, 11) == pytest.approx(plan_service.cluster_cell_size(bbox, 10) / 2)
+
+
+def test_large_bbox_caps_cells_per_axis(plan_service):
+    bbox = (100.0, 20.0, 110.0, 25.0)
+    cell_size = plan_service.cluster_cell_size(bbox, 15)
+    assert cell_size == pytest.approx(10 / 32)
+    assert 10 / cell_size <= 32 and 5 / cell_size <= 32
+
+
+def test_bbox_crossing_antimeridian(plan_service):
+    # 170°E 到 170°W 跨越180度经线，经度跨度为20度
+    assert plan_service.cluster_cell_size((170.0, -10.0, -170.0, 10.0), 10) == pytest.approx(20 / 32)
+
+
+def test_whole_world_at_zoom_zero(plan_service):
+    assert plan_service.cluster_cell_size((-180.0, -90.0, 180.0, 90.0), 0) == pytest.approx(90.0)
@@ -0,0 +1,26 @@
+"""计划列表分页游标的编码与解析"""
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+
+def test_cursor_round_trip(plan_service):
+    start_time = datetime(2025, 6, 8, 5, 30, tzinfo=timezone.utc)
+    plan_id = uuid.uuid4()
+    cursor = plan_service.encode_plan_cursor(start_time, plan_id)
+    assert "=" not in cursor
+    assert plan_service.decode_plan_cursor(cursor) == (start_time, plan_id)
+
+
+def test_cursor_keeps_microseconds_and_offset(plan_service):
+    start_time = datetime.fromisoformat("2025-06-08T13:30:00.123456+08:00")
+    decoded, _ = plan_service.decode_plan_cursor(plan_service.encode_plan_cursor(start_time, uuid.uuid4()))
+    assert decoded == start_time
+    assert decoded.utcoffset() == start_time.utcoffset()
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "eyJ0IjoiMjAyNSJ9", "!!!"])
+def test_invalid_cursor_raises_value_error(plan_service, cursor):
+    with pytest.raises(ValueError):
+        plan_service.decode_plan_cursor(cursor)
@@ -0,0 +1,53 @@
+"""token估算、截断和HTML正文提取"""
+from app.core.text import TRUNCATED_NOTICE, estimate_tokens, html_to_text, plain_text, truncate_to_tokens
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("西湖日落") == 4
+    assert estimate_tokens("西湖，sunset") == 3 + 2
+
+
+def test_truncate_keeps_short_text():
+    assert truncate_to_tokens("西湖\n断桥", 100) == "西湖\n断桥"
+
+
+def test_truncate_stops_at_line_boundary_within_budget():
+    text = "\n".join(f"第{i}行内容" for i in range(100))
+    result = truncate_to_tokens(text, 50)
+    assert result.endswith(TRUNCATED_NOTICE)
+    assert estimate_tokens(result) <= 50
+    kept = result[:-len(TRUNCATED_NOTICE)].split("\n")
+    assert kept == [f"第{i}行内容" for i in range(len(kept))]
+
+
+def test_truncate_cuts_a_single_long_line():
+    result = truncate_to_tokens("长" * 1000, 100)
+    assert result.startswith("长" * 50)
+    assert estimate_tokens(result) <= 100
+
+
+def test_html_to_text_extracts_title_and_body():
+    html = """
+    <html><head><title> 西湖 攻略 </title><style>p { color: red }</style></head>
+    <body>
+      <nav>首页 | 登录</nav>
+      <h1>最佳机位</h1>
+      <p>断桥&amp;残雪，<b>日出</b>前到达。</p>
+      <script>track()</script>
+      <footer>版权所有</footer>
+    </body></html>
+    """
+    assert html_to_text(html) == "标题: 西湖 攻略\n最佳机位\n断桥&残雪，日出前到达。"
+
+
+def test_html_to_text_handles_void_and_unclosed_tags():
+    assert html_to_text("<p>第一行<br>第二行<img src=x><p>第三行") == "第一行\n第二行\n第三行"
+    # 没有 </head> 时进入 body 后不再跳过
+    assert html_to_text("<head><title>t</title><body><p>正文") == "标题: t\n正文"
+
+
+def test_plain_text_collapses_whitespace_and_repeated_lines():
+    assert plain_text("  a   b \n\n a b\n\nc  ") == "a b\nc"
@@ -0,0 +1,104 @@
+"""
+同步 / 异步数据库路径并发对比基准
+
+模拟 uvicorn 单 worker 的事件循环：并发发起 N 个“请求”，每个请求执行一次与
+get_current_user 相同的按主键查询用户，并可选地叠加 pg_sleep 模拟网络/查询延迟。
+
+- sync : 在 async 协程里直接调用同步 Session（即改造前 async def 路由的行为），
+         每次数据库往返都会阻塞事件循环
+- async: 使用 AsyncSessionLocal，数据库往返期间事件循环可以调度其他请求
+
+用法:
+    python script/bench_db.py --requests 500 --concurrency 100 --sleep-ms 5
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import select, text
+
+from app.db import SessionLocal, AsyncSessionLocal, engine, async_engine
+from app.models import User
+
+
+def _query(sleep_ms: float):
+    stmt = select(User).where(User.email == "bench@example.com")
+    sleep_stmt = text("SELECT pg_sleep(:s)").bindparams(s=sleep_ms / 1000) if sleep_ms > 0 else None
+    return stmt, sleep_stmt
+
+
+async def _sync_request(sleep_ms: float) -> float:
+    stmt, sleep_stmt = _query(sleep_ms)
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        if sleep_stmt is not None:
+            db.execute(sleep_stmt)
+        db.execute(stmt).scalars().first()
+    finally:
+        db.close()
+    return time.perf_counter() - start
+
+
+async def _async_request(sleep_ms: float) -> float:
+    stmt, sleep_stmt = _query(sleep_ms)
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        if sleep_stmt is not None:
+            await db.execute(sleep_stmt)
+        (await db.execute(stmt)).scalars().first()
+    return time.perf_counter() - start
+
+
+async def _run(mode: str, total: int, concurrency: int, sleep_ms: float) -> dict:
+    request = _sync_request if mode == "sync" else _async_request
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(issued: float) -> float:
+        # 延迟从请求发出算起，包含等待事件循环/连接池的排队时间
+        async with semaphore:
+            await request(sleep_ms)
+        return time.perf_counter() - issued
+
+    # 预热连接池
+    await asyncio.gather(*(request(0) for _ in range(min(concurrency, 10))))
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(time.perf_counter()) for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latencies)
+    return {
+        "mode": mode,
+        "elapsed_s": elapsed,
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main(args):
+    results = []
+    for mode in ("sync", "async"):
+        results.append(await _run(mode, args.requests, args.concurrency, args.sleep_ms))
+
+    print(f"requests={args.requests} concurrency={args.concurrency} sleep_ms={args.sleep_ms}")
+    print(f"{'mode':<6} {'elapsed(s)':>10} {'req/s':>10} {'p50(ms)':>10} {'p95(ms)':>10}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['elapsed_s']:>10.2f} {r['rps']:>10.1f} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f}")
+
+    engine.dispose()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="同步/异步数据库路径并发对比")
+    parser.add_argument("--requests", type=int, default=500, help="总请求数")
+    parser.add_argument("--concurrency", type=int, default=100, help="同时在途的请求数")
+    parser.add_argument("--sleep-ms", type=float, default=5.0, help="每个请求额外的 pg_sleep 毫秒数，模拟网络延迟")
+    asyncio.run(main(parser.parse_args()))
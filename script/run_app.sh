@@ -2,4 +2,5 @@
 
 # 启动应用
 echo "启动应用服务..."
-cd app && uvicorn main:app --host 0.0.0.0 --port 8000 --reload
\ No newline at end of file
+# 先执行数据库迁移（已是最新时为空操作），再启动服务
+cd app && alembic upgrade head && uvicorn main:app --host 0.0.0.0 --port 8000 --reload
\ No newline at end of file